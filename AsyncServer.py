@@ -0,0 +1,263 @@
+# AsyncServer.py
+# Server chạy trên một event loop asyncio: RTSP qua asyncio.start_server,
+# RTP qua một DatagramProtocol dùng chung, một FrameClock cho mọi session.
+# Không còn 2 thread / viewer như ServerWorker.run().
+
+import asyncio, heapq, itertools, logging, socket
+
+from ServerWorker import ServerWorker, TCP_BACKLOG
+from Rtcp import RtcpDispatcher
+from RtspParser import InterleavedFrame
+from VideoLoader import load_video
+
+log = logging.getLogger(__name__)
+
+
+class RtpProtocol(asyncio.DatagramProtocol):
+    """Shared UDP endpoint every session sends its RTP packets from."""
+
+    def __init__(self):
+        self.transport = None
+        self.sock = None        # socket gốc, cho sendmsg scatter-gather
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def error_received(self, exc):
+        log.warning("RTP send error: %s", exc)
+
+
+class RtcpProtocol(RtcpDispatcher, asyncio.DatagramProtocol):
+    """Shared UDP endpoint receiving the RTCP feedback of every session."""
+
+    def __init__(self):
+        super().__init__()
+        self.transport = None
+        self.port = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.port = transport.get_extra_info('sockname')[1]
+
+    def datagram_received(self, data, address):
+        try:
+            self.dispatch(data, address)
+        except Exception as e:
+            log.warning("Bad RTCP packet from %s: %s", address, e)
+
+
+class FrameClock:
+    """Single timer driving the send deadlines of every playing session."""
+
+    def __init__(self):
+        self.heap = []                  # (wake time, token, worker)
+        self.tokens = itertools.count()
+        self.playing = {}               # worker -> token của lần PLAY hiện tại
+        self.waiter = None
+
+    def add(self, worker):
+        loop = asyncio.get_running_loop()
+        token = next(self.tokens)
+        self.playing[worker] = token
+        heapq.heappush(self.heap, (loop.time(), token, worker))
+        if self.heap[0][1] == token:
+            self._wake()
+
+    def remove(self, worker):
+        # Entry cũ trong heap bị bỏ qua khi tới hạn (token không khớp)
+        self.playing.pop(worker, None)
+
+    def _wake(self):
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            while self.heap and self.heap[0][0] <= now:
+                _, token, worker = heapq.heappop(self.heap)
+                if self.playing.get(worker) != token:
+                    continue
+                try:
+                    wake = worker.pump(now)
+                except Exception:
+                    # Một session hỏng không được làm dừng đồng hồ của mọi session khác
+                    log.exception("Session %s: sending failed, closing it", worker.clientInfo.get('session'))
+                    del self.playing[worker]
+                    worker.writer.close()   # handleClient nhận EOF và giải phóng session
+                    continue
+                if wake is None:
+                    log.info("Session %s: end of stream", worker.clientInfo.get('session'))
+                    del self.playing[worker]
+                else:
+                    heapq.heappush(self.heap, (wake, token, worker))
+
+            self.waiter = loop.create_future()
+            timer = loop.call_at(self.heap[0][0], self._wake) if self.heap else None
+            await self.waiter
+            if timer is not None:
+                timer.cancel()
+
+
+class AsyncServerWorker(ServerWorker):
+    """ServerWorker whose RTSP/RTP I/O goes through the event loop."""
+
+    def __init__(self, clientInfo, writer, server):
+        self.writer = writer
+        self.server = server
+        self.loop = asyncio.get_running_loop()
+        self.preloaded = None           # (filename, rendition, stream hoặc lỗi) mở sẵn trong executor
+        super().__init__(clientInfo)
+
+    async def feedRtspAsync(self, data):
+        """feedRtsp(), opening the video of a SETUP / DESCRIBE in the executor before handling it."""
+        messages = self.parseRtsp(data)
+        if messages is None:
+            return False
+        for message in messages:
+            if not isinstance(message, InterleavedFrame):
+                await self.preload(message)
+            try:
+                self.handleMessage(message)
+            finally:
+                self.discardPreloaded()
+        return True
+
+    async def preload(self, message):
+        # Quét file chưa có index (.idx) mất tới vài giây: không làm trên event loop
+        line1 = message.startLine.split(' ')
+        if len(line1) < 2:
+            return
+        if line1[0] == self.DESCRIBE:
+            rendition = None
+        elif line1[0] == self.SETUP and self.state == self.INIT:
+            # Broadcast: channel mới mở đúng file này (không theo rendition); channel đã chạy
+            # thì stream mở sẵn không dùng tới và bị đóng ngay sau request
+            rendition = None if self.option('broadcast') else self.getHeader(message.lines, 'X-Rendition')
+        else:
+            return
+        filename = self.requestPath(line1[1])
+        result = await self.loop.run_in_executor(None, self.openVideo, filename, rendition)
+        self.preloaded = (filename, rendition, result)
+
+    @staticmethod
+    def openVideo(filename, rendition):
+        try:
+            return load_video(filename, rendition)
+        except Exception as e:
+            return e                    # loadVideo() ném lại trên event loop, như khi mở trực tiếp
+
+    def loadVideo(self, filename, rendition=None):
+        preloaded, self.preloaded = self.preloaded, None
+        if preloaded is None or preloaded[:2] != (filename, rendition):
+            self.preloaded = preloaded
+            return super().loadVideo(filename, rendition)
+        if isinstance(preloaded[2], Exception):
+            raise preloaded[2]
+        return preloaded[2]
+
+    def discardPreloaded(self):
+        if self.preloaded is not None and not isinstance(self.preloaded[2], Exception):
+            self.preloaded[2].close()
+        self.preloaded = None
+
+    def writeRtsp(self, chunks):
+        self.writer.writelines(chunks)
+
+    def sendPackets(self, packets, address):
+        if self.interleaved is not None and self.writer.transport.get_write_buffer_size() > TCP_BACKLOG:
+            self.dropInterleaved(len(packets))
+            return 0
+        return super().sendPackets(packets, address)
+
+    def relayInterleaved(self, channel, packet):
+        # Từ thread producer của channel: transport asyncio không thread-safe, ghi trên event loop
+        self.loop.call_soon_threadsafe(self.relayOnLoop, packet)
+        return len(packet)
+
+    def relayOnLoop(self, packet):
+        if self.interleaved is not None and not self.writer.is_closing():
+            self.sendPackets([packet], None)
+
+    def sendPacket(self, packet, address):
+        rtp = self.server.rtp
+        if isinstance(packet, tuple):
+            # Hint track: gửi thẳng bằng sendmsg nếu transport không còn packet chờ (giữ thứ tự)
+            if not rtp.transport.get_write_buffer_size():
+                try:
+                    return rtp.sock.sendmsg(packet, (), 0, address)
+                except (BlockingIOError, InterruptedError):
+                    pass
+            packet = b''.join(packet)
+        rtp.transport.sendto(packet, address)
+        return len(packet)
+
+    def expire(self):
+        # Gọi từ thread dọn dẹp: đóng kết nối trong event loop, handleClient dọn session
+        self.loop.call_soon_threadsafe(self.writer.close)
+
+    def serverPorts(self):
+        if self.channel is not None:
+            return super().serverPorts()
+        return self.server.rtp.transport.get_extra_info('sockname')[1], self.server.rtcp.port
+
+    def feedback(self):
+        return self.server.rtcp
+
+    def startStreaming(self):
+        if self.channel is not None:
+            return super().startStreaming()
+        # loop.time() và pacer cùng dùng đồng hồ monotonic
+        self.resetPacing()
+        self.server.clock.add(self)
+
+    def stopStreaming(self, wait=False):
+        if self.channel is not None:
+            return super().stopStreaming()
+        self.server.clock.remove(self)
+
+
+class AsyncServer:
+    def __init__(self, port, host='', options=None, reusePort=False):
+        self.port = port
+        self.host = host
+        self.options = options
+        self.reusePort = reusePort      # nhiều worker process nghe chung cổng
+        self.rtp = RtpProtocol()
+        self.rtcp = RtcpProtocol()
+        self.clock = None
+
+    async def handleClient(self, reader, writer):
+        """One RTSP connection: feed every request to the session state machine."""
+        peer = writer.get_extra_info('peername')
+        clientInfo = {'rtspSocket': (writer.get_extra_info('socket'), peer), 'options': self.options}
+        worker = AsyncServerWorker(clientInfo, writer, self)
+        try:
+            while True:
+                data = await reader.read(4096)
+                if not data or not await worker.feedRtspAsync(data):
+                    break
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            worker.close()
+            writer.close()
+
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        self.clock = FrameClock()
+        self.rtp.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.rtp.sock.bind(('0.0.0.0', 0))
+        self.rtp.sock.setblocking(False)
+        await loop.create_datagram_endpoint(lambda: self.rtp, sock=self.rtp.sock)
+        await loop.create_datagram_endpoint(lambda: self.rtcp, local_addr=('0.0.0.0', 0))
+        server = await asyncio.start_server(self.handleClient, self.host or None, self.port,
+                                            reuse_port=self.reusePort or None)
+        log.info("Listening on port %d", self.port)
+        async with server:
+            await asyncio.gather(server.serve_forever(), self.clock.run())
+
+    def run(self):
+        asyncio.run(self.serve())
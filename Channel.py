@@ -0,0 +1,162 @@
+# Channel.py
+# Chế độ broadcast: mỗi file là một "channel". Một producer đọc + đóng gói
+# mỗi frame đúng một lần rồi gửi cùng các packet đó tới mọi session đang xem,
+# chỉ sửa sequence number / SSRC trong header cho từng subscriber.
+
+import socket, struct, threading, logging
+from time import monotonic, perf_counter
+
+from VideoLoader import load_video
+from RtpPacket import RtpPacketizer
+from Pacer import FramePacer
+from Metrics import metrics
+
+log = logging.getLogger(__name__)
+
+# seq, timestamp, SSRC (offset 2..11 của RTP header)
+HEADER_PATCH = struct.Struct('!HII')
+
+
+class Channel:
+    def __init__(self, filename, options=None, stream=None):
+        self.filename = filename
+        self.stream = stream if stream is not None else load_video(filename)
+        self.packetizer = RtpPacketizer(maxPayload=1300, pt=26)
+        frameRate = getattr(options, 'frame_rate', None) or self.stream.index.fps
+        spread = getattr(options, 'spread', None)
+        self.pacer = FramePacer(frameRate, getattr(options, 'peak_rate', None),
+                                spread=0.8 if spread is None else spread)
+
+        self.members = set()          # session đã SETUP vào channel
+        self.subscribers = ()         # session đang PLAY (tuple copy-on-write)
+        self.lock = threading.Lock()
+        self.stopEvent = threading.Event()
+        self.finished = False
+        self.closed = False
+        self.thread = None
+        self.rtpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.rtpSocket.bind(('', 0))      # cổng cố định để báo trong server_port
+
+    def subscribe(self, worker):
+        """Start sending the live packets to `worker` (PLAY)."""
+        worker.rtpAddress = worker.rtpDestination()
+        with self.lock:
+            if worker not in self.subscribers:
+                self.subscribers += (worker,)
+            if self.thread is None and not self.finished:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def unsubscribe(self, worker):
+        """Stop sending to `worker` (PAUSE/TEARDOWN); the channel keeps running."""
+        with self.lock:
+            self.subscribers = tuple(w for w in self.subscribers if w is not worker)
+
+    def stop(self):
+        self.stopEvent.set()
+        if self.thread is None or not self.thread.is_alive():
+            self.close()
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+        self.rtpSocket.close()
+        self.stream.close()
+
+    def run(self):
+        try:
+            self.produce()
+        finally:
+            if self.stopEvent.is_set():
+                self.close()
+
+    def produce(self):
+        """Producer: read and packetize each frame once, fan it out to all subscribers."""
+        self.pacer.begin()
+        while True:
+            if self.stopEvent.wait(max(0.0, self.pacer.nextDeadline() - monotonic())):
+                return
+            started = perf_counter()
+            frameData = self.stream.nextFrame()
+            metrics.frameRead.observe(perf_counter() - started)
+            if not frameData:
+                log.info("End of stream %s", self.filename)
+                self.finished = True
+                return
+
+            # Media time 90 kHz; mỗi subscriber cộng thêm tsBase riêng khi fan-out
+            timestamp = self.stream.index.rtpTime(self.stream.frameNbr() - 1)
+            started = perf_counter()
+            packets, _ = self.packetizer.packetize(frameData, 0, timestamp)
+            metrics.packetize.observe(perf_counter() - started)
+            now = monotonic()
+            metrics.lateness.observe(max(0.0, now - self.pacer.nextDeadline()))
+            sendTimes = self.pacer.schedule([len(p) for p in packets], now)
+            for when, packet in zip(sendTimes, packets):
+                delay = when - monotonic()
+                if delay > 0.001 and self.stopEvent.wait(delay):
+                    return
+                self.fanOut(packet, timestamp)
+            for worker in self.subscribers:
+                worker.framesSent += 1
+
+    def fanOut(self, packet, timestamp):
+        """Send one packet to every subscriber, patching seq/timestamp/SSRC in place."""
+        for worker in self.subscribers:
+            # Đọc một lần: session có thể vừa TEARDOWN (về INIT) trên thread RTSP của nó
+            interleaved, address = worker.interleaved, worker.rtpAddress
+            if interleaved is None and address is None:
+                continue
+            worker.seqNum = seq = (worker.seqNum + 1) & 0xFFFF
+            HEADER_PATCH.pack_into(packet, 2, seq, (worker.tsBase + timestamp) & 0xFFFFFFFF, worker.ssrc)
+            started = perf_counter()
+            try:
+                if interleaved is not None:
+                    # Bản sao riêng: header còn bị sửa cho subscriber sau, buffer được packetizer dùng lại;
+                    # session tự ghi lên kết nối TCP (thread gửi riêng / event loop của nó)
+                    sent = worker.relayInterleaved(interleaved[0], bytes(packet))
+                else:
+                    sent = self.rtpSocket.sendto(packet, address)
+            except OSError as e:
+                log.warning("Send error to %s: %s", address, e)
+                continue
+            metrics.send.observe(perf_counter() - started)
+            worker.packetsSent += 1
+            worker.bytesSent += sent
+
+
+class ChannelRegistry:
+    """Process-wide map file -> live Channel."""
+
+    def __init__(self):
+        self.channels = {}
+        self.lock = threading.Lock()
+
+    def join(self, filename, worker, options=None, openVideo=load_video):
+        """Add a session to the channel of `filename`, creating it if needed.
+
+        `openVideo(filename)` opens the video of a new channel (the async
+        server passes one that returns the stream it opened off the event loop).
+        """
+        with self.lock:
+            channel = self.channels.get(filename)
+            if channel is None or channel.finished:
+                channel = Channel(filename, options, openVideo(filename))
+                self.channels[filename] = channel
+            channel.members.add(worker)
+            return channel
+
+    def leave(self, channel, worker):
+        """Remove a session; the last one out stops the producer."""
+        channel.unsubscribe(worker)
+        with self.lock:
+            channel.members.discard(worker)
+            if not channel.members:
+                channel.stop()
+                if self.channels.get(channel.filename) is channel:
+                    del self.channels[channel.filename]
+
+
+channels = ChannelRegistry()
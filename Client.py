@@ -1,73 +1,45 @@
 from tkinter import *
 from tkinter import messagebox as tkMessageBox
 from PIL import Image, ImageTk
-import socket, threading, sys, os, time
-from collections import deque
+import os, queue, time
 
-from RtpPacket import RtpPacket
+from ClientEngine import ClientEngine
+from FrameDecoder import FrameDecoder
+from RtpReceiver import DEFAULT_RCVBUF
 
 CACHE_FILE_NAME = "cache-"
 CACHE_FILE_EXT = ".jpg"
 
 
 class Client:
-    # States
-    INIT = 0
-    READY = 1
-    PREBUFFERING = 2
-    PLAYING = 3
-
-    # RTSP commands
-    SETUP = 0
-    PLAY = 1
-    PAUSE = 2
-    TEARDOWN = 3
-
-    def __init__(self, master, serveraddr, serverport, rtpport, filename):
+    """Tk front end: buttons, video label and stats over a ClientEngine.
+
+    The engine runs RTSP/RTP on its own threads; its events are queued and
+    applied to the widgets from the Tk loop only.
+    """
+
+    def __init__(self, master, serveraddr, serverport, rtpport, filename, cacheFile=False, fecGroup=0,
+                 rendition=None, tcp=False, rcvbuf=DEFAULT_RCVBUF):
         self.master = master
         self.master.protocol("WM_DELETE_WINDOW", self.handler)
         self.createWidgets()
 
-        self.serverAddr = serveraddr
-        self.serverPort = int(serverport)
-        self.rtpPort = int(rtpport)
-        self.fileName = filename
-
-        self.state = self.INIT
-
-        self.rtspSeq = 0
-        self.sessionId = 0
-        self.requestSent = -1
-        self.teardownAcked = 0
-
-        self.rtspSocket = None
-        self.rtpSocket = None
-
-        # Reassembly state
-        self.currentFrameData = bytearray()
-        self.frameCorrupted = False
-        self.expectedSeq = None
-
-        # Client-side caching / jitter buffer
-        self.frameBuffer = deque()
-        self.bufferSize = 30         # số frame cần prebuffer
+        self.events = queue.SimpleQueue()    # sự kiện từ thread mạng -> thread Tk
+        self.engine = ClientEngine(serveraddr, serverport, rtpport, filename, fecGroup, rendition,
+                                   onEvent=lambda *event: self.events.put(event), tcp=tcp, rcvbuf=rcvbuf)
         self.playIntervalMs = 40     # 25
+        self.displaySlack = 0.005    # hiện frame sớm tối đa chừng này trước hạn (s)
+        self.restarted = False       # vừa vào PLAYING: neo đồng hồ phát ở ảnh đầu tiên hiện ra
 
-        # Stats (packet/frame)
-        self.totalPackets = 0
-        self.lostPackets = 0
-        self.framesCompleted = 0      # frames đã cache được (TỔNG đã buffered)
-        self.framesDropped = 0
-        self.bytesReceived = 0
-        self.playStartTime = None
-        self.playedFrames = 0         # frames đã phát (để hiển thị)
-
-        self.playEvent = threading.Event()
+        # Decode JPEG trong bộ nhớ trên thread pool, đi trước đồng hồ phát vài frame
+        self.decoder = FrameDecoder(depth=3, workers=2)
+        self.photo = None
+        self.cacheFile = cacheFile   # ghi cache-<session>.jpg (chỉ để debug)
 
         # Playback loop
         self.master.after(self.playIntervalMs, self.playbackLoop)
 
-        self.connectToServer()
+        self.engine.connect()
 
     # ----------------------------------------------------
     # GUI
@@ -89,21 +61,36 @@ class Client:
                                text="Teardown", command=self.exitClient)
         self.teardown.grid(row=2, column=3, padx=2, pady=2)
 
+        self.quality = Button(self.master, width=20, padx=3, pady=3,
+                              text="Quality", command=self.nextRendition)
+        self.quality.grid(row=2, column=4, padx=2, pady=2)
+
+        self.rewind = Button(self.master, width=20, padx=3, pady=3,
+                             text="<< REW", command=lambda: self.trickPlay(-1))
+        self.rewind.grid(row=2, column=5, padx=2, pady=2)
+
+        self.forward = Button(self.master, width=20, padx=3, pady=3,
+                              text="FF >>", command=lambda: self.trickPlay(1))
+        self.forward.grid(row=2, column=6, padx=2, pady=2)
+
         # Video frame
         self.master.rowconfigure(0, weight=1)
         self.master.columnconfigure(0, weight=1)
         self.master.columnconfigure(1, weight=1)
         self.master.columnconfigure(2, weight=1)
         self.master.columnconfigure(3, weight=1)
+        self.master.columnconfigure(4, weight=1)
+        self.master.columnconfigure(5, weight=1)
+        self.master.columnconfigure(6, weight=1)
 
         # Label hiển thị video
         self.label = Label(self.master)
-        self.label.grid(row=0, column=0, columnspan=4,
+        self.label.grid(row=0, column=0, columnspan=7,
                         sticky=W + E + N + S, padx=5, pady=5)
 
         # Status text
         self.status = Label(self.master, text="INIT", anchor="w")
-        self.status.grid(row=1, column=0, columnspan=4, sticky=W, padx=5)
+        self.status.grid(row=1, column=0, columnspan=7, sticky=W, padx=5)
 
         #  label hiển thị thông số
         self.infoLabel = Label(
@@ -112,141 +99,142 @@ class Client:
             anchor="w",
             font=("Consolas", 10)
         )
-        self.infoLabel.grid(row=3, column=0, columnspan=4, sticky=W, padx=5, pady=(0, 5))
+        self.infoLabel.grid(row=3, column=0, columnspan=7, sticky=W, padx=5, pady=(0, 5))
 
     # ----------------------------------------------------
     # Button handlers
     # ----------------------------------------------------
     def setupMovie(self):
-        if self.state == self.INIT:
-            self.sendRtspRequest(self.SETUP)
+        if self.engine.state == self.engine.INIT:
+            self.engine.sendRtspRequest(self.engine.SETUP)
 
     def exitClient(self):
-        if self.state != self.INIT:
-            self.sendRtspRequest(self.TEARDOWN)
-        self.playEvent.set()
+        if self.engine.state != self.engine.INIT:
+            self.engine.sendRtspRequest(self.engine.TEARDOWN)
+        decode = self.decoder.stats()
+        print(f"[Decoder] {decode['decoded']} frames, {decode['avgMs']:.1f} ms avg / {decode['maxMs']:.1f} ms max"
+              f" per frame, {self.engine.lateSkipped} late frames skipped")
+        self.decoder.shutdown()
         self.master.destroy()
         try:
-            os.remove(CACHE_FILE_NAME + str(self.sessionId) + CACHE_FILE_EXT)
+            os.remove(CACHE_FILE_NAME + str(self.engine.sessionId) + CACHE_FILE_EXT)
         except:
             pass
 
     def pauseMovie(self):
-        if self.state == self.PLAYING:
-            self.sendRtspRequest(self.PAUSE)
+        if self.engine.state == self.engine.PLAYING:
+            self.engine.sendRtspRequest(self.engine.PAUSE)
 
     def playMovie(self):
-        # Bấm Play khi đã SETUP xong (READY) -> bắt đầu PREBUFFERING
-        if self.state == self.READY:
-            self.playStartTime = None
-            self.playEvent.clear()
-            self.sendRtspRequest(self.PLAY)
-
-    # ----------------------------------------------------
-    # RTP receive + reassembly → CACHE ONLY
-    # ----------------------------------------------------
-    def listenRtp(self):
-        """Receive fragmented RTP → reassemble → push into CACHE."""
-        while True:
-            try:
-                packet = self.rtpSocket.recv(65536)
-            except socket.timeout:
-                if self.teardownAcked:
-                    break
-                continue
-            except Exception:
-                break
-
-            self.bytesReceived += len(packet)
-            rtp = RtpPacket()
-            try:
-                rtp.decode(packet)
-            except Exception as e:
-                print(f"[RTP] decode error: {e}")
-                continue
-
-            seq = rtp.seqNum()
-            payload = rtp.getPayload()
-            marker = rtp.marker()
-            self.totalPackets += 1
+        # Bấm Play khi đã SETUP xong (READY) -> bắt đầu PREBUFFERING; đang tua -> tốc độ thường
+        if self.engine.state == self.engine.READY or self.engine.requestedScale != 1:
+            self.engine.setScale(1.0)
+        elif self.engine.state == self.engine.INIT:
+            # Chưa SETUP: gửi SETUP + PLAY liền nhau, phát sau một lượt đi về
+            self.engine.setupAndPlay()
+
+    def trickPlay(self, direction):
+        # Mỗi lần bấm cùng chiều tăng gấp đôi tốc độ: 2x, 4x, 8x rồi quay lại 2x
+        scale = self.engine.requestedScale
+        if scale * direction >= 2 and abs(scale) < 8:
+            scale *= 2
+        else:
+            scale = 2.0 * direction
+        self.engine.setScale(scale)
 
-            # detect packet loss
-            if self.expectedSeq is None:
-                self.expectedSeq = (seq + 1) % 65536
-            else:
-                if seq != self.expectedSeq:
-                    gap = (seq - self.expectedSeq) % 65536
-                    if gap < 30000:
-                        self.lostPackets += gap
-                        self.frameCorrupted = True
-                    self.expectedSeq = (seq + 1) % 65536
-                else:
-                    self.expectedSeq = (self.expectedSeq + 1) % 65536
-
-            if not self.frameCorrupted:
-                self.currentFrameData.extend(payload)
-
-            if marker == 1:
-                # end-of-frame
-                if not self.frameCorrupted and self.currentFrameData:
-                    frameBytes = bytes(self.currentFrameData)
-                    # Bỏ frame cũ nhất nếu buffer quá đầy để giữ latency thấp
-                    if len(self.frameBuffer) >= self.bufferSize:
-                        old = self.frameBuffer.popleft()
-
-                    self.frameBuffer.append(frameBytes)
-                    self.framesCompleted += 1
-                    print(f"[CACHE] frame {self.framesCompleted} cached "
-                          f"(buffer={len(self.frameBuffer)} frames)")
-                else:
-                    self.framesDropped += 1
-                    print("[CACHE] Drop corrupted frame")
-
-                # Reset for next frame
-                self.currentFrameData = bytearray()
-                self.frameCorrupted = False
-
-                # PREBUFFERING 
-                if self.state == self.PREBUFFERING and len(self.frameBuffer) >= self.bufferSize:
-                    print("[CACHE] Prebuffer OK → START PLAYING FROM BUFFER")
-                    self.state = self.PLAYING
-                    self.status.config(
-                        text=f"PLAYING")
-                    if self.playStartTime is None:
-                        self.playStartTime = time.time()
-
-                # update progress
-                self.updateProgressBar()
+    def nextRendition(self):
+        # Chuyển vòng qua các bậc encode server có; server đổi ở ranh giới frame
+        self.engine.nextRendition()
 
     # ----------------------------------------------------
     # Playback from buffer
     # ----------------------------------------------------
     def playbackLoop(self):
-        if self.state == self.PLAYING and self.frameBuffer:
-            frameBytes = self.frameBuffer.popleft()
-            self.playedFrames += 1
-
-            imageFile = self.writeFrame(frameBytes)
-            self.updateMovie(imageFile)
-            self.status.config(
-                text=f"PLAYING"
-            )
-            # update “progress” 
-            self.updateProgressBar()
-
-        self.master.after(self.playIntervalMs, self.playbackLoop)
+        self.handleEvents()
+        now = time.monotonic()
+
+        # Nạp frame cho bộ decode để luôn có sẵn ảnh đi trước đồng hồ phát;
+        # frame đã quá hạn thì engine bỏ luôn, không tốn công decode
+        room = self.decoder.depth - len(self.decoder)
+        box = self.displaySize()
+        for timestamp, frameBytes in self.engine.playout(pending=len(self.decoder), room=room, now=now):
+            if self.cacheFile:
+                self.writeFrame(frameBytes)
+            self.decoder.submit(timestamp, frameBytes, box)
+
+        if self.engine.state == self.engine.PLAYING:
+            decoded = self.dueFrame(now)
+            if decoded is not None:
+                self.updateMovie(decoded[1])
+        self.updateProgressBar()
+
+        self.master.after(self.nextTickMs(), self.playbackLoop)
+
+    def dueFrame(self, now):
+        """Newest decoded frame whose deadline has come; older due frames count as late."""
+        clock, shown = self.engine.clock, None
+        if self.restarted and self.decoder.ready():
+            # Decode đầu tiên (nguội) có thể lâu hơn một chu kỳ frame: tính hạn từ lúc ảnh đầu hiện
+            clock.anchor(self.decoder.nextTimestamp(), now)
+            self.restarted = False
+        while self.decoder.ready() and clock.due(self.decoder.nextTimestamp(), now) <= now + self.displaySlack:
+            decoded = self.decoder.pop()
+            if decoded is None:
+                continue
+            if shown is not None:
+                self.engine.lateSkipped += 1
+            shown = decoded
+        return shown
+
+    def nextTickMs(self):
+        """Wake up at the next frame's deadline rather than on a fixed period."""
+        timestamp = self.decoder.nextTimestamp()
+        deadline = self.engine.clock.deadline(timestamp) if timestamp is not None else None
+        if deadline is None or self.engine.state != self.engine.PLAYING:
+            return self.playIntervalMs
+        wait = round((deadline - time.monotonic()) * 1000)
+        return min(self.playIntervalMs, max(5, wait))
+
+    def displaySize(self):
+        """Inside size of the video label (width, height), or None before it is laid out."""
+        label = self.label
+        # Trừ viền và padding: ảnh đúng cỡ này không làm label đòi thêm chỗ (không co dần)
+        insetX = 2 * (int(label.cget('borderwidth')) + int(label.cget('highlightthickness')) + int(label.cget('padx')))
+        insetY = 2 * (int(label.cget('borderwidth')) + int(label.cget('highlightthickness')) + int(label.cget('pady')))
+        width, height = label.winfo_width() - insetX, label.winfo_height() - insetY
+        if width < 16 or height < 16:
+            return None
+        return width, height
+
+    def handleEvents(self):
+        """Apply the engine's events to the widgets (Tk thread only)."""
+        while True:
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                return
+            if event[0] == 'state':
+                self.status.config(text=event[2])
+                if event[1] == self.engine.PLAYING:
+                    self.restarted = True
+            elif event[0] == 'warning':
+                tkMessageBox.showwarning(event[1], event[2])
 
     def writeFrame(self, data):
-        cachename = CACHE_FILE_NAME + str(self.sessionId) + CACHE_FILE_EXT
+        cachename = CACHE_FILE_NAME + str(self.engine.sessionId) + CACHE_FILE_EXT
         with open(cachename, "wb") as file:
             file.write(data)
         return cachename
 
-    def updateMovie(self, imageFile):
+    def updateMovie(self, image):
+        """Show an already decoded frame; only the Tk pixel upload runs here."""
         try:
-            photo = ImageTk.PhotoImage(Image.open(imageFile))
-            self.label.configure(image=photo, height=288)
-            self.label.image = photo
+            if self.photo is not None and (self.photo.width(), self.photo.height()) == image.size:
+                self.photo.paste(image)
+            else:
+                self.photo = ImageTk.PhotoImage(image)
+                self.label.configure(image=self.photo, height=288)
+                self.label.image = self.photo
         except Exception as e:
             print(f"Error updating movie: {e}")
 
@@ -257,190 +245,24 @@ class Client:
         """Hiển thị số liệu."""
         if not hasattr(self, "infoLabel") or self.infoLabel is None:
             return
-        played = self.playedFrames
-        inbuf = len(self.frameBuffer)
+        engine = self.engine
+        played = engine.playedFrames - len(self.decoder)
+        inbuf = len(engine.frameBuffer) + len(self.decoder)
         totalLive = played + inbuf
-        totalbuf = self.framesCompleted
+        totalbuf = engine.framesCompleted
+        target = engine.frameBuffer.targetFrames()
+        targetKb = engine.frameBuffer.targetBytes() // 1024
+        jitter = engine.frameBuffer.jitterMs()
         self.infoLabel.config(
             text=f"Played: {played}  |  In-buffer: {inbuf}  |  Total Live: {totalLive}  |  Total buffered: {totalbuf}"
+                 f"  |  Target: {target} frames / {targetKb} KB  |  Jitter: {jitter:.1f} ms"
+                 f"  |  Late: {engine.lateSkipped}  |  Decode: {self.decoder.decodeMs():.1f} ms"
         )
 
-    # ----------------------------------------------------
-    # RTSP
-    # ----------------------------------------------------
-    def connectToServer(self):
-        self.rtspSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        try:
-            self.rtspSocket.connect((self.serverAddr, self.serverPort))
-            print(f"Connected to server {self.serverAddr}:{self.serverPort}")
-        except Exception:
-            tkMessageBox.showwarning(
-                'Connection Failed',
-                'Connection to \'%s\' failed.' % self.serverAddr)
-
-    def sendRtspRequest(self, requestCode):
-        if requestCode == self.SETUP and self.state == self.INIT:
-            threading.Thread(target=self.recvRtspReply, daemon=True).start()
-            self.rtspSeq += 1
-            request = (f"SETUP {self.fileName} RTSP/1.0\n"
-                       f"CSeq: {self.rtspSeq}\n"
-                       f"Transport: RTP/UDP; client_port= {self.rtpPort}\n\n")
-            self.requestSent = self.SETUP
-
-        elif requestCode == self.PLAY and self.state == self.READY:
-            self.rtspSeq += 1
-            request = (f"PLAY {self.fileName} RTSP/1.0\n"
-                       f"CSeq: {self.rtspSeq}\n"
-                       f"Session: {self.sessionId}\n\n")
-            self.requestSent = self.PLAY
-
-        elif requestCode == self.PAUSE and self.state == self.PLAYING:
-            self.rtspSeq += 1
-            request = (f"PAUSE {self.fileName} RTSP/1.0\n"
-                       f"CSeq: {self.rtspSeq}\n"
-                       f"Session: {self.sessionId}\n\n")
-            self.requestSent = self.PAUSE
-
-        elif requestCode == self.TEARDOWN and not self.state == self.INIT:
-            self.rtspSeq += 1
-            request = (f"TEARDOWN {self.fileName} RTSP/1.0\n"
-                       f"CSeq: {self.rtspSeq}\n"
-                       f"Session: {self.sessionId}\n\n")
-            self.requestSent = self.TEARDOWN
-        else:
-            return
-
-        self.rtspSocket.send(request.encode())
-        print('\nData sent:\n' + request)
-
-    def recvRtspReply(self):
-        while True:
-            try:
-                reply = self.rtspSocket.recv(1024)
-            except Exception:
-                break
-
-            if reply:
-                self.parseRtspReply(reply.decode("utf-8"))
-            if self.requestSent == self.TEARDOWN:
-                try:
-                    self.rtspSocket.shutdown(socket.SHUT_RDWR)
-                except:
-                    pass
-                self.rtspSocket.close()
-                break
-
-    def parseRtspReply(self, data):
-        print(f"Received reply: {data}")
-        lines = data.split('\n')
-        if len(lines) < 2:
-            return
-
-        status_line = lines[0].split(' ')
-        if len(status_line) < 2:
-            return
-        status_code = int(status_line[1])
-
-        # CSeq
-        seq_num = None
-        for line in lines:
-            if line.startswith('CSeq:'):
-                parts = line.split(' ')
-                if len(parts) > 1:
-                    try:
-                        seq_num = int(parts[1])
-                    except:
-                        seq_num = None
-                break
-
-        if seq_num is None or seq_num != self.rtspSeq:
-            return
-
-        # Session
-        session_id = None
-        for line in lines:
-            if line.startswith('Session:'):
-                parts = line.split(' ')
-                if len(parts) > 1:
-                    try:
-                        session_id = int(parts[1])
-                    except:
-                        session_id = None
-                break
-
-
-
-        if status_code == 200:
-            if self.requestSent == self.SETUP:
-                self.sessionId = session_id
-                self.state = self.READY
-                self.status.config(text="READY (click PLAY to start prebuffering)")
-                print("Setup OK - Opening RTP port")
-                self.openRtpPort()
-
-            elif self.requestSent == self.PLAY:
-                # Bắt đầu prebuffer (nhận RTP vào buffer, chưa play)
-                self.state = self.PREBUFFERING
-                self.status.config(text="PREBUFFERING...")
-                print("Play OK - start prebuffering")
-                threading.Thread(target=self.listenRtp, daemon=True).start()
-
-            elif self.requestSent == self.PAUSE:
-                self.state = self.READY
-                self.playEvent.set()
-                self.status.config(text="READY (paused)")
-                print("Pause OK")
-
-            elif self.requestSent == self.TEARDOWN:
-                self.state = self.INIT
-                self.teardownAcked = 1
-                self.playEvent.set()
-                self.status.config(text="TEARDOWN")
-                print("Teardown OK")
-                self.printStats()
-
-    def openRtpPort(self):
-        self.rtpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.rtpSocket.settimeout(0.5)
-        try:
-            self.rtpSocket.bind(('', self.rtpPort))
-            print(f"RTP port {self.rtpPort} opened successfully")
-        except Exception:
-            tkMessageBox.showwarning(
-                'Unable to Bind',
-                'Unable to bind PORT=%d' % self.rtpPort)
-
     def handler(self):
+        wasPlaying = self.engine.state == self.engine.PLAYING
         self.pauseMovie()
         if tkMessageBox.askokcancel("Quit?", "Are you sure you want to quit?"):
             self.exitClient()
-        else:
+        elif wasPlaying:
             self.playMovie()
-
-    # ----------------------------------------------------
-    # Stats: frame loss + network usage
-    # ----------------------------------------------------
-    def printStats(self):
-        # Nếu chưa stream gì thì khỏi in
-        if self.totalPackets == 0 and self.framesCompleted == 0 and self.framesDropped == 0:
-            return
-
-        print("\n========== CLIENT STATS ==========")
-        print(f"Total RTP packets received : {self.totalPackets}")
-        print(f"Estimated packets lost     : {self.lostPackets}")
-        if self.totalPackets + self.lostPackets > 0:
-            plr = self.lostPackets / (self.totalPackets + self.lostPackets) * 100
-            print(f"Packet loss rate           : {plr:.2f}%")
-
-        print(f"Frames completed           : {self.framesCompleted}")
-        print(f"Frames dropped             : {self.framesDropped}")
-        if self.framesCompleted + self.framesDropped > 0:
-            flr = self.framesDropped / (self.framesCompleted + self.framesDropped) * 100
-            print(f"Frame loss rate            : {flr:.2f}%")
-
-        if self.playStartTime is not None:
-            duration = max(0.001, time.time() - self.playStartTime)
-            bitrate = self.bytesReceived * 8 / duration / 1000  # kbps
-            print(f"Playback time              : {duration:.2f} s")
-            print(f"Approx. received bitrate   : {bitrate:.2f} kbps")
-        print("==================================\n")
@@ -0,0 +1,700 @@
+# ClientEngine.py
+# Lõi client không phụ thuộc giao diện: máy trạng thái RTSP, nhận RTP, ghép frame,
+# jitter buffer, RTCP feedback và thống kê. Mọi thao tác I/O nằm trong vài method
+# (connect, sendRtsp, openRtpPort, startReceiving, sendRtcp) để bản asyncio (LoadGen.py)
+# chỉ cần override chúng. Giao diện nhận sự kiện qua callback `onEvent` và lấy frame
+# đến hạn phát bằng playout().
+
+import socket, threading, time, random
+
+from RtpPacket import parseHeader, HEADER_SIZE
+from RtpReceiver import RtpReceiver, DEFAULT_RCVBUF
+from JitterBuffer import JitterBuffer, PlayoutClock
+from FrameAssembler import FrameAssembler
+from Fec import FEC_PT, FecPacket
+from Rtcp import buildNack, buildReceiverReport
+from RtspParser import RtspParser, InterleavedFrame, interleavedHeader
+
+
+class ClientEngine:
+    # States
+    INIT = 0
+    READY = 1
+    PREBUFFERING = 2
+    PLAYING = 3
+
+    # RTSP commands
+    SETUP = 0
+    PLAY = 1
+    PAUSE = 2
+    TEARDOWN = 3
+    SET_PARAMETER = 4
+    GET_PARAMETER = 5
+
+    # Cửa sổ reorder: số gói được đến sau marker của frame / thời gian chờ tối đa (s)
+    reorderWindow = 64
+    reorderDelay = 0.5
+    # Khi server nhận NACK, chờ lâu hơn để gói gửi lại kịp tới
+    nackReorderWindow = 512
+    reportInterval = 1.0        # chu kỳ RTCP receiver report (s)
+    lateLimit = 2.0             # frame trễ hạn quá chừng này chu kỳ frame thì bỏ (nếu có frame mới hơn)
+    keepaliveInterval = 20.0    # GET_PARAMETER rỗng khi không có request nào khác (s)
+    verbose = True              # in request/reply RTSP (tắt khi giả lập nhiều viewer)
+
+    def __init__(self, serveraddr, serverport, rtpport, filename, fecGroup=0, rendition=None, onEvent=None,
+                 tcp=False, rcvbuf=DEFAULT_RCVBUF):
+        self.serverAddr = serveraddr
+        self.serverPort = int(serverport)
+        self.rtpPort = int(rtpport)
+        self.rtcpPort = self.rtpPort + 1    # RTCP (NACK, RR) đi từ cổng RTP + 1
+        self.fileName = filename
+        # onEvent(name, *args) được gọi từ thread mạng:
+        # ('state', state, text), ('warning', title, message)
+        self.onEvent = onEvent
+
+        self.state = self.INIT
+
+        self.rtspSeq = 0
+        self.sessionId = 0
+        self.requestSent = -1
+        self.pending = {}            # CSeq -> request chờ reply (các request có thể gửi liền nhau)
+        self.lastRequest = 0.0
+        self.rtspLock = threading.Lock()
+        self.teardownAcked = 0
+        self.disconnected = False    # server đã đóng kết nối RTSP: SETUP sau phải kết nối lại
+
+        self.rtspSocket = None
+        self.rtpSocket = None
+        self.rtcpSocket = None
+        self.receiver = None         # RtpReceiver: recv_into theo loạt vào buffer cấp sẵn
+        self.rcvbuf = rcvbuf         # SO_RCVBUF xin cho socket RTP (byte)
+        self.serverRtcpPort = None   # cổng RTCP trong server_port của reply SETUP
+        self.nack = False            # server nhận NACK (reply có "nack")
+        self.tcp = tcp               # xin RTP interleaved trên kết nối RTSP ngay từ SETUP
+        self.interleaved = None      # (kênh RTP, kênh RTCP) khi media đi qua kết nối RTSP
+        self.serverSsrc = None
+        self.ssrc = random.randint(0, 0xFFFFFFFF)
+        self.lastFeedback = 0.0
+        self.nextReport = 0.0
+        self.expectedPrior = 0
+        self.receivedPrior = 0
+
+        # Reassembly: chịu được gói đến sai thứ tự trong cửa sổ reorder
+        self.assembler = FrameAssembler(reorderWindow=self.reorderWindow, maxDelay=self.reorderDelay)
+        self.rtpThread = None
+        self.fecGroup = fecGroup     # xin FEC parity mỗi K fragment (0 = không dùng)
+        self.rendition = rendition   # bậc encode đang xem (manifest của Ingest.py)
+        self.renditions = []         # các bậc server có (X-Renditions)
+        self.requestedRendition = None
+        self.scale = 1.0             # tốc độ server đang phát (Scale trong reply PLAY)
+        self.requestedScale = 1.0
+
+        # Client-side caching / jitter buffer: độ sâu prebuffer thích nghi theo jitter
+        # đo được, từ 2 frame (LAN sạch) tới tối đa 30 frame
+        self.frameBuffer = JitterBuffer(minFrames=2, maxFrames=30)
+        self.clock = PlayoutClock()   # hạn hiển thị của frame theo RTP timestamp
+
+        # Stats (packet/frame)
+        self.totalPackets = 0
+        self.fecPackets = 0
+        self.reportsSent = 0
+        self.framesCompleted = 0      # frames đã cache được (TỔNG đã buffered)
+        self.framesDropped = 0
+        self.bytesReceived = 0
+        self.playRequested = None     # lúc gửi PLAY (đo thời gian khởi động)
+        self.playStartTime = None
+        self.startupDelay = None      # PLAY -> bắt đầu phát (s)
+        self.playedFrames = 0         # frames đã phát (để hiển thị)
+        self.rebuffers = 0            # số lần buffer cạn khi đang phát
+        self.skippedFrames = 0        # frames bỏ qua để kéo độ trễ về mục tiêu
+        self.lateSkipped = 0          # frames bỏ vì đã quá hạn hiển thị
+
+    def notify(self, name, *args):
+        if self.onEvent is not None:
+            self.onEvent(name, *args)
+
+    def setState(self, state, text):
+        self.state = state
+        self.notify('state', state, text)
+
+    # ----------------------------------------------------
+    # RTSP
+    # ----------------------------------------------------
+    def connect(self):
+        self.rtspSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            self.rtspSocket.connect((self.serverAddr, self.serverPort))
+            print(f"Connected to server {self.serverAddr}:{self.serverPort}")
+            return True
+        except Exception:
+            self.notify('warning', 'Connection Failed', 'Connection to \'%s\' failed.' % self.serverAddr)
+            return False
+
+    def buildRequest(self, requestCode):
+        """RTSP request for `requestCode`, or None if it is not allowed in this state."""
+        if requestCode == self.SETUP and self.state == self.INIT:
+            self.rtspSeq += 1
+            if self.tcp:
+                transport = "RTP/AVP/TCP;interleaved=0-1"
+            else:
+                transport = f"RTP/UDP; client_port= {self.rtpPort}-{self.rtcpPort}; nack"
+                if self.fecGroup:
+                    transport += f"; fec={self.fecGroup}"
+                # Cho phép server chuyển sang TCP nếu UDP không tới được
+                transport += ", RTP/AVP/TCP;interleaved=0-1"
+            request = (f"SETUP {self.fileName} RTSP/1.0\n"
+                       f"CSeq: {self.rtspSeq}\n"
+                       f"Transport: {transport}\n")
+            if self.rendition:
+                request += f"X-Rendition: {self.rendition}\n"
+            request += "\n"
+
+        elif requestCode == self.PLAY and (self.state in (self.READY, self.PREBUFFERING, self.PLAYING)
+                                            or self.pending.get(self.rtspSeq) == self.SETUP):
+            # Ngay sau SETUP chưa có reply: chưa biết Session, server gắn theo kết nối.
+            # Khi đang phát: PLAY chỉ để đổi tốc độ (Scale), không dừng lại.
+            self.rtspSeq += 1
+            request = (f"PLAY {self.fileName} RTSP/1.0\n"
+                       f"CSeq: {self.rtspSeq}\n")
+            if self.sessionId:
+                request += f"Session: {self.sessionId}\n"
+            if self.requestedScale != 1:
+                request += f"Scale: {self.requestedScale:g}\n"
+            request += "\n"
+            if self.state in (self.INIT, self.READY):
+                self.playRequested = time.monotonic()
+                self.playStartTime = None
+
+        elif requestCode == self.PAUSE and self.state == self.PLAYING:
+            self.rtspSeq += 1
+            request = (f"PAUSE {self.fileName} RTSP/1.0\n"
+                       f"CSeq: {self.rtspSeq}\n"
+                       f"Session: {self.sessionId}\n\n")
+
+        elif requestCode == self.TEARDOWN and not self.state == self.INIT:
+            self.rtspSeq += 1
+            request = (f"TEARDOWN {self.fileName} RTSP/1.0\n"
+                       f"CSeq: {self.rtspSeq}\n"
+                       f"Session: {self.sessionId}\n\n")
+
+        elif requestCode == self.SET_PARAMETER and not self.state == self.INIT:
+            self.rtspSeq += 1
+            request = (f"SET_PARAMETER {self.fileName} RTSP/1.0\n"
+                       f"CSeq: {self.rtspSeq}\n"
+                       f"Session: {self.sessionId}\n"
+                       f"X-Rendition: {self.requestedRendition}\n\n")
+
+        elif requestCode == self.GET_PARAMETER and not self.state == self.INIT:
+            self.rtspSeq += 1
+            request = (f"GET_PARAMETER {self.fileName} RTSP/1.0\n"
+                       f"CSeq: {self.rtspSeq}\n"
+                       f"Session: {self.sessionId}\n\n")
+        else:
+            return None
+
+        self.requestSent = requestCode
+        self.pending[self.rtspSeq] = requestCode
+        return request
+
+    def sendRtspRequest(self, *requestCodes):
+        """Send the requests in one write; replies come back in the same order."""
+        with self.rtspLock:
+            if requestCodes[0] == self.SETUP and self.state == self.INIT:
+                if self.disconnected:
+                    if not self.connect():
+                        return
+                    self.disconnected = False
+                self.startRtspReceiver()
+            requests = [request for request in map(self.buildRequest, requestCodes) if request is not None]
+            if not requests:
+                return
+            self.lastRequest = time.monotonic()
+            self.sendRtsp(''.join(requests).encode())
+        if self.verbose:
+            print('\nData sent:\n' + ''.join(requests))
+
+    def setupAndPlay(self):
+        """SETUP and PLAY pipelined: streaming starts after a single round trip."""
+        if self.state == self.INIT:
+            # RTP có thể tới ngay sau reply PLAY: mở cổng trước khi gửi
+            if not self.tcp:
+                self.openRtpPort()
+            self.sendRtspRequest(self.SETUP, self.PLAY)
+
+    def setScale(self, scale):
+        """Play at `scale` (2 = twice as fast, -4 = rewind four times as fast, 1 = normal)."""
+        if self.state in (self.READY, self.PREBUFFERING, self.PLAYING):
+            self.requestedScale = scale
+            self.sendRtspRequest(self.PLAY)
+
+    def playingText(self):
+        return "PLAYING" if self.scale == 1 else f"PLAYING ({self.scale:g}x)"
+
+    def keepalive(self, now):
+        """Empty GET_PARAMETER when no other request went out for a while."""
+        with self.rtspLock:
+            # Thread RTSP và thread RTP cùng gọi: chỉ một bên gửi
+            if (self.state == self.INIT or self.requestSent == self.TEARDOWN
+                    or now - self.lastRequest < self.keepaliveInterval):
+                return
+            self.lastRequest = now
+        self.sendRtspRequest(self.GET_PARAMETER)
+
+    def nextRendition(self):
+        """Ask for the next rendition offered by the server (it switches at a frame boundary)."""
+        if self.state != self.INIT and self.renditions:
+            current = self.rendition if self.rendition in self.renditions else self.renditions[0]
+            self.requestedRendition = self.renditions[(self.renditions.index(current) + 1) % len(self.renditions)]
+            self.sendRtspRequest(self.SET_PARAMETER)
+
+    def sendRtsp(self, data):
+        self.rtspSocket.sendall(data)
+
+    def startRtspReceiver(self):
+        # Timeout để vẫn gọi onIdle khi media đi interleaved trên chính socket này
+        self.rtspSocket.settimeout(0.5)
+        threading.Thread(target=self.recvRtspReply, daemon=True).start()
+
+    def recvRtspReply(self):
+        parser = RtspParser()
+        while True:
+            try:
+                data = self.rtspSocket.recv(65536)
+            except socket.timeout:
+                now = time.monotonic()
+                if self.interleaved is not None:
+                    self.onIdle(now)
+                # Kể cả khi READY qua UDP (chưa có thread RTP): session không bị server dọn vì im lặng
+                self.keepalive(now)
+                continue
+            except Exception:
+                break
+            if not data:
+                break
+            try:
+                replies = parser.feed(data)
+            except ValueError as e:
+                print(f"[RTSP] Bad reply: {e}")
+                break
+
+            now = time.monotonic()
+            for reply in replies:
+                if isinstance(reply, InterleavedFrame):
+                    self.onInterleaved(reply, now)
+                else:
+                    self.parseRtspReply(reply)
+            if self.requestSent == self.TEARDOWN and not self.pending:
+                try:
+                    self.rtspSocket.shutdown(socket.SHUT_RDWR)
+                except:
+                    pass
+                self.rtspSocket.close()
+                return
+        self.connectionLost()
+
+    def connectionLost(self):
+        """The server closed the RTSP connection (session expired, server stopped): back to INIT."""
+        self.rtspSocket.close()
+        self.disconnected = True
+        if self.state == self.INIT and not self.pending:
+            return
+        self.pending.clear()
+        self.sessionId = 0
+        self.serverSsrc = None
+        self.interleaved = None
+        self.assembler = FrameAssembler(reorderWindow=self.reorderWindow, maxDelay=self.reorderDelay)
+        self.frameBuffer.clear()
+        self.clock.reset()
+        self.setState(self.INIT, "DISCONNECTED (click PLAY to set up again)")
+        self.notify('warning', 'Connection Closed', "The server closed the RTSP connection.")
+
+    def parseRtspReply(self, reply):
+        """Handle one RtspMessage reply, matched to its request by CSeq."""
+        if self.verbose:
+            print(f"Received reply: {reply}")
+        lines = reply.lines
+
+        status_line = reply.startLine.split(' ')
+        if len(status_line) < 2:
+            return
+        try:
+            status_code = int(status_line[1])
+            seq_num = int(reply.header('CSeq'))
+        except (TypeError, ValueError):
+            return
+
+        request = self.pending.pop(seq_num, None)
+        if request is None:
+            return
+
+        # Session
+        session_id = None
+        session = reply.header('Session')
+        if session:
+            try:
+                session_id = int(session.split(';')[0])
+            except ValueError:
+                session_id = None
+            for param in session.split(';')[1:]:
+                name, _, value = param.strip().partition('=')
+                if name == 'timeout' and value.isdigit() and int(value) > 0:
+                    # Keepalive kịp trước khi server đóng session vì im lặng
+                    self.keepaliveInterval = min(type(self).keepaliveInterval, int(value) / 2)
+
+        if status_code == 200:
+            if request == self.SETUP:
+                self.sessionId = session_id
+                self.parseTransport(lines)
+                self.parseRenditions(lines)
+                self.setState(self.READY, "READY (click PLAY to start prebuffering)")
+                if self.interleaved is None:
+                    if self.verbose:
+                        print("Setup OK - Opening RTP port")
+                    self.openRtpPort()
+
+            elif request == self.PLAY:
+                try:
+                    self.scale = float(reply.header('Scale', 1))
+                except ValueError:
+                    self.scale = 1.0
+                if self.state in (self.PREBUFFERING, self.PLAYING):
+                    # Chỉ đổi tốc độ: RTP timestamp vẫn liền mạch, buffer giữ nguyên
+                    if self.state == self.PLAYING:
+                        self.setState(self.PLAYING, self.playingText())
+                    return
+                # Bắt đầu prebuffer (nhận RTP vào buffer, chưa play)
+                self.setState(self.PREBUFFERING, "PREBUFFERING...")
+                if self.verbose:
+                    print("Play OK - start prebuffering")
+                if self.interleaved is None:
+                    self.startReceiving()
+
+            elif request == self.PAUSE:
+                self.setState(self.READY, "READY (paused)")
+                if self.verbose:
+                    print("Pause OK")
+
+            elif request == self.SET_PARAMETER:
+                self.parseRenditions(lines)
+                if self.verbose:
+                    print(f"Rendition: {self.rendition}")
+
+            elif request == self.TEARDOWN:
+                self.teardownAcked = 1
+                self.setState(self.INIT, "TEARDOWN")
+                if self.verbose:
+                    print("Teardown OK")
+                    self.printStats()
+
+        elif status_code == 453 and request == self.SETUP:
+            self.notify('warning', 'Server Busy', "The server is full (453 Not Enough Bandwidth), try again later.")
+
+        elif self.verbose:
+            print(f"Request failed: {reply.startLine}")
+
+    def parseTransport(self, lines):
+        """Read the server's RTCP port (server_port=rtp-rtcp), NACK support and interleaved
+        channels from the SETUP reply."""
+        for line in lines:
+            if line.startswith('Transport:'):
+                for part in line.split(';'):
+                    part = part.strip()
+                    if part == 'nack':
+                        self.nack = True
+                    elif part.startswith('server_port=') and '-' in part:
+                        try:
+                            self.serverRtcpPort = int(part.split('=')[1].split('-')[1])
+                        except ValueError:
+                            self.serverRtcpPort = None
+                    elif part.startswith('interleaved='):
+                        try:
+                            first, _, second = part.split('=')[1].partition('-')
+                            self.interleaved = (int(first), int(second) if second else int(first) + 1)
+                        except ValueError:
+                            self.interleaved = (0, 1)
+        if self.nack and self.serverRtcpPort is not None:
+            self.assembler.reorderWindow = max(self.reorderWindow, self.nackReorderWindow)
+
+    def parseRenditions(self, lines):
+        """Read the renditions offered by the server and the one being sent."""
+        for line in lines:
+            if line.startswith('X-Renditions:'):
+                self.renditions = [name.strip() for name in line.split(':', 1)[1].split(',') if name.strip()]
+            elif line.startswith('X-Rendition:'):
+                self.rendition = line.split(':', 1)[1].strip()
+
+    # ----------------------------------------------------
+    # RTP receive + reassembly → jitter buffer
+    # ----------------------------------------------------
+    def openRtpPort(self):
+        if self.rtpSocket is not None:
+            return      # đã mở trước khi gửi SETUP + PLAY liền nhau
+        self.rtcpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            self.rtcpSocket.bind(('', self.rtcpPort))
+        except OSError:
+            self.rtcpSocket.bind(('', 0))
+        self.rtpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.receiver = RtpReceiver(self.rtpSocket, self.rcvbuf)
+        try:
+            self.rtpSocket.bind(('', self.rtpPort))
+            print(f"RTP port {self.rtpPort} opened successfully")
+        except Exception:
+            self.notify('warning', 'Unable to Bind', 'Unable to bind PORT=%d' % self.rtpPort)
+
+    def startReceiving(self):
+        # Sau PAUSE thread nhận cũ vẫn chạy: chỉ một thread được đọc socket RTP
+        if self.rtpThread is None or not self.rtpThread.is_alive():
+            self.rtpThread = threading.Thread(target=self.listenRtp, daemon=True)
+            self.rtpThread.start()
+
+    def listenRtp(self):
+        """Receive fragmented RTP on a thread until TEARDOWN."""
+        while True:
+            try:
+                packets = self.receiver.receive(0.5)
+            except Exception:
+                break
+            if not packets:
+                # Server đã chuyển sang TCP: thread RTSP nhận media từ đây
+                if self.teardownAcked or self.interleaved is not None:
+                    break
+                self.onIdle(time.monotonic())
+                continue
+            now = time.monotonic()
+            for packet in packets:
+                self.onRtpPacket(packet, now)
+
+    def onIdle(self, now):
+        """No packet for a while: expire stalled frames and keep RTCP going."""
+        self.onFrames(self.assembler.flush(now))
+        self.sendFeedback(now)
+
+    def onInterleaved(self, frame, now):
+        """RTP received on the RTSP connection (even channel); server RTCP is ignored."""
+        if frame.channel % 2:
+            return
+        if self.interleaved is None:
+            # Server không nhận được RTCP qua UDP và đã chuyển sang TCP
+            self.interleaved = (frame.channel, frame.channel + 1)
+            self.nack = False
+            if self.verbose:
+                print("[RTP] Server switched to interleaved TCP")
+        self.onRtpPacket(frame.data, now)
+
+    def onRtpPacket(self, packet, now):
+        """Reassemble one RTP (or FEC) packet into the jitter buffer.
+
+        `packet` may be a view of a receive buffer that is reused afterwards:
+        the header is read in place and the payload copied once, into its frame.
+        """
+        self.bytesReceived += len(packet)
+        if len(packet) < HEADER_SIZE:
+            print(f"[RTP] decode error: packet too short ({len(packet)} bytes)")
+            return
+        marker, pt, seq, timestamp, ssrc = parseHeader(packet)
+        payload = memoryview(packet)[HEADER_SIZE:]
+        if pt == FEC_PT:
+            self.fecPackets += 1
+            try:
+                fec = FecPacket(payload)
+            except ValueError as e:
+                print(f"[RTP] FEC decode error: {e}")
+                return
+            self.onFrames(self.assembler.pushParity(timestamp, fec, now))
+            return
+
+        self.totalPackets += 1
+        if self.serverSsrc is None:
+            self.serverSsrc = ssrc
+        self.frameBuffer.onPacket(timestamp, now)
+        self.onFrames(self.assembler.push(seq, timestamp, marker, payload, now))
+        self.sendFeedback(now)
+
+    def sendFeedback(self, now):
+        """Send RTCP (checked every 10 ms): a receiver report about once a second,
+        and NACKs for missing packets that can still make their playout time."""
+        self.keepalive(now)
+        if self.serverSsrc is None or now - self.lastFeedback < 0.01:
+            return
+        if self.serverRtcpPort is None and self.interleaved is None:
+            return
+        self.lastFeedback = now
+        packets = []
+        if now >= self.nextReport:
+            packets.append(self.receiverReport())
+            # Khoảng cách ngẫu nhiên 0.5..1.5 lần chu kỳ (RFC 3550 mục 6.2)
+            self.nextReport = now + self.reportInterval * random.uniform(0.5, 1.5)
+        if self.nack:
+            budget = self.frameBuffer.targetFrames() * self.frameBuffer.frameInterval
+            seqs = self.assembler.nackList(now, budget)
+            if seqs:
+                packets.append(buildNack(self.ssrc, self.serverSsrc, seqs))
+        if packets:
+            data = b''.join(packets)
+            try:
+                if self.interleaved is not None:
+                    with self.rtspLock:
+                        self.sendRtsp(interleavedHeader(self.interleaved[1], len(data)) + data)
+                else:
+                    self.sendRtcp(data, (self.serverAddr, self.serverRtcpPort))
+            except OSError as e:
+                print(f"[RTCP] Send error: {e}")
+
+    def sendRtcp(self, data, address):
+        self.rtcpSocket.sendto(data, address)
+
+    def receiverReport(self):
+        """RTCP RR for the interval since the previous one (RFC 3550 A.3).
+
+        Packets repaired by retransmission still count as lost in the
+        fraction: the server adapts to the loss of the network, not to
+        what is left after repair.
+        """
+        a = self.assembler
+        expected = a.highest - a.lowest + 1
+        received = a.received - a.repaired
+        expectedInterval = expected - self.expectedPrior
+        lostInterval = expectedInterval - (received - self.receivedPrior)
+        self.expectedPrior, self.receivedPrior = expected, received
+        fraction = 0
+        if expectedInterval > 0 and lostInterval > 0:
+            fraction = min(255, (lostInterval << 8) // expectedInterval)
+        self.reportsSent += 1
+        return buildReceiverReport(self.ssrc, self.serverSsrc, fraction, a.lost(),
+                                   a.highest - 0x10000, self.frameBuffer.jitter)
+
+    def onFrames(self, frames):
+        """Queue the frames completed by the assembler into the jitter buffer."""
+        self.framesDropped = self.assembler.framesDropped
+        if not frames:
+            return
+        for timestamp, frameBytes in frames:
+            # JitterBuffer tự bỏ frame cũ nhất nếu vượt trần để giữ latency thấp
+            self.frameBuffer.push(timestamp, frameBytes)
+            self.framesCompleted += 1
+
+        # PREBUFFERING
+        if self.state == self.PREBUFFERING and self.frameBuffer.ready():
+            if self.verbose:
+                print("[CACHE] Prebuffer OK → START PLAYING FROM BUFFER")
+            if self.playStartTime is None:
+                self.playStartTime = time.time()
+                if self.startupDelay is None and self.playRequested is not None:
+                    self.startupDelay = time.monotonic() - self.playRequested
+            self.clock.reset()      # neo lại ở frame đầu tiên được phát
+            self.setState(self.PLAYING, self.playingText())
+
+    # ----------------------------------------------------
+    # Playout
+    # ----------------------------------------------------
+    def playout(self, pending=0, room=1, now=None):
+        """Frames to hand to the display on this playout tick (at most `room`).
+
+        `pending` is the number of frames the display still holds (being
+        decoded); the buffer only counts as drained when both are empty.
+        A frame already past its display deadline (RTP timestamp on the
+        playout clock) is dropped undecoded when a newer one is buffered;
+        if it is the newest, the clock moves to it instead.
+        """
+        if self.state == self.PLAYING and not self.frameBuffer and not pending:
+            # Buffer cạn: quay lại prebuffer tới độ sâu mục tiêu hiện tại
+            self.rebuffers += 1
+            self.setState(self.PREBUFFERING, "REBUFFERING...")
+
+        frames = []
+        if self.state == self.PLAYING:
+            # Buffer dày quá gấp đôi mục tiêu (sau một đợt burst): bỏ 1 frame để giảm độ trễ
+            if len(self.frameBuffer) > 2 * self.frameBuffer.targetFrames():
+                self.frameBuffer.pop()
+                self.skippedFrames += 1
+            now = time.monotonic() if now is None else now
+            lateAfter = self.lateLimit * self.frameBuffer.frameInterval
+            while len(frames) < room and self.frameBuffer:
+                timestamp, frame = self.frameBuffer.pop()
+                if now - self.clock.due(timestamp, now) > lateAfter:
+                    if self.frameBuffer:
+                        self.lateSkipped += 1
+                        continue
+                    self.clock.anchor(timestamp, now)
+                frames.append((timestamp, frame))
+            self.playedFrames += len(frames)
+        return frames
+
+    # ----------------------------------------------------
+    # Stats: frame loss + network usage
+    # ----------------------------------------------------
+    def stats(self):
+        """QoE and network counters of the session."""
+        lost = self.assembler.lost()
+        duration = time.time() - self.playStartTime if self.playStartTime is not None else 0.0
+        return {
+            'packets': self.totalPackets,
+            'lost': lost,
+            'reordered': self.assembler.reordered,
+            'late': self.assembler.late,
+            'duplicates': self.assembler.duplicates,
+            'reports': self.reportsSent,
+            'nacked': self.assembler.nacksSent,
+            'repaired': self.assembler.repaired,
+            'fecPackets': self.fecPackets,
+            'recovered': self.assembler.recovered,
+            'framesCompleted': self.framesCompleted,
+            'framesDropped': self.framesDropped,
+            'framesPlayed': self.playedFrames,
+            'rebuffers': self.rebuffers,
+            'skipped': self.skippedFrames,
+            'lateFrames': self.lateSkipped,
+            'startup': self.startupDelay,
+            'jitterMs': self.frameBuffer.jitterMs(),
+            'bytes': self.bytesReceived,
+            'duration': duration,
+            'kernelDrops': self.receiver.kernelDrops() if self.receiver is not None else None,
+        }
+
+    def printStats(self):
+        # Nếu chưa stream gì thì khỏi in
+        if self.totalPackets == 0 and self.framesCompleted == 0 and self.framesDropped == 0:
+            return
+
+        print("\n========== CLIENT STATS ==========")
+        print(f"Total RTP packets received : {self.totalPackets}")
+        lost = self.assembler.lost()
+        print(f"Estimated packets lost     : {lost}")
+        if self.totalPackets + lost > 0:
+            plr = lost / (self.totalPackets + lost) * 100
+            print(f"Packet loss rate           : {plr:.2f}%")
+        print(f"Reordered packets          : {self.assembler.reordered}")
+        print(f"Late packets (frame gone)  : {self.assembler.late}")
+        print(f"Duplicate packets          : {self.assembler.duplicates}")
+        if self.receiver is not None:
+            r = self.receiver.stats()
+            drops = r['kernelDrops']
+            print(f"Socket receive buffer      : {r['rcvbuf'] // 1024 if r['rcvbuf'] else '-'} KB, "
+                  f"{r['packets'] / max(1, r['batches']):.1f} packets / read (max {r['maxBatch']})")
+            print(f"Kernel drops (buffer full) : {drops if drops is not None else 'n/a'}")
+            if r['truncated']:
+                print(f"Oversized packets dropped  : {r['truncated']}")
+        print(f"RTCP receiver reports sent : {self.reportsSent}")
+        if self.assembler.nacksSent:
+            print(f"NACKed / repaired packets  : {self.assembler.nacksSent} / {self.assembler.repaired}")
+        if self.fecPackets:
+            print(f"FEC packets / recovered    : {self.fecPackets} / {self.assembler.recovered}")
+
+        print(f"Frames completed           : {self.framesCompleted}")
+        print(f"Frames dropped             : {self.framesDropped}")
+        if self.framesCompleted + self.framesDropped > 0:
+            flr = self.framesDropped / (self.framesCompleted + self.framesDropped) * 100
+            print(f"Frame loss rate            : {flr:.2f}%")
+
+        print(f"Interarrival jitter        : {self.frameBuffer.jitterMs():.2f} ms")
+        print(f"Playout target depth       : {self.frameBuffer.targetFrames()} frames")
+        print(f"Rebuffers / skipped frames : {self.rebuffers} / {self.skippedFrames}")
+        print(f"Late frames skipped        : {self.lateSkipped}")
+
+        if self.playStartTime is not None:
+            duration = max(0.001, time.time() - self.playStartTime)
+            bitrate = self.bytesReceived * 8 / duration / 1000  # kbps
+            print(f"Playback time              : {duration:.2f} s")
+            print(f"Approx. received bitrate   : {bitrate:.2f} kbps")
+        print("==================================\n")
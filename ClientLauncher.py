@@ -1,6 +1,7 @@
 import sys
 from tkinter import Tk
 from Client import Client
+from RtpReceiver import DEFAULT_RCVBUF
 
 if __name__ == "__main__":
 	try:
@@ -9,7 +10,24 @@ if __name__ == "__main__":
 		rtpPort = sys.argv[3]
 		fileName = sys.argv[4]	
 	except:
-		print("[Usage: ClientLauncher.py Server_name Server_port RTP_port Video_file]\n")	
+		print("[Usage: ClientLauncher.py Server_name Server_port RTP_port Video_file [--cache-file] [--fec K] [--rendition NAME] [--tcp] [--rcvbuf-kb N]]\n")	
+	
+	# --cache-file: ghi frame đang phát ra cache-<session>.jpg để debug
+	cacheFile = '--cache-file' in sys.argv[5:]
+	# --fec K: xin server gửi một packet parity cho mỗi K fragment (2..16)
+	fecGroup = 0
+	if '--fec' in sys.argv[5:-1]:
+		fecGroup = int(sys.argv[sys.argv.index('--fec') + 1])
+	# --rendition NAME: xem một bậc encode có sẵn (manifest của Ingest.py), vd 480p
+	rendition = None
+	if '--rendition' in sys.argv[5:-1]:
+		rendition = sys.argv[sys.argv.index('--rendition') + 1]
+	# --tcp: nhận RTP interleaved trên kết nối RTSP (mạng chặn UDP)
+	tcp = '--tcp' in sys.argv[5:]
+	# --rcvbuf-kb N: buffer nhận của socket RTP (mặc định 4096 KB), chịu burst của frame HD
+	rcvbuf = DEFAULT_RCVBUF
+	if '--rcvbuf-kb' in sys.argv[5:-1]:
+		rcvbuf = int(sys.argv[sys.argv.index('--rcvbuf-kb') + 1]) * 1024
 	
 	root = Tk()
 	root.title("RTPClient")
@@ -17,6 +35,6 @@ if __name__ == "__main__":
 	root.geometry("1280x720")
 
 	# Create a new client
-	app = Client(root, serverAddr, serverPort, rtpPort, fileName)
+	app = Client(root, serverAddr, serverPort, rtpPort, fileName, cacheFile, fecGroup, rendition, tcp, rcvbuf)
 
 	root.mainloop()
@@ -0,0 +1,112 @@
+# Fec.py
+# FEC parity XOR kiểu RFC 5109 (ULPFEC, chỉ protection level 0):
+# mỗi nhóm K fragment liên tiếp của một frame có thêm một packet parity, gửi với
+# payload type riêng và chuỗi sequence number riêng trên cùng cổng RTP.
+# Mất đúng một fragment trong nhóm -> client dựng lại được từ parity.
+#
+# Payload của packet FEC:
+#   FEC header (10 byte): E|L|P|X|CC, M|PT recovery, SN base, TS recovery, length recovery
+#   ULP level 0 header (4 byte): protection length, mask (bit 15 = SN base)
+#   XOR của các payload (đệm 0 tới protection length)
+
+import struct
+
+from RtpPacket import RTP_HEADER, HEADER_SIZE, parseHeader
+
+FEC_PT = 127
+MAX_GROUP = 16          # mask 16 bit (L = 0)
+
+FEC_HEADER = struct.Struct('!BBHIH')
+ULP_HEADER = struct.Struct('!HH')
+FEC_HEADER_SIZE = FEC_HEADER.size + ULP_HEADER.size
+
+
+def xorPayloads(payloads, length):
+    """XOR byte strings zero-padded to `length` (little endian ints pad on the right)."""
+    acc = 0
+    for payload in payloads:
+        acc ^= int.from_bytes(payload, 'little')
+    return acc.to_bytes(length, 'little')
+
+
+class FecEncoder:
+    """Build one parity packet per group of `groupSize` packets of a frame."""
+
+    def __init__(self, groupSize, pt=FEC_PT, ssrc=0):
+        self.groupSize = max(2, min(groupSize, MAX_GROUP))
+        self.pt = pt
+        self.ssrc = ssrc
+        self.seqNum = 0         # chuỗi seq riêng của packet FEC
+        self.packetsSent = 0
+
+    def protect(self, packets):
+        """Return the media packets of one frame with a parity packet after each group."""
+        k = self.groupSize
+        groups = [packets[start:start + k] for start in range(0, len(packets), k)]
+        if len(groups) > 1 and len(groups[-1]) == 1 and k < MAX_GROUP:
+            # Fragment lẻ cuối frame (thường mang marker) gộp vào nhóm trước
+            last = groups.pop()
+            groups[-1] += last
+        out = []
+        for group in groups:
+            out.extend(group)
+            out.append(self.parity(group))
+        return out
+
+    def parity(self, group):
+        bits = 0
+        tsRecovery = 0
+        lengthRecovery = 0
+        payloads = []
+        for packet in group:
+            marker, pt, seq, timestamp, _ = parseHeader(packet)
+            payload = packet[HEADER_SIZE:]
+            bits ^= (marker << 7) | pt
+            tsRecovery ^= timestamp
+            lengthRecovery ^= len(payload)
+            payloads.append(payload)
+        baseSeq = parseHeader(group[0])[2]
+        length = max(len(p) for p in payloads)
+        mask = (0xFFFF << (16 - len(group))) & 0xFFFF
+
+        self.seqNum = (self.seqNum + 1) & 0xFFFF
+        packet = bytearray(HEADER_SIZE + FEC_HEADER_SIZE)
+        # Timestamp của packet FEC = timestamp của frame được bảo vệ
+        RTP_HEADER.pack_into(packet, 0, 2 << 6, self.pt, self.seqNum, timestamp, self.ssrc)
+        FEC_HEADER.pack_into(packet, HEADER_SIZE, 0, bits, baseSeq, tsRecovery, lengthRecovery)
+        ULP_HEADER.pack_into(packet, HEADER_SIZE + FEC_HEADER.size, length, mask)
+        packet += xorPayloads(payloads, length)
+        self.packetsSent += 1
+        return packet
+
+
+class FecPacket:
+    """Parsed parity packet (payload of an RTP packet with the FEC payload type)."""
+    __slots__ = ('baseSeq', 'bits', 'tsRecovery', 'lengthRecovery', 'offsets', 'parity')
+
+    def __init__(self, payload):
+        if len(payload) < FEC_HEADER_SIZE:
+            raise ValueError(f"FEC packet too short ({len(payload)} bytes)")
+        _, self.bits, self.baseSeq, self.tsRecovery, self.lengthRecovery = FEC_HEADER.unpack_from(payload)
+        length, mask = ULP_HEADER.unpack_from(payload, FEC_HEADER.size)
+        self.offsets = [i for i in range(16) if mask & (0x8000 >> i)]
+        self.parity = bytes(payload[FEC_HEADER_SIZE:FEC_HEADER_SIZE + length])
+
+    def recover(self, present):
+        """Rebuild the one missing packet of the group.
+
+        `present` maps offset -> (marker, payload) for the packets received.
+        Return (offset, marker, payload), or None unless exactly one is missing.
+        """
+        missing = [i for i in self.offsets if i not in present]
+        if len(missing) != 1:
+            return None
+        bits, length = self.bits, self.lengthRecovery
+        payloads = [self.parity]
+        for marker, payload in present.values():
+            bits ^= marker << 7
+            length ^= len(payload)
+            payloads.append(payload)
+        if length > len(self.parity):
+            return None
+        return missing[0], bits >> 7, xorPayloads(payloads, len(self.parity))[:length]
@@ -0,0 +1,252 @@
+# FrameAssembler.py
+# Ghép fragment RTP thành frame, chịu được gói đến sai thứ tự:
+# - fragment được nhóm theo RTP timestamp (mọi fragment của một frame cùng timestamp)
+#   và chép thẳng vào vùng nhớ (arena) cấp sẵn theo cỡ frame trung bình
+# - frame hoàn tất khi đủ mọi sequence number từ đầu frame tới gói có marker
+# - frame chỉ bị bỏ khi hết cửa sổ reorder (tính theo gói) hoặc quá maxDelay giây
+# - nếu có FEC (Fec.py), fragment bị mất được dựng lại từ parity trước khi bỏ frame
+# - nackList() chọn các seq còn thiếu đáng xin gửi lại (frame còn kịp hạn phát)
+
+from collections import deque
+
+SOI = b'\xff\xd8'
+
+
+class FrameSlot:
+    """Fragments of one frame, copied into one buffer in arrival order."""
+    __slots__ = ('timestamp', 'arena', 'used', 'parts', 'markerSeq', 'minSeq', 'maxSeq',
+                 'firstArrival', 'inOrder')
+
+    def __init__(self, timestamp, arrival, sizeHint=0):
+        self.timestamp = timestamp
+        self.arena = bytearray(sizeHint)
+        self.used = 0
+        self.parts = {}             # seq -> (offset, length) trong arena
+        self.markerSeq = None
+        self.minSeq = None
+        self.maxSeq = None
+        self.firstArrival = arrival
+        self.inOrder = True         # fragment đến đúng thứ tự -> arena chính là frame
+
+    def add(self, seq, payload):
+        offset, length = self.used, len(payload)
+        if offset + length > len(self.arena):
+            self.arena.extend(bytes(max(length, len(self.arena))))
+        self.arena[offset:offset + length] = payload
+        self.used = offset + length
+        self.parts[seq] = (offset, length)
+        if self.maxSeq is None:
+            self.minSeq = self.maxSeq = seq
+        else:
+            if seq != self.maxSeq + 1:
+                self.inOrder = False
+            self.minSeq = min(self.minSeq, seq)
+            self.maxSeq = max(self.maxSeq, seq)
+
+    def complete(self, start):
+        return (self.markerSeq is not None and self.minSeq == start
+                and len(self.parts) == self.markerSeq - start + 1)
+
+    def assemble(self):
+        """Return the frame bytes (no copy when fragments arrived in order)."""
+        if self.inOrder:
+            del self.arena[self.used:]
+            return self.arena
+        frame = bytearray(self.used)
+        view, arena = memoryview(frame), memoryview(self.arena)
+        pos = 0
+        for seq in range(self.minSeq, self.maxSeq + 1):
+            offset, length = self.parts[seq]
+            view[pos:pos + length] = arena[offset:offset + length]
+            pos += length
+        return frame
+
+
+class FrameAssembler:
+    def __init__(self, reorderWindow=64, maxDelay=0.5):
+        self.reorderWindow = reorderWindow  # số gói được phép đến sau marker của frame
+        self.maxDelay = maxDelay            # giây, tính từ gói đầu tiên của frame
+        self.frames = {}                    # timestamp -> FrameSlot
+        self.parity = {}                    # timestamp -> [FecPacket] của frame đó
+        self.finished = deque(maxlen=64)    # timestamp của frame đã giao / đã bỏ
+        self.nextStart = None               # seq (mở rộng) của gói đầu frame kế tiếp
+        self.startKnown = False             # nextStart chắc chắn (đã thấy marker trước đó)
+        self.highest = None
+        self.lowest = None
+        self.avgFrameBytes = 0.0            # để cấp sẵn arena cho frame mới
+
+        # Stats
+        self.received = 0
+        self.reordered = 0
+        self.late = 0
+        self.duplicates = 0
+        self.recovered = 0                  # fragment dựng lại từ FEC
+        self.nacked = {}                    # seq -> (lần NACK gần nhất, số lần)
+        self.nacksSent = 0
+        self.repaired = 0                   # gói đến nhờ gửi lại
+        self.framesCompleted = 0
+        self.framesDropped = 0
+
+    def extend(self, seq):
+        """Unwrap a 16-bit sequence number around the highest one seen."""
+        if self.highest is None:
+            return seq + 0x10000
+        delta = (seq - self.highest) & 0xFFFF
+        if delta >= 0x8000:
+            delta -= 0x10000
+        return self.highest + delta
+
+    def push(self, seq, timestamp, marker, payload, arrival):
+        """Add one RTP packet; return the frames completed by it, in order."""
+        ext = self.extend(seq)
+        if self.highest is None:
+            self.highest = self.lowest = self.nextStart = ext
+        elif timestamp in self.finished or (self.startKnown and ext < self.nextStart):
+            # Frame của gói này đã giao hoặc đã bị bỏ (kể cả gói gốc đến sau bản dựng từ FEC,
+            # có thể cao hơn mọi seq đã nhận)
+            self.late += 1
+            self.received += 1
+            return self.drain(arrival)
+        elif ext > self.highest:
+            self.highest = ext
+        elif ext in self.nacked:
+            del self.nacked[ext]
+            self.repaired += 1
+        elif ext < self.highest:
+            self.reordered += 1
+        self.lowest = min(self.lowest, ext)
+
+        slot = self.frames.get(timestamp)
+        if slot is None:
+            slot = self.frames[timestamp] = FrameSlot(timestamp, arrival, int(self.avgFrameBytes * 1.25))
+        elif ext in slot.parts:
+            self.duplicates += 1
+            return []
+        slot.add(ext, payload)
+        if marker:
+            slot.markerSeq = ext
+        self.received += 1
+        for fec in self.parity.get(timestamp, ()):
+            base = self.extend(fec.baseSeq)
+            if base <= ext <= base + fec.offsets[-1]:
+                self.recover(slot, fec)
+        return self.drain(arrival)
+
+    def pushParity(self, timestamp, fec, arrival):
+        """Add one FEC packet (Fec.FecPacket) protecting part of frame `timestamp`."""
+        if timestamp in self.finished or not fec.offsets:
+            return []
+        self.parity.setdefault(timestamp, []).append(fec)
+        if len(self.parity) > 64:
+            del self.parity[next(iter(self.parity))]
+        slot = self.frames.get(timestamp)
+        if slot is not None:
+            self.recover(slot, fec)
+        return self.drain(arrival)
+
+    def recover(self, slot, fec):
+        """Rebuild the missing fragment of `fec`'s group in `slot`, if exactly one is missing."""
+        base = self.extend(fec.baseSeq)
+        present = {}
+        for i in fec.offsets:
+            part = slot.parts.get(base + i)
+            if part is not None:
+                offset, length = part
+                present[i] = (int(base + i == slot.markerSeq), slot.arena[offset:offset + length])
+        result = fec.recover(present)
+        if result is None:
+            return False
+        i, marker, payload = result
+        seq = base + i
+        slot.add(seq, payload)
+        if marker:
+            slot.markerSeq = seq
+        self.highest = max(self.highest, seq)
+        self.lowest = min(self.lowest, seq)
+        self.recovered += 1
+        return True
+
+    def flush(self, now):
+        """Expire overdue frames when no packet arrives (socket timeout)."""
+        return self.drain(now)
+
+    def drain(self, now):
+        out = []
+        while self.frames:
+            head = min(self.frames.values(), key=lambda s: s.minSeq)
+            if not self.startKnown and head.minSeq < self.nextStart:
+                self.nextStart = head.minSeq
+
+            if head.complete(self.nextStart):
+                frame = head.assemble()
+                self.finish(head, head.markerSeq + 1)
+                # Đầu frame không chắc chắn (mới vào / vừa mất marker): phải là SOI
+                if self.startKnown or frame[:2] == SOI:
+                    self.framesCompleted += 1
+                    self.avgFrameBytes += (len(frame) - self.avgFrameBytes) / 8
+                    out.append((head.timestamp, frame))
+                else:
+                    self.framesDropped += 1
+                self.startKnown = True
+                continue
+
+            end = head.markerSeq if head.markerSeq is not None else head.maxSeq
+            if self.highest - end <= self.reorderWindow and now - head.firstArrival <= self.maxDelay:
+                break
+
+            # Hết cửa sổ chờ: thử FEC lần cuối rồi mới bỏ frame
+            fecs = self.parity.get(head.timestamp, ())
+            if any([self.recover(head, fec) for fec in fecs]):
+                continue
+            self.framesDropped += 1
+            if head.markerSeq is not None:
+                self.finish(head, head.markerSeq + 1)
+                self.startKnown = True
+            else:
+                # Mất cả marker: không biết chắc frame sau bắt đầu từ đâu
+                self.finish(head, head.maxSeq + 1)
+                later = [s.minSeq for s in self.frames.values()]
+                if later:
+                    self.nextStart = min(later)
+                self.startKnown = False
+        return out
+
+    def finish(self, slot, nextStart):
+        del self.frames[slot.timestamp]
+        self.parity.pop(slot.timestamp, None)
+        self.finished.append(slot.timestamp)
+        self.nextStart = nextStart
+
+    def nackList(self, now, maxAge, retryInterval=0.03, maxRetries=3, threshold=2):
+        """Missing sequence numbers (16 bit) worth a NACK at `now`.
+
+        Gaps closer than `threshold` packets to the highest seq may just be
+        reordered.  A seq is skipped once its frame is older than `maxAge`
+        seconds (it would miss its playout time anyway).
+        """
+        if self.highest is None:
+            return []
+        for seq in [s for s in self.nacked if s < self.nextStart]:
+            del self.nacked[seq]
+
+        slots = sorted(self.frames.values(), key=lambda s: s.minSeq)
+        seqs = []
+        for seq in range(self.nextStart, self.highest - threshold + 1):
+            if any(seq in slot.parts for slot in slots):
+                continue
+            owner = next((slot for slot in slots if slot.maxSeq >= seq), None)
+            if owner is not None and now - owner.firstArrival > maxAge:
+                continue
+            last, count = self.nacked.get(seq, (None, 0))
+            if count >= maxRetries or (last is not None and now - last < retryInterval):
+                continue
+            self.nacked[seq] = (now, count + 1)
+            seqs.append(seq & 0xFFFF)
+        self.nacksSent += len(seqs)
+        return seqs
+
+    def lost(self):
+        """Packets never received (RFC 3550: expected - received)."""
+        if self.highest is None:
+            return 0
+        return max(0, self.highest - self.lowest + 1 - self.received)
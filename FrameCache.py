@@ -0,0 +1,123 @@
+# FrameCache.py
+# Cache frame dùng chung cho mọi session trong process:
+# key = (file, mtime, frame number), giới hạn theo tổng số byte, loại bỏ kiểu LRU.
+# Chạy nhiều worker process thì frame lấy từ kho shared memory (FrameStore) thay cho cache này.
+
+import os, threading
+from collections import OrderedDict
+
+DEFAULT_BUDGET = 256 * 1024 * 1024   # bytes
+
+
+class FrameCache:
+    def __init__(self, budget=DEFAULT_BUDGET):
+        self.budget = budget
+        self.size = 0
+        self.frames = OrderedDict()
+        self.lock = threading.Lock()
+        self.store = None       # SharedFrameStore khi chạy nhiều worker process
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(stream, frameNbr):
+        return (os.path.abspath(stream.filename), stream.reader.mtime, frameNbr)
+
+    def get(self, key):
+        with self.lock:
+            frame = self.frames.get(key)
+            if frame is None:
+                self.misses += 1
+                return None
+            self.frames.move_to_end(key)
+            self.hits += 1
+            return frame
+
+    def put(self, key, frame):
+        if len(frame) > self.budget:
+            return
+        with self.lock:
+            if key in self.frames:
+                return
+            self.frames[key] = frame
+            self.size += len(frame)
+            self._evict()
+
+    def _evict(self):
+        while self.size > self.budget and self.frames:
+            _, old = self.frames.popitem(last=False)
+            self.size -= len(old)
+            self.evictions += 1
+
+    def setBudget(self, budget):
+        with self.lock:
+            self.budget = budget
+            self._evict()
+
+    def useStore(self, store):
+        """Serve frames from a store shared between processes instead of this cache."""
+        with self.lock:
+            self.store = store
+            self.frames.clear()
+            self.size = 0
+
+    def nextFrame(self, stream):
+        """Return the stream's next frame, from memory if another session read it."""
+        if self.store is not None and stream.index is not None:
+            return self._storeFrame(stream)
+        if self.budget <= 0 or stream.index is None:
+            return stream.nextFrame()
+
+        frameNbr = stream.frameNbr()
+        if frameNbr >= len(stream.index):
+            return None
+        key = self.key(stream, frameNbr)
+        frame = self.get(key)
+        if frame is not None:
+            stream.seek(frameNbr + 1)
+            return frame
+
+        frame = stream.nextFrame()
+        if frame is not None:
+            # Copy ra bytes để cache không giữ mmap của session này
+            frame = bytes(frame)
+            self.put(key, frame)
+        return frame
+
+    def _storeFrame(self, stream):
+        frameNbr = stream.frameNbr()
+        if frameNbr >= len(stream.index):
+            return None
+        view = self.store.view(stream)
+        with self.lock:
+            if view is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if view is None:
+            return stream.nextFrame()
+        offset, length, _ = stream.index.frame(frameNbr)
+        stream.seek(frameNbr + 1)
+        return view[offset:offset + length]
+
+    def stats(self):
+        if self.store is not None:
+            with self.lock:
+                stats = {'hits': self.hits, 'misses': self.misses, 'evictions': 0}
+            stats.update(self.store.stats())
+            return stats
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'frames': len(self.frames),
+                'bytes': self.size,
+                'budget': self.budget,
+            }
+
+
+# Cache dùng chung cho toàn bộ process
+sharedCache = FrameCache()
@@ -0,0 +1,111 @@
+# FrameDecoder.py
+# Giải mã JPEG ngay trong bộ nhớ (BytesIO) trên thread pool, giữ sẵn một hàng
+# nhỏ ảnh đã decode đi trước đồng hồ phát. Thread Tk chỉ việc lấy ảnh ra hiển thị.
+# Khi khung hiển thị nhỏ hơn frame, draft() cho libjpeg decode thẳng ở 1/2, 1/4
+# hoặc 1/8 kích thước (bỏ bớt hệ số DCT) rồi mới thu nốt phần lẻ: ít việc hơn
+# nhiều so với decode đủ cỡ rồi thu nhỏ.
+
+import io, time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+# Sau draft() phần còn phải thu luôn < 2 lần: NEAREST gần như không tốn gì, còn
+# BILINEAR trên ảnh HD tốn hơn cả phần decode draft() vừa tiết kiệm được
+RESAMPLE = Image.NEAREST
+
+
+def fitSize(size, box):
+    """Largest size with the aspect ratio of `size` that fits in `box` (never enlarged)."""
+    width, height = size
+    scale = min(box[0] / width, box[1] / height, 1.0)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def decodeJpeg(data, box=None):
+    """Decode one JPEG held in memory into an RGB image, at most `box` (width, height) in size."""
+    image = Image.open(io.BytesIO(data))
+    target = fitSize(image.size, box) if box else image.size
+    if target != image.size:
+        # Chỉ đặt cấu hình decoder, chưa giải mã; kích thước chọn được luôn >= target
+        image.draft('RGB', target)
+    image.load()        # Pillow nhả GIL trong lúc giải mã
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    if image.size != target:
+        image = image.resize(target, RESAMPLE)
+    return image
+
+
+def timedDecode(data, box):
+    start = time.perf_counter()
+    image = decodeJpeg(data, box)
+    return image, time.perf_counter() - start
+
+
+class FrameDecoder:
+    def __init__(self, depth=3, workers=2):
+        self.depth = depth                  # số frame decode trước tối đa
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='decode')
+        self.pending = deque()              # (timestamp, Future) theo đúng thứ tự phát
+        self.errors = 0
+
+        # Stats (thời gian decode mỗi frame, đo trên thread decode)
+        self.decoded = 0
+        self.decodeTime = 0.0
+        self.maxDecodeTime = 0.0
+
+    def hasRoom(self):
+        return len(self.pending) < self.depth
+
+    def submit(self, timestamp, frame, box=None):
+        """Queue a frame for decoding, scaled down to fit `box` (width, height) if given."""
+        self.pending.append((timestamp, self.pool.submit(timedDecode, frame, box)))
+
+    def nextTimestamp(self):
+        """Timestamp of the next frame in display order, decoded or not; None if empty."""
+        return self.pending[0][0] if self.pending else None
+
+    def ready(self):
+        """True if the next frame is decoded (or failed) and pop() will not wait for it."""
+        return bool(self.pending) and self.pending[0][1].done()
+
+    def pop(self):
+        """Return (timestamp, image) of the next frame if it is decoded, else None.
+
+        Frames that failed to decode are skipped.
+        """
+        while self.pending and self.pending[0][1].done():
+            timestamp, future = self.pending.popleft()
+            try:
+                image, seconds = future.result()
+            except Exception as e:
+                self.errors += 1
+                print(f"[Decoder] Cannot decode frame: {e}")
+                continue
+            self.decoded += 1
+            self.decodeTime += seconds
+            self.maxDecodeTime = max(self.maxDecodeTime, seconds)
+            return timestamp, image
+        return None
+
+    def decodeMs(self):
+        """Average decode time per frame in ms."""
+        return self.decodeTime * 1000 / self.decoded if self.decoded else 0.0
+
+    def stats(self):
+        return {'decoded': self.decoded, 'errors': self.errors, 'avgMs': self.decodeMs(),
+                'maxMs': self.maxDecodeTime * 1000}
+
+    def clear(self):
+        for _, future in self.pending:
+            future.cancel()
+        self.pending.clear()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def shutdown(self):
+        self.clear()
+        self.pool.shutdown(wait=False)
@@ -0,0 +1,125 @@
+# FrameIndex.py
+# Chỉ mục frame lưu cạnh file video (<video>.idx):
+# frame number -> (byte offset, length, timestamp)
+
+import os, sys, struct, logging
+from array import array
+from bisect import bisect_right
+
+from MmapReader import MmapReader
+
+log = logging.getLogger(__name__)
+
+INDEX_EXT = '.idx'
+DEFAULT_FPS = 25
+
+
+class FrameIndex:
+    MAGIC = b'MJIX'
+    VERSION = 1
+    # magic, version, fps, source size, source mtime (ns), frame count
+    HEADER = struct.Struct('<4sHHQQI')
+
+    def __init__(self, offsets, lengths, timestamps, fps=DEFAULT_FPS):
+        self.offsets = offsets          # array('Q'): offset của byte JPEG đầu tiên
+        self.lengths = lengths          # array('I'): độ dài JPEG
+        self.timestamps = timestamps    # array('I'): thời điểm hiển thị (ms)
+        self.fps = fps
+
+    @classmethod
+    def build(cls, filename, scanner, fps=DEFAULT_FPS):
+        """Scan the whole file once and index every frame."""
+        offsets, lengths, timestamps = array('Q'), array('I'), array('I')
+        reader = MmapReader(filename)
+        try:
+            for offset, length in scanner(reader):
+                timestamps.append(len(offsets) * 1000 // fps)
+                offsets.append(offset)
+                lengths.append(length)
+        finally:
+            reader.close()
+        return cls(offsets, lengths, timestamps, fps)
+
+    @classmethod
+    def load(cls, filename, indexFile=None):
+        """Load the sidecar index; return None if it is missing or stale."""
+        indexFile = indexFile or filename + INDEX_EXT
+        try:
+            st = os.stat(filename)
+            with open(indexFile, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) < cls.HEADER.size:
+            return None
+
+        magic, version, fps, size, mtime, count = cls.HEADER.unpack_from(data)
+        if (magic != cls.MAGIC or version != cls.VERSION
+                or size != st.st_size or mtime != st.st_mtime_ns):
+            return None
+
+        offsets, lengths, timestamps = array('Q'), array('I'), array('I')
+        pos = cls.HEADER.size
+        for arr in (offsets, lengths, timestamps):
+            end = pos + count * arr.itemsize
+            if end > len(data):
+                return None
+            arr.frombytes(data[pos:end])
+            pos = end
+        if sys.byteorder == 'big':
+            for arr in (offsets, lengths, timestamps):
+                arr.byteswap()
+        return cls(offsets, lengths, timestamps, fps)
+
+    def save(self, filename, indexFile=None):
+        """Write the sidecar next to the video, stamped with its size/mtime."""
+        indexFile = indexFile or filename + INDEX_EXT
+        st = os.stat(filename)
+        header = self.HEADER.pack(self.MAGIC, self.VERSION, self.fps,
+                                  st.st_size, st.st_mtime_ns, len(self))
+        tmpFile = indexFile + '.tmp'
+        with open(tmpFile, 'wb') as f:
+            f.write(header)
+            for arr in (self.offsets, self.lengths, self.timestamps):
+                if sys.byteorder == 'big':
+                    arr = array(arr.typecode, arr)
+                    arr.byteswap()
+                f.write(arr.tobytes())
+        os.replace(tmpFile, indexFile)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def frame(self, frameNbr):
+        """Return (offset, length, timestamp_ms) of a 0-based frame."""
+        return self.offsets[frameNbr], self.lengths[frameNbr], self.timestamps[frameNbr]
+
+    def frameAt(self, seconds):
+        """Return the 0-based frame shown at `seconds` (clamped to the file)."""
+        if not self.timestamps:
+            return 0
+        i = bisect_right(self.timestamps, int(seconds * 1000)) - 1
+        return min(max(i, 0), len(self) - 1)
+
+    def rtpTime(self, frameNbr, clockRate=90000):
+        """Media time of a 0-based frame in RTP clock units (90 kHz for video)."""
+        return round(frameNbr * clockRate / self.fps)
+
+    def duration(self):
+        """Media duration in seconds."""
+        return len(self) / self.fps
+
+
+def load_index(filename, scanner, fps=DEFAULT_FPS):
+    """Load the sidecar index of `filename`, building it on first use."""
+    index = FrameIndex.load(filename)
+    if index is not None:
+        return index
+
+    index = FrameIndex.build(filename, scanner, fps)
+    log.info("Indexed %d frames of %s", len(index), filename)
+    try:
+        index.save(filename)
+    except OSError as e:
+        log.warning("Cannot write index for %s: %s", filename, e)
+    return index
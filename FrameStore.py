@@ -0,0 +1,270 @@
+# FrameStore.py
+# Kho frame dùng chung giữa các worker process (Server.py --workers N): file video đang được
+# xem được chép một lần vào multiprocessing.shared_memory, mọi worker map cùng vùng nhớ đó
+# và cắt frame ra bằng memoryview theo chỉ mục, thay vì mỗi process giữ một FrameCache riêng.
+# Một bảng chung (shared ctypes) ghi mỗi segment: kích thước, trạng thái, process đang chép
+# và các process đang map. Ngân sách byte tính chung cho cả server; thiếu chỗ thì bỏ (unlink)
+# segment không còn process nào map, cũ nhất trước. File chưa chép xong hoặc không có chỗ thì
+# worker đọc thẳng từ file qua mmap như khi không có kho.
+
+import ctypes, hashlib, logging, os, threading, time
+from multiprocessing import Value, resource_tracker
+from multiprocessing.sharedctypes import RawArray
+from multiprocessing.shared_memory import SharedMemory
+
+from MmapReader import MmapReader
+
+log = logging.getLogger(__name__)
+
+MAX_FILES = 64          # số segment trong kho cùng lúc
+MAX_MAPPERS = 64        # số process map cùng một segment
+RETRY = 0.5             # giây chờ trước khi thử lại một file chưa vào được kho
+IDLE = 30.0             # giây không session nào đọc thì process thả segment ra
+
+FREE, LOADING, READY = 0, 1, 2
+
+
+class Entry(ctypes.Structure):
+    _fields_ = [
+        ('name', ctypes.c_char * 32),
+        ('size', ctypes.c_longlong),
+        ('state', ctypes.c_int),
+        ('loader', ctypes.c_int),               # pid đang chép file vào segment
+        ('lastUsed', ctypes.c_double),          # time.time() lần cuối được thả / tạo
+        ('mappers', ctypes.c_int * MAX_MAPPERS),  # pid các process đang map (0: trống)
+    ]
+
+
+def alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class SharedFrameStore:
+    """Whole video files in shared memory, one segment per (file, mtime), shared by every worker."""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.used = Value('q', 0)       # byte đã cấp, chung cho mọi process; lock của nó khoá cả bảng
+        self.table = RawArray(Entry, MAX_FILES)
+        self.owner = os.getpid()
+        # Một resource tracker chung (worker kế thừa khi fork): worker chết không kéo theo
+        # việc unlink segment mà các worker khác còn dùng
+        resource_tracker.ensure_running()
+        self._local()
+
+    def _local(self):
+        self.segments = {}              # key -> (SharedMemory, size) process này đang map
+        self.lastUse = {}               # key -> monotonic lần cuối một session đọc
+        self.retryAt = {}
+        self.refused = set()            # file đã báo không vừa kho (chỉ log một lần)
+        self.lock = threading.Lock()
+        self.sweeper = None
+
+    def __getstate__(self):
+        return self.budget, self.used, self.table, self.owner
+
+    def __setstate__(self, state):
+        self.budget, self.used, self.table, self.owner = state
+        self._local()
+
+    def segmentName(self, key):
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+        return f"sv{self.owner}_{digest}"
+
+    def view(self, stream):
+        """memoryview over the stream's whole file in shared memory, or None (read the file)."""
+        key = (os.path.abspath(stream.filename), stream.reader.mtime)
+        now = time.monotonic()
+        with self.lock:
+            segment = self.segments.get(key)
+            if segment is not None:
+                self.lastUse[key] = now
+                shm, size = segment
+                return shm.buf[:size]
+            if now < self.retryAt.get(key, 0):
+                return None
+            self.retryAt[key] = now + RETRY
+            segment = self.attach(key, len(stream.reader))
+            if segment is None:
+                return None
+            self.segments[key] = segment
+            self.lastUse[key] = now
+            if self.sweeper is None:
+                self.sweeper = threading.Thread(target=self.sweep, name='store-sweeper', daemon=True)
+                self.sweeper.start()
+            shm, size = segment
+            return shm.buf[:size]
+
+    def attach(self, key, size):
+        """Map the file's segment if it is loaded; start loading it if there is none."""
+        name = self.segmentName(key).encode()
+        pid = os.getpid()
+        with self.used.get_lock():
+            self.reap()
+            entry = self.find(name)
+            if entry is None:
+                self.create(key, name, size)
+                return None
+            if entry.state != READY:
+                return None
+            slot = next((i for i, p in enumerate(entry.mappers) if p == 0), None)
+            if slot is None:
+                return None
+            try:
+                shm = SharedMemory(name.decode())
+            except FileNotFoundError:
+                # Segment đã mất (bị xoá ngoài server): bỏ khỏi bảng, lần sau chép lại
+                self.free(entry)
+                return None
+            entry.mappers[slot] = pid
+            return shm, entry.size
+
+    def create(self, key, name, size):
+        """Reserve room and a table entry for the file, then copy it in on a loader thread."""
+        if size == 0:
+            return
+        if not self.reserve(size):
+            if key not in self.refused:
+                self.refused.add(key)
+                log.info("%s (%d bytes) does not fit the shared frame store", key[0], size)
+            return
+        entry = self.vacant()
+        try:
+            shm = SharedMemory(name.decode(), create=True, size=size)
+        except FileExistsError:
+            # Mồ côi của một worker chết trước khi ghi vào bảng: xoá rồi tạo lại
+            stale = SharedMemory(name.decode())
+            stale.close()
+            stale.unlink()
+            shm = SharedMemory(name.decode(), create=True, size=size)
+        except OSError as e:
+            self.used.value -= size
+            log.warning("Cannot create shared memory for %s: %s", key[0], e)
+            return
+        entry.name = name
+        entry.size = size
+        entry.state = LOADING
+        entry.loader = os.getpid()
+        entry.lastUsed = time.time()
+        entry.mappers[:] = [0] * MAX_MAPPERS
+        # Chép cả file có thể mất vài trăm ms: không làm trên thread / event loop của request
+        threading.Thread(target=self.load, args=(key, name, shm, size), daemon=True).start()
+
+    def load(self, key, name, shm, size):
+        ok = False
+        try:
+            reader = MmapReader(key[0])
+            try:
+                if reader.mtime == key[1] and len(reader) == size:
+                    shm.buf[:size] = reader.slice(0, size)
+                    ok = True
+            finally:
+                reader.close()
+        except (OSError, ValueError) as e:
+            log.warning("Cannot load %s into shared memory: %s", key[0], e)
+        finally:
+            shm.close()
+        with self.used.get_lock():
+            entry = self.find(name)
+            if entry is None or entry.state != LOADING:
+                return
+            if ok:
+                entry.state = READY
+                log.info("Loaded %s into shared memory (%d bytes)", key[0], size)
+            else:
+                self.free(entry)
+
+    def find(self, name):
+        for entry in self.table:
+            if entry.state != FREE and entry.name == name:
+                return entry
+        return None
+
+    def vacant(self):
+        for entry in self.table:
+            if entry.state == FREE:
+                return entry
+        return None
+
+    def reserve(self, size):
+        """Count `size` bytes and a table entry against the budget, unlinking unmapped segments (LRU) if needed."""
+        if size > self.budget:
+            return False
+        while self.used.value + size > self.budget or self.vacant() is None:
+            idle = [entry for entry in self.table
+                    if entry.state == READY and not any(entry.mappers)]
+            if not idle:
+                return False
+            victim = min(idle, key=lambda entry: entry.lastUsed)
+            log.info("Evicting %s from the shared frame store", victim.name.decode())
+            self.free(victim)
+        self.used.value += size
+        return True
+
+    def free(self, entry):
+        try:
+            shm = SharedMemory(entry.name.decode())
+            shm.close()
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+        self.used.value -= entry.size
+        entry.state = FREE
+        entry.name = b''
+        entry.size = 0
+
+    def reap(self):
+        """Forget processes that died: their mappings, and segments they were loading."""
+        for entry in self.table:
+            if entry.state == LOADING and not alive(entry.loader):
+                log.warning("Loader of %s died, dropping the segment", entry.name.decode())
+                self.free(entry)
+                continue
+            for i, pid in enumerate(entry.mappers):
+                if pid and not alive(pid):
+                    entry.mappers[i] = 0
+
+    def sweep(self):
+        """Release segments no session of this process has read for IDLE seconds."""
+        while True:
+            time.sleep(IDLE / 2)
+            now = time.monotonic()
+            with self.lock:
+                for key in [k for k, t in self.lastUse.items() if now - t > IDLE]:
+                    shm, _ = self.segments[key]
+                    try:
+                        shm.close()
+                    except BufferError:
+                        pass            # còn frame gửi dở trỏ vào segment: mapping đóng khi GC thu frame đó
+                    del self.segments[key]
+                    del self.lastUse[key]
+                    self.unmap(key)
+
+    def unmap(self, key):
+        name, pid = self.segmentName(key).encode(), os.getpid()
+        with self.used.get_lock():
+            entry = self.find(name)
+            if entry is None:
+                return
+            for i, mapper in enumerate(entry.mappers):
+                if mapper == pid:
+                    entry.mappers[i] = 0
+            entry.lastUsed = time.time()
+
+    def stats(self):
+        with self.used.get_lock():
+            files = sum(1 for entry in self.table if entry.state == READY)
+            return {'bytes': self.used.value, 'budget': self.budget, 'files': files}
+
+    def unlinkAll(self):
+        """Remove every segment the workers created (supervisor, at shutdown)."""
+        with self.used.get_lock():
+            for entry in self.table:
+                if entry.state != FREE:
+                    self.free(entry)
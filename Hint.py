@@ -0,0 +1,239 @@
+# Hint.py
+# "Hint track" cho file MJPEG, theo tinh thần hint track của MP4: ranh giới các packet RTP
+# của từng frame (offset payload trong file, độ dài, marker) được tính một lần khi ingest và
+# lưu cạnh file video (<video>.hint). Lúc phát server chỉ ghi sequence number / timestamp /
+# SSRC vào header 12 byte rồi gửi payload thẳng từ mmap của file bằng scatter-gather,
+# không cắt và không chép frame.
+#
+#   python3 Hint.py movie.mjpeg [--max-payload 1300]      ghi movie.mjpeg.hint
+#   python3 Hint.py --verify movie.mjpeg [...]            so file hint với file nguồn
+
+import argparse, os, sys, struct, threading
+from array import array
+from collections import OrderedDict
+
+from VideoLoader import load_video
+
+HINT_EXT = '.hint'
+MAX_PAYLOAD = 1300
+MAX_TRACKS = 32         # hint track giữ trong bộ nhớ cùng lúc (LRU)
+MARKER = 0x01
+
+
+class HintTrack:
+    MAGIC = b'MJHT'
+    VERSION = 1
+    # magic, version, max payload, source size, source mtime (ns), frame count, packet count
+    HEADER = struct.Struct('<4sHHQQII')
+
+    def __init__(self, first, offsets, lengths, flags, maxPayload=MAX_PAYLOAD):
+        self.first = first              # array('I'), frames + 1: packet đầu tiên của mỗi frame
+        self.offsets = offsets          # array('Q'): offset của payload trong file nguồn
+        self.lengths = lengths          # array('H'): độ dài payload
+        self.flags = flags              # array('B'): bit 0 = marker
+        self.maxPayload = maxPayload
+
+    @classmethod
+    def build(cls, index, maxPayload=MAX_PAYLOAD):
+        """Split every indexed frame into payloads of at most `maxPayload` bytes."""
+        # Độ dài payload và max payload lưu dạng 'H' (16 bit)
+        if not 0 < maxPayload <= 0xFFFF:
+            raise ValueError(f"max payload must be 1..65535 bytes, not {maxPayload}")
+        first, offsets, lengths, flags = array('I', [0]), array('Q'), array('H'), array('B')
+        for frameNbr in range(len(index)):
+            offset, length, _ = index.frame(frameNbr)
+            count = max(1, -(-length // maxPayload))
+            for i in range(count):
+                size = min(maxPayload, length - i * maxPayload)
+                offsets.append(offset + i * maxPayload)
+                lengths.append(size)
+                flags.append(MARKER if i == count - 1 else 0)
+            first.append(len(offsets))
+        return cls(first, offsets, lengths, flags, maxPayload)
+
+    @classmethod
+    def read(cls, hintFile):
+        """(header fields, track) of a hint file, or None if it is not one."""
+        try:
+            with open(hintFile, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) < cls.HEADER.size:
+            return None
+        header = cls.HEADER.unpack_from(data)
+        magic, version, maxPayload, _, _, frames, packets = header
+        if magic != cls.MAGIC or version != cls.VERSION:
+            return None
+
+        arrays = (array('I'), array('Q'), array('H'), array('B'))
+        pos = cls.HEADER.size
+        for arr, count in zip(arrays, (frames + 1, packets, packets, packets)):
+            end = pos + count * arr.itemsize
+            if end > len(data):
+                return None
+            arr.frombytes(data[pos:end])
+            pos = end
+        if sys.byteorder == 'big':
+            for arr in arrays:
+                arr.byteswap()
+        return header, cls(*arrays, maxPayload)
+
+    @classmethod
+    def load(cls, filename, hintFile=None):
+        """Load the sidecar hint track; return None if it is missing or stale."""
+        try:
+            st = os.stat(filename)
+        except OSError:
+            return None
+        result = cls.read(hintFile or filename + HINT_EXT)
+        if result is None:
+            return None
+        (_, _, _, size, mtime, _, _), track = result
+        if size != st.st_size or mtime != st.st_mtime_ns:
+            return None
+        return track
+
+    def save(self, filename, hintFile=None):
+        """Write the sidecar next to the video, stamped with its size/mtime."""
+        hintFile = hintFile or filename + HINT_EXT
+        st = os.stat(filename)
+        header = self.HEADER.pack(self.MAGIC, self.VERSION, self.maxPayload,
+                                  st.st_size, st.st_mtime_ns, len(self), len(self.offsets))
+        tmpFile = hintFile + '.tmp'
+        with open(tmpFile, 'wb') as f:
+            f.write(header)
+            for arr in (self.first, self.offsets, self.lengths, self.flags):
+                if sys.byteorder == 'big':
+                    arr = array(arr.typecode, arr)
+                    arr.byteswap()
+                f.write(arr.tobytes())
+        os.replace(tmpFile, hintFile)
+
+    def __len__(self):
+        return len(self.first) - 1
+
+    def packets(self, frameNbr):
+        """Range of the packet numbers of a 0-based frame."""
+        return range(self.first[frameNbr], self.first[frameNbr + 1])
+
+    def verify(self, index, reader):
+        """Problems found comparing the track with the frame index and file; [] if it matches."""
+        problems = []
+        if len(self) != len(index):
+            return [f"{len(self)} frames hinted, the file has {len(index)}"]
+        for frameNbr in range(len(index)):
+            offset, length, _ = index.frame(frameNbr)
+            packets = self.packets(frameNbr)
+            if not packets:
+                problems.append(f"frame {frameNbr}: no packets")
+                continue
+            position = offset
+            for n in packets:
+                if self.offsets[n] != position:
+                    problems.append(f"frame {frameNbr}: packet {n} starts at {self.offsets[n]}, expected {position}")
+                    break
+                if not 0 < self.lengths[n] <= self.maxPayload:
+                    problems.append(f"frame {frameNbr}: packet {n} has {self.lengths[n]} bytes")
+                    break
+                if bool(self.flags[n] & MARKER) != (n == packets[-1]):
+                    problems.append(f"frame {frameNbr}: marker bit wrong on packet {n}")
+                    break
+                position += self.lengths[n]
+            else:
+                if position != offset + length:
+                    problems.append(f"frame {frameNbr}: packets cover {position - offset} of {length} bytes")
+                elif position > len(reader):
+                    problems.append(f"frame {frameNbr}: runs past the end of the file")
+                elif (bytes(reader.slice(offset, 2)) != b'\xff\xd8'
+                      or bytes(reader.slice(position - 2, 2)) != b'\xff\xd9'):
+                    problems.append(f"frame {frameNbr}: payload is not a whole JPEG (SOI..EOI)")
+            if len(problems) >= 20:
+                problems.append("...")
+                break
+        return problems
+
+
+_tracks = OrderedDict()       # (file, mtime) -> HintTrack
+_lock = threading.Lock()
+
+
+def load_hint(filename, maxPayload=MAX_PAYLOAD):
+    """Hint track of `filename` shared by every session, or None if there is no valid one."""
+    try:
+        mtime = os.stat(filename).st_mtime_ns
+    except OSError:
+        return None
+    path = os.path.abspath(filename)
+    key = (path, mtime)
+    with _lock:
+        track = _tracks.get(key)
+        if track is not None:
+            _tracks.move_to_end(key)
+        else:
+            # Không có / hỏng thì không nhớ: session sau thử lại, file .hint có thể vừa được ghi
+            track = HintTrack.load(filename)
+            if track is None:
+                return None
+            for old in [k for k in _tracks if k[0] == path]:
+                del _tracks[old]        # bản của file trước khi bị sửa
+            _tracks[key] = track
+            while len(_tracks) > MAX_TRACKS:
+                _tracks.popitem(last=False)
+        return track if track.maxPayload == maxPayload else None
+
+
+def write_hint(filename, maxPayload=MAX_PAYLOAD):
+    """Build and save the hint track of a video; return it."""
+    stream = load_video(filename)
+    try:
+        track = HintTrack.build(stream.index, maxPayload)
+    finally:
+        stream.close()
+    track.save(filename)
+    return track
+
+
+def verify_hint(filename):
+    """Problems of the sidecar hint of `filename` against the file itself; [] if it is valid."""
+    result = HintTrack.read(filename + HINT_EXT)
+    if result is None:
+        return [f"no readable {filename + HINT_EXT}"]
+    (_, _, _, size, mtime, _, _), track = result
+    st = os.stat(filename)
+    problems = []
+    if size != st.st_size or mtime != st.st_mtime_ns:
+        problems.append("stale: the video changed after the hint was written")
+    stream = load_video(filename)
+    try:
+        problems += track.verify(stream.index, stream.reader)
+    finally:
+        stream.close()
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write or verify the RTP hint track of MJPEG files.")
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--verify', action='store_true', help="check existing hint files instead of writing them")
+    parser.add_argument('--max-payload', type=int, default=MAX_PAYLOAD)
+    args = parser.parse_args()
+    if not 0 < args.max_payload <= 0xFFFF:
+        parser.error("--max-payload must be between 1 and 65535")
+
+    failed = False
+    for filename in args.files:
+        if args.verify:
+            problems = verify_hint(filename)
+            print(f"{filename}: {'OK' if not problems else 'FAILED'}")
+            for problem in problems:
+                print(f"  {problem}")
+            failed |= bool(problems)
+        else:
+            track = write_hint(filename, args.max_payload)
+            print(f"{filename + HINT_EXT}: {len(track)} frames, {len(track.offsets)} packets")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
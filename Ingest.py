@@ -0,0 +1,159 @@
+# Ingest.py
+# Tính trước một "bậc thang" encode cho file MJPEG (ví dụ full, 720p, 480p, 240p),
+# mỗi bậc là một file HD MJPEG cạnh file nguồn, cùng số frame, kèm manifest JSON.
+# Server chuyển bậc bằng cách mở file khác rồi seek tới cùng frame: không phải nén lại live.
+# Mỗi file (nguồn và các bậc) còn có hint track <file>.hint (Hint.py) để server gửi packet
+# tính sẵn thay vì cắt frame lúc phát.
+#
+#   python3 Ingest.py movie.mjpeg [--ladder full,720:80,480:70,240:60] [--workers N] [--no-hint]
+
+import argparse, io, json, os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+from VideoLoader import load_video, MANIFEST_SUFFIX
+from VideoStreamHD import VideoStreamHD
+from FrameIndex import load_index
+from Hint import write_hint
+
+DEFAULT_LADDER = 'full,720:80,480:70,240:60'
+BATCH = 16              # số frame mỗi task gửi sang process pool
+
+
+def parse_ladder(text):
+    """'full,720:80,...' -> [(name, height or None, quality or None)]."""
+    ladder = []
+    for item in text.split(','):
+        size, _, quality = item.strip().partition(':')
+        quality = int(quality) if quality else None
+        if size == 'full':
+            ladder.append(('full', None, quality))
+        else:
+            height = int(size.rstrip('p'))
+            ladder.append((f"{height}p", height, quality or 75))
+    return ladder
+
+
+def encode_frame(data, height, quality):
+    """Scale one JPEG down to `height` lines (keeping aspect) and re-encode it."""
+    if height is None and quality is None:
+        return bytes(data)
+    image = Image.open(io.BytesIO(data))
+    if height is not None and height < image.height:
+        width = max(2, round(image.width * height / image.height / 2) * 2)
+        image.draft('RGB', (width, height))     # giải mã thẳng ở độ phân giải thấp
+        if image.size != (width, height):
+            image = image.resize((width, height), Image.LANCZOS)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    out = io.BytesIO()
+    image.save(out, 'JPEG', quality=quality or 90)
+    return out.getvalue()
+
+
+def encode_batch(frames, ladder):
+    """Encode a batch of frames for every rendition (runs in a worker process)."""
+    return [[encode_frame(frame, height, quality) for frame in frames]
+            for _, height, quality in ladder]
+
+
+def read_batches(stream):
+    while True:
+        frames = []
+        for _ in range(BATCH):
+            frame = stream.nextFrame()
+            if not frame:
+                break
+            frames.append(bytes(frame))
+        if not frames:
+            return
+        yield frames
+
+
+def ingest(source, ladder, workers=None, hint=True):
+    """Write every rendition of `source` and its manifest; return the manifest path."""
+    stream = load_video(source)
+    first = stream.nextFrame()
+    if not first:
+        raise ValueError(f"{source} has no frames")
+    width, height = Image.open(io.BytesIO(first)).size
+    stream.reset()
+    # Bậc cao hơn nguồn thì vô nghĩa
+    ladder = [r for r in ladder if r[1] is None or r[1] < height]
+
+    stem = os.path.splitext(source)[0]
+    files = [f"{stem}.{name}.mjpeg" for name, _, _ in ladder]
+    outputs = [open(f, 'wb') for f in files]
+    sizes = [0] * len(ladder)
+    workers = workers or os.cpu_count() or 1
+    try:
+        with ProcessPoolExecutor(workers) as pool:
+            # Giữ tối đa 2 batch / worker trong hàng đợi để bộ nhớ không phình theo độ dài file
+            pending = deque()
+            for frames in read_batches(stream):
+                pending.append(pool.submit(encode_batch, frames, ladder))
+                if len(pending) >= 2 * workers:
+                    write_batch(pending.popleft().result(), outputs, sizes)
+            while pending:
+                write_batch(pending.popleft().result(), outputs, sizes)
+    finally:
+        for f in outputs:
+            f.close()
+        stream.close()
+
+    count, fps = len(stream.index), stream.index.fps
+    renditions = []
+    for (name, h, quality), path, size in zip(ladder, files, sizes):
+        index = load_index(path, VideoStreamHD.scan, fps)
+        if len(index) != count:
+            raise ValueError(f"{path}: {len(index)} frames, expected {count}")
+        renditions.append({
+            'name': name,
+            'file': os.path.basename(path),
+            'height': h or height,
+            'width': width if h is None else max(2, round(width * h / height / 2) * 2),
+            'quality': quality,
+            'bitrate': int(size * 8 * fps / count),
+        })
+
+    manifestFile = stem + MANIFEST_SUFFIX
+    manifest = {'version': 1, 'source': os.path.basename(source), 'fps': fps,
+                'frames': count, 'renditions': renditions}
+    with open(manifestFile + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifestFile + '.tmp', manifestFile)
+    if hint:
+        for path in [source] + files:
+            write_hint(path)
+    return manifestFile
+
+
+def write_batch(results, outputs, sizes):
+    for i, frames in enumerate(results):
+        for frame in frames:
+            outputs[i].write(frame)
+            sizes[i] += len(frame)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute an MJPEG encoding ladder and its manifest.")
+    parser.add_argument('source')
+    parser.add_argument('--ladder', default=DEFAULT_LADDER,
+                        help="comma separated <height>[:quality] or full[:quality] (default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=None, help="encoder processes (default: all cores)")
+    parser.add_argument('--no-hint', dest='hint', action='store_false',
+                        help="do not write the .hint packet tables next to each file")
+    args = parser.parse_args()
+
+    manifestFile = ingest(args.source, parse_ladder(args.ladder), args.workers, args.hint)
+    with open(manifestFile) as f:
+        for rendition in json.load(f)['renditions']:
+            print(f"{rendition['name']:>6}  {rendition['width']}x{rendition['height']}  "
+                  f"{rendition['bitrate'] / 1e6:.2f} Mbit/s  {rendition['file']}")
+    print(f"Manifest: {manifestFile}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+# JitterBuffer.py
+# Hàng đợi frame phía client với độ sâu playout thích nghi:
+# jitter được đo theo RFC 3550 (mục 6.4.1, A.8) từ RTP timestamp 90 kHz,
+# độ sâu mục tiêu (frame và byte) nằm giữa mức tối thiểu (độ trễ thấp) và mức trần.
+# PlayoutClock đổi RTP timestamp thành hạn hiển thị để bỏ frame đã trễ thay vì phát chậm dần.
+
+import math
+from collections import deque
+
+CLOCK_RATE = 90000
+
+
+class JitterBuffer:
+    def __init__(self, minFrames=2, maxFrames=30, maxBytes=64 * 1024 * 1024,
+                 frameInterval=0.04, jitterFactor=4.0):
+        self.frames = deque()           # (rtp timestamp, frame bytes)
+        self.bytes = 0
+        self.minFrames = minFrames
+        self.maxFrames = maxFrames
+        self.maxBytes = maxBytes
+        self.frameInterval = frameInterval
+        self.jitterFactor = jitterFactor
+
+        self.jitter = 0.0               # J của RFC 3550, đơn vị timestamp
+        self.transit = None
+        self.lastTimestamp = None
+        self.avgFrameBytes = 0.0
+        self.overflowDropped = 0
+
+    def onPacket(self, timestamp, arrival):
+        """Update the interarrival jitter with one RTP packet (arrival in seconds).
+
+        Only the first packet of each frame is used: the server spreads the
+        other fragments over the frame interval on purpose.
+        """
+        if timestamp == self.lastTimestamp:
+            return
+        if self.lastTimestamp is not None:
+            delta = (timestamp - self.lastTimestamp) & 0xFFFFFFFF
+            if 0 < delta < CLOCK_RATE:
+                self.frameInterval += (delta / CLOCK_RATE - self.frameInterval) / 16
+        self.lastTimestamp = timestamp
+
+        transit = arrival * CLOCK_RATE - timestamp
+        if self.transit is not None:
+            d = abs(transit - self.transit)
+            # Bỏ qua bước nhảy lớn (seek, timestamp wrap)
+            if d < CLOCK_RATE:
+                self.jitter += (d - self.jitter) / 16
+        self.transit = transit
+
+    def jitterMs(self):
+        return self.jitter * 1000 / CLOCK_RATE
+
+    def targetFrames(self):
+        """Playout depth to hold before/while playing, in frames."""
+        extra = math.ceil(self.jitterFactor * self.jitter / CLOCK_RATE / self.frameInterval)
+        target = min(self.minFrames + extra, self.maxFrames)
+        if self.avgFrameBytes:
+            target = min(target, max(1, int(self.maxBytes // self.avgFrameBytes)))
+        return max(target, 1)
+
+    def targetBytes(self):
+        return int(self.targetFrames() * self.avgFrameBytes)
+
+    def push(self, timestamp, frame):
+        self.frames.append((timestamp, frame))
+        self.bytes += len(frame)
+        self.avgFrameBytes += (len(frame) - self.avgFrameBytes) / 16 if self.avgFrameBytes else len(frame)
+        # Vượt trần: bỏ frame cũ nhất để giữ độ trễ thấp
+        while len(self.frames) > self.maxFrames or (self.bytes > self.maxBytes and len(self.frames) > 1):
+            _, old = self.frames.popleft()
+            self.bytes -= len(old)
+            self.overflowDropped += 1
+
+    def pop(self):
+        """Return (timestamp, frame) of the oldest frame, or None if empty."""
+        if not self.frames:
+            return None
+        timestamp, frame = self.frames.popleft()
+        self.bytes -= len(frame)
+        return timestamp, frame
+
+    def ready(self):
+        return len(self.frames) >= self.targetFrames()
+
+    def clear(self):
+        self.frames.clear()
+        self.bytes = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+
+class PlayoutClock:
+    """Display deadline of each frame from its RTP timestamp, anchored at the first frame shown."""
+
+    MAX_GAP = 2.0       # giây: timestamp nhảy xa hơn (seek, đổi nguồn) thì neo lại
+
+    def __init__(self):
+        self.base = None                # (rtp timestamp, thời điểm monotonic của nó)
+
+    def reset(self):
+        self.base = None
+
+    def anchor(self, timestamp, now):
+        self.base = (timestamp, now)
+
+    def deadline(self, timestamp):
+        """Monotonic time `timestamp` is due on screen, or None before the clock is anchored."""
+        if self.base is None:
+            return None
+        ts0, t0 = self.base
+        delta = ((timestamp - ts0 + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+        return t0 + delta / CLOCK_RATE
+
+    def due(self, timestamp, now):
+        """Deadline of `timestamp`; anchors the clock on it first if needed."""
+        deadline = self.deadline(timestamp)
+        if deadline is None or deadline < self.base[1] or deadline - now > self.MAX_GAP:
+            self.anchor(timestamp, now)
+            return now
+        return deadline
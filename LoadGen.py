@@ -0,0 +1,255 @@
+# LoadGen.py
+# Giả lập nhiều viewer trong một process trên một event loop asyncio, mỗi viewer là một
+# ClientEngine đầy đủ (RTSP, ghép frame, jitter buffer, RTCP) với cổng RTP riêng,
+# không decode/hiển thị. Cuối cùng in thống kê QoE tổng hợp.
+#
+#   python3 LoadGen.py 127.0.0.1 8554 movie.mjpeg [--viewers 500] [--duration 30] [--ramp 50]
+#                      [--fec K] [--rendition NAME] [--pipelined] [--tcp] [--json out.json]
+
+import argparse, asyncio, json, sys, time
+
+from ClientEngine import ClientEngine
+from RtspParser import RtspParser, InterleavedFrame
+
+try:
+    import resource
+except ImportError:     # Windows
+    resource = None
+
+
+class RtpProtocol(asyncio.DatagramProtocol):
+    """RTP endpoint of one simulated viewer."""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def datagram_received(self, data, address):
+        self.engine.onRtpPacket(data, time.monotonic())
+
+    def error_received(self, exc):
+        self.engine.errors += 1
+
+
+class AsyncClientEngine(ClientEngine):
+    """ClientEngine on asyncio: no threads, one UDP endpoint, RTCP sent from the RTP port."""
+
+    verbose = False
+
+    def __init__(self, serveraddr, serverport, filename, fecGroup=0, rendition=None, tcp=False):
+        super().__init__(serveraddr, serverport, 0, filename, fecGroup, rendition, tcp=tcp)
+        self.reader = None
+        self.writer = None
+        self.transport = None
+        self.replied = None
+        self.errors = 0
+        self.final = None           # stats() lúc dừng xem, trước TEARDOWN
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self.reader, self.writer = await asyncio.open_connection(self.serverAddr, self.serverPort)
+        self.transport, _ = await loop.create_datagram_endpoint(
+            lambda: RtpProtocol(self), local_addr=('0.0.0.0', 0))
+        # Server định tuyến RTCP theo SSRC nên gửi RTCP từ chính cổng RTP: một socket / viewer
+        self.rtpPort = self.rtcpPort = self.transport.get_extra_info('sockname')[1]
+        self.replied = asyncio.Event()
+        loop.create_task(self.readReplies())
+
+    async def request(self, *requestCodes, timeout=5.0):
+        """Send RTSP request(s) in one write and wait for every reply; False on timeout."""
+        self.sendRtspRequest(*requestCodes)
+        try:
+            await asyncio.wait_for(self.allReplied(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def allReplied(self):
+        while self.pending:
+            self.replied.clear()
+            await self.replied.wait()
+
+    async def readReplies(self):
+        parser = RtspParser()
+        while True:
+            try:
+                data = await self.reader.read(65536)
+                replies = parser.feed(data)
+            except (OSError, ValueError):
+                break
+            if not data:
+                break
+            now = time.monotonic()
+            for reply in replies:
+                if isinstance(reply, InterleavedFrame):
+                    self.onInterleaved(reply, now)
+                else:
+                    self.parseRtspReply(reply)
+            self.replied.set()
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+        if self.writer is not None:
+            self.writer.close()
+
+    # I/O của ClientEngine
+    def connect(self):
+        pass
+
+    def sendRtsp(self, data):
+        self.writer.write(data)
+
+    def startRtspReceiver(self):
+        pass
+
+    def openRtpPort(self):
+        pass
+
+    def startReceiving(self):
+        pass
+
+    def sendRtcp(self, data, address):
+        self.transport.sendto(data, address)
+
+
+def percentiles(values, scale=1.0):
+    if not values:
+        return None
+    values = sorted(values)
+    pick = lambda p: round(values[min(len(values) - 1, int(len(values) * p / 100))] * scale, 2)
+    return {'p50': pick(50), 'p90': pick(90), 'p99': pick(99), 'max': round(values[-1] * scale, 2)}
+
+
+class LoadGenerator:
+    def __init__(self, host, port, filename, viewers, duration, ramp, fecGroup=0, rendition=None,
+                 pipelined=False, tcp=False):
+        self.host = host
+        self.port = port
+        self.filename = filename
+        self.viewers = viewers
+        self.duration = duration
+        self.ramp = ramp                # viewer mới mỗi giây
+        self.fecGroup = fecGroup
+        self.rendition = rendition
+        self.pipelined = pipelined      # SETUP + PLAY trong một lượt đi về
+        self.tcp = tcp                  # RTP interleaved trên kết nối RTSP
+        self.engines = []
+        self.failed = 0
+        self.tickInterval = 0.04
+
+    async def run(self):
+        ticker = asyncio.get_running_loop().create_task(self.tick())
+        tasks = []
+        for i in range(self.viewers):
+            tasks.append(asyncio.get_running_loop().create_task(self.viewer()))
+            await asyncio.sleep(1.0 / self.ramp)
+        await asyncio.gather(*tasks)
+        ticker.cancel()
+
+    async def viewer(self):
+        engine = AsyncClientEngine(self.host, self.port, self.filename, self.fecGroup, self.rendition, self.tcp)
+        try:
+            await engine.start()
+            if self.pipelined:
+                if not await engine.request(engine.SETUP, engine.PLAY) or engine.state != engine.PREBUFFERING:
+                    raise ConnectionError("SETUP + PLAY failed")
+                self.engines.append(engine)
+            else:
+                if not await engine.request(engine.SETUP) or engine.state != engine.READY:
+                    raise ConnectionError("SETUP failed")
+                self.engines.append(engine)
+                if not await engine.request(engine.PLAY) or engine.state != engine.PREBUFFERING:
+                    raise ConnectionError("PLAY failed")
+            await asyncio.sleep(self.duration)
+            engine.final = engine.stats()
+            await engine.request(engine.TEARDOWN)
+        except (OSError, ConnectionError) as e:
+            self.failed += 1
+            if self.failed <= 5:
+                print(f"[LoadGen] Viewer failed: {e}", file=sys.stderr)
+        finally:
+            engine.close()
+
+    async def tick(self):
+        """Playout clock shared by every viewer (one timer instead of one per viewer)."""
+        deadline = time.monotonic()
+        while True:
+            # Mốc tuyệt đối: không trôi chậm dần khi mỗi lượt tốn thời gian
+            deadline += self.tickInterval
+            await asyncio.sleep(max(0.0, deadline - time.monotonic()))
+            now = time.monotonic()
+            for engine in self.engines:
+                if engine.state in (engine.PREBUFFERING, engine.PLAYING):
+                    engine.playout()
+                    engine.onIdle(now)
+
+    def report(self):
+        stats = [e.final or e.stats() for e in self.engines]
+        packets = sum(s['packets'] for s in stats)
+        lost = sum(max(0, s['lost']) for s in stats)
+        completed = sum(s['framesCompleted'] for s in stats)
+        dropped = sum(s['framesDropped'] for s in stats)
+        played = sum(s['framesPlayed'] for s in stats)
+        seconds = sum(s['duration'] for s in stats)
+        return {
+            'viewers': self.viewers,
+            'started': len(stats),
+            'failed': self.failed,
+            'never_played': sum(1 for s in stats if s['startup'] is None),
+            'startup_ms': percentiles([s['startup'] for s in stats if s['startup'] is not None], 1000),
+            'rebuffers': sum(s['rebuffers'] for s in stats),
+            'viewers_rebuffered': sum(1 for s in stats if s['rebuffers']),
+            'played_fps': round(played / seconds, 2) if seconds else None,
+            'frames_played': played,
+            'frames_skipped': sum(s['skipped'] for s in stats),
+            'frames_late': sum(s['lateFrames'] for s in stats),
+            'frame_loss_percent': round(dropped / (completed + dropped) * 100, 3) if completed + dropped else None,
+            'packet_loss_percent': round(lost / (packets + lost) * 100, 3) if packets + lost else None,
+            'packets_late': sum(s['late'] for s in stats),
+            'repaired': sum(s['repaired'] for s in stats),
+            'fec_recovered': sum(s['recovered'] for s in stats),
+            'jitter_ms': percentiles([s['jitterMs'] for s in stats]),
+            'mbit_per_s': round(sum(s['bytes'] for s in stats) * 8 / self.duration / 1e6, 2),
+        }
+
+
+def raiseFileLimit(viewers):
+    """Each viewer holds one TCP and one UDP socket: lift the soft descriptor limit."""
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = 2 * viewers + 64
+    if soft < wanted:
+        limit = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate many RTSP/RTP viewers and report aggregate QoE.")
+    parser.add_argument('host')
+    parser.add_argument('port', type=int)
+    parser.add_argument('file')
+    parser.add_argument('--viewers', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=20.0, help="seconds each viewer plays")
+    parser.add_argument('--ramp', type=float, default=50.0, help="viewers started per second")
+    parser.add_argument('--fec', type=int, default=0, help="ask for FEC parity every K fragments")
+    parser.add_argument('--rendition', default=None)
+    parser.add_argument('--pipelined', action='store_true', help="send SETUP and PLAY in one round trip")
+    parser.add_argument('--tcp', action='store_true', help="receive RTP interleaved on the RTSP connection")
+    parser.add_argument('--json', help="also write the report to this file")
+    args = parser.parse_args()
+
+    raiseFileLimit(args.viewers)
+    generator = LoadGenerator(args.host, args.port, args.file, args.viewers, args.duration, args.ramp,
+                              args.fec, args.rendition, args.pipelined, args.tcp)
+    asyncio.run(generator.run())
+    report = generator.report()
+    for name, value in report.items():
+        print(f"{name:22}: {value}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+# Metrics.py
+# Số liệu của server: số session theo trạng thái, counter của từng session, histogram
+# thời gian đọc frame / đóng gói / gửi packet và độ trễ so với lịch gửi (pacing lateness),
+# tỉ lệ hit của cache frame. Xuất theo định dạng text của Prometheus qua HTTP trên một
+# cổng phụ (--metrics-port) và qua RTSP GET_PARAMETER.
+
+import bisect, logging, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from FrameCache import sharedCache
+from Sessions import sessions as sessionManager
+
+log = logging.getLogger(__name__)
+
+PREFIX = 'socketvideo_'
+# Giây: từ 10 µs (cache hit, sendto) tới 250 ms
+TIME_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25)
+LATENESS_BUCKETS = (5e-4, 1e-3, 2e-3, 5e-3, 1e-2, 2e-2, 5e-2, 0.1, 0.25, 0.5)
+STATE_NAMES = ('init', 'ready', 'playing')
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense (le = upper bound)."""
+
+    def __init__(self, name, help, buckets=TIME_BUCKETS):
+        self.name = PREFIX + name
+        self.help = help
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # phần tử cuối: > bucket lớn nhất
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def render(self, lines):
+        with self.lock:
+            counts, total = list(self.counts), self.sum
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} histogram")
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound:g}"}} {cumulative}')
+        cumulative += counts[-1]
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {cumulative}')
+        lines.append(f"{self.name}_sum {total:.9f}")
+        lines.append(f"{self.name}_count {cumulative}")
+
+
+class Metrics:
+    """Process-wide registry; sessions are read when the metrics are rendered."""
+
+    def __init__(self):
+        self.frameRead = Histogram('frame_read_seconds', "Time to read one frame (cache or file).")
+        self.packetize = Histogram('packetize_seconds', "Time to fragment one frame into RTP packets.")
+        self.send = Histogram('packet_send_seconds', "Time of one RTP packet send call.")
+        self.lateness = Histogram('pacing_lateness_seconds', "Delay of a frame behind its send deadline.",
+                                  LATENESS_BUCKETS)
+        self.sessions = set()
+        self.started = 0
+        # Counter của các session đã kết thúc, để tổng của server không giảm khi session rời đi
+        self.finished = {'packets': 0, 'bytes': 0, 'frames': 0, 'rtx': 0}
+        self.lock = threading.Lock()
+
+    def register(self, worker):
+        with self.lock:
+            if worker not in self.sessions:
+                self.sessions.add(worker)
+                self.started += 1
+
+    def unregister(self, worker):
+        with self.lock:
+            if worker not in self.sessions:
+                return
+            self.sessions.discard(worker)
+            for key, value in sessionCounters(worker).items():
+                self.finished[key] += value
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self.lock:
+            sessions = list(self.sessions)
+            totals = dict(self.finished)
+            started = self.started
+        lines = []
+
+        byState = dict.fromkeys(STATE_NAMES, 0)
+        for worker in sessions:
+            byState[STATE_NAMES[worker.state]] += 1
+        family(lines, 'sessions', "Sessions by RTSP state.", 'gauge',
+               [(f'state="{state}"', count) for state, count in byState.items()])
+        family(lines, 'sessions_started_total', "Sessions set up since start.", 'counter', [('', started)])
+        lifecycle = sessionManager.stats()
+        family(lines, 'connections', "Open RTSP connections.", 'gauge', [('', lifecycle['connections'])])
+        family(lines, 'sessions_rejected_total', "SETUPs refused with 453 (session or bandwidth limit).",
+               'counter', [('', lifecycle['rejected'])])
+        family(lines, 'sessions_timed_out_total', "Connections closed after the session timeout.",
+               'counter', [('', lifecycle['timed_out'])])
+
+        perSession = [(worker, sessionCounters(worker)) for worker in sessions]
+        for _, counters in perSession:
+            for key, value in counters.items():
+                totals[key] += value
+        for key, help in (('packets', "RTP packets sent."), ('bytes', "RTP bytes sent."),
+                          ('frames', "Frames sent."), ('rtx', "Packets retransmitted after a NACK.")):
+            family(lines, f'{key}_sent_total', help, 'counter', [('', totals[key])])
+            family(lines, f'session_{key}_sent_total', help + " (per session)", 'counter',
+                   [(sessionLabels(worker), counters[key]) for worker, counters in perSession])
+
+        for histogram in (self.frameRead, self.packetize, self.send, self.lateness):
+            histogram.render(lines)
+
+        cache = sharedCache.stats()
+        lookups = cache['hits'] + cache['misses']
+        family(lines, 'frame_cache_hits_total', "Frame cache hits.", 'counter', [('', cache['hits'])])
+        family(lines, 'frame_cache_misses_total', "Frame cache misses.", 'counter', [('', cache['misses'])])
+        family(lines, 'frame_cache_hit_ratio', "Hits / lookups of the frame cache.", 'gauge',
+               [('', f"{cache['hits'] / lookups:.6f}" if lookups else 0)])
+        family(lines, 'frame_cache_bytes', "Bytes held by the frame cache.", 'gauge', [('', cache['bytes'])])
+        return '\n'.join(lines) + '\n'
+
+
+def sessionCounters(worker):
+    return {'packets': worker.packetsSent, 'bytes': worker.bytesSent,
+            'frames': worker.framesSent, 'rtx': worker.rtxSent}
+
+
+def sessionLabels(worker):
+    fileName = str(worker.clientInfo.get('fileName', '')).replace('\\', '\\\\').replace('"', '\\"')
+    return f'session="{worker.clientInfo.get("session", 0)}",file="{fileName}"'
+
+
+def family(lines, name, help, kind, samples):
+    name = PREFIX + name
+    lines.append(f"# HELP {name} {help}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in samples:
+        lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug("%s - %s", self.address_string(), format % args)
+
+
+def startMetricsServer(port, host=''):
+    """Serve /metrics on a side port from a daemon thread; return the HTTP server."""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    log.info("Metrics on http://%s:%d/metrics", host or '0.0.0.0', server.server_address[1])
+    return server
+
+
+metrics = Metrics()
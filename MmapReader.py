@@ -0,0 +1,48 @@
+# MmapReader.py
+# Đọc file video qua mmap: tìm marker ngay trên vùng nhớ map và trả frame
+# dưới dạng memoryview (không copy byte nào).
+
+import mmap, os
+
+
+class MmapReader:
+    def __init__(self, filename):
+        self.filename = filename
+        try:
+            self.file = open(filename, 'rb')
+        except OSError:
+            raise IOError(f"Cannot open file {filename}")
+
+        st = os.fstat(self.file.fileno())
+        self.mtime = st.st_mtime_ns
+        if st.st_size:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            if hasattr(self.map, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+                self.map.madvise(mmap.MADV_SEQUENTIAL)
+        else:
+            # mmap không map được file rỗng
+            self.map = b''
+        self.view = memoryview(self.map)
+
+    def __len__(self):
+        return len(self.view)
+
+    def find(self, marker, start=0, end=None):
+        """Offset of the next `marker` at or after `start`, or -1."""
+        if end is None:
+            return self.map.find(marker, start)
+        return self.map.find(marker, start, end)
+
+    def slice(self, offset, length):
+        """Zero-copy view over `length` bytes at `offset` (may be shorter at EOF)."""
+        return self.view[offset:offset + length]
+
+    def close(self):
+        self.view.release()
+        try:
+            if isinstance(self.map, mmap.mmap):
+                self.map.close()
+        except BufferError:
+            # Vẫn còn frame (memoryview) đang được dùng: để GC đóng sau
+            pass
+        self.file.close()
@@ -0,0 +1,85 @@
+# Pacer.py
+# Lập lịch gửi RTP theo đồng hồ monotonic:
+# - frame thứ n được gửi tại start + n * interval (không cộng dồn trễ)
+# - các fragment của một frame được rải đều trong khoảng interval
+# - token bucket giới hạn tốc độ đỉnh (peak rate) của session
+
+from time import monotonic
+
+
+class TokenBucket:
+    """Token bucket in bytes; tokens may go negative (debt is paid over time)."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate            # bytes/s
+        self.burst = burst          # bytes
+        self.tokens = burst
+        self.stamp = None
+
+    def reserve(self, nbytes, when):
+        """Take `nbytes` at time `when`; return the earliest time they may leave."""
+        if self.stamp is None:
+            self.stamp = when
+        if when > self.stamp:
+            self.tokens = min(self.burst, self.tokens + (when - self.stamp) * self.rate)
+            self.stamp = when
+        self.tokens -= nbytes
+        if self.tokens >= 0:
+            return when
+        return self.stamp - self.tokens / self.rate
+
+    def take(self, nbytes, when):
+        """Take `nbytes` only if they are available at `when` (no debt)."""
+        if self.stamp is None:
+            self.stamp = when
+        if when > self.stamp:
+            self.tokens = min(self.burst, self.tokens + (when - self.stamp) * self.rate)
+            self.stamp = when
+        if self.tokens < nbytes:
+            return False
+        self.tokens -= nbytes
+        return True
+
+
+class FramePacer:
+    """Wall-clock anchored frame deadlines plus intra-frame fragment spreading."""
+
+    def __init__(self, frameRate=25.0, peakRate=None, spread=0.8, maxLag=0.5):
+        self.interval = 1.0 / frameRate
+        self.spread = spread        # phần của interval dùng để rải fragment
+        self.maxLag = maxLag        # trễ quá mức này thì đặt lại mốc, không gửi dồn
+        self.bucket = None
+        if peakRate:
+            rate = peakRate / 8.0   # bit/s -> byte/s
+            self.bucket = TokenBucket(rate, max(16 * 1500, rate * 0.002))
+        self.begin()
+
+    def begin(self, now=None):
+        """(Re)start the clock: the next frame is due immediately."""
+        self.start = monotonic() if now is None else now
+        self.frames = 0
+        self.resyncs = 0
+
+    def nextDeadline(self):
+        return self.start + self.frames * self.interval
+
+    def schedule(self, sizes, now):
+        """Consume the current frame deadline; return a send time per packet."""
+        deadline = self.nextDeadline()
+        lateness = now - deadline
+        if lateness > self.maxLag:
+            # Bị treo quá lâu (CPU, disk...): dời mốc thay vì gửi bù một loạt frame
+            self.start += lateness
+            deadline = now
+            self.resyncs += 1
+        self.frames += 1
+
+        count = len(sizes)
+        step = self.interval * self.spread / count if count else 0.0
+        times = []
+        for i, size in enumerate(sizes):
+            when = deadline + i * step
+            if self.bucket is not None:
+                when = self.bucket.reserve(size, when)
+            times.append(when)
+        return times
@@ -0,0 +1,182 @@
+# RateControl.py
+# Điều chỉnh luồng của từng session theo RTCP receiver report:
+# mất gói / jitter cao -> lùi một bậc (nén lại JPEG chất lượng / độ phân giải thấp hơn,
+# rồi bỏ bớt frame); vài report liên tiếp sạch -> tiến lại một bậc.
+# Nén lại chạy trong process pool dùng chung để không chặn vòng gửi của session khác.
+
+import io, logging, multiprocessing, os, threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    from PIL import Image
+except ImportError:     # server không bắt buộc có Pillow: chỉ còn bỏ frame
+    Image = None
+
+log = logging.getLogger(__name__)
+
+# (giữ 1 trên N frame, chất lượng JPEG hoặc None = giữ nguyên, tỉ lệ kích thước,
+#  rendition đã ingest sẵn hoặc None)
+LADDER = [
+    (1, None, 1.0, None),
+    (1, 70, 1.0, None),
+    (1, 50, 0.75, None),
+    (1, 40, 0.5, None),
+    (2, 40, 0.5, None),
+    (3, 30, 0.5, None),
+]
+SKIP_LADDER = [(1, None, 1.0, None), (2, None, 1.0, None), (3, None, 1.0, None), (4, None, 1.0, None)]
+
+
+def renditionLadder(names):
+    """Ladder over precomputed renditions (Ingest.py), then frame skipping on the smallest."""
+    return ([(1, None, 1.0, name) for name in names]
+            + [(2, None, 1.0, names[-1]), (3, None, 1.0, names[-1])])
+
+
+_pool = None
+_poolLock = threading.Lock()
+
+
+def recompressPool():
+    """Process pool shared by every session (created on first use)."""
+    global _pool
+    with _poolLock:
+        if _pool is None:
+            workers = max(1, (os.cpu_count() or 2) // 2)
+            # spawn: không fork một server đang có nhiều thread
+            _pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def discardPool():
+    """Drop a broken pool (a worker process died); the next frame starts a new one."""
+    global _pool
+    with _poolLock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False)
+
+
+def shutdownPool():
+    """Stop the pool's processes (they do not exit on their own when the server is killed)."""
+    global _pool
+    # Gọi từ signal handler: không lấy _poolLock (thread chính có thể đang giữ nó)
+    pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def recompressJpeg(data, quality, scale):
+    """Re-encode one JPEG at `quality`, shrunk by `scale` (runs in a worker process)."""
+    image = Image.open(io.BytesIO(data))
+    if scale < 1.0:
+        size = (max(1, int(image.width * scale)), max(1, int(image.height * scale)))
+        image.draft('RGB', size)    # giải mã thẳng ở độ phân giải thấp (DCT scaling)
+        if image.size != size:
+            image = image.resize(size, Image.BILINEAR)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    out = io.BytesIO()
+    image.save(out, 'JPEG', quality=quality)
+    return out.getvalue()
+
+
+class RateController:
+    def __init__(self, recompress=True, renditions=None, highLoss=0.05, lowLoss=0.01, maxJitter=0.05,
+                 goodReports=3, hold=1.0):
+        if renditions:
+            # Có sẵn các bậc encode: đổi file thay vì nén lại live
+            self.ladder = renditionLadder(renditions)
+        else:
+            self.ladder = LADDER if recompress and Image is not None else SKIP_LADDER
+        self.level = 0
+        self.minLevel = 0               # bậc tốt nhất được phép (client tự chọn rendition thấp hơn)
+        self.highLoss = highLoss        # tỉ lệ mất gói làm lùi một bậc
+        self.lowLoss = lowLoss          # dưới mức này report được coi là sạch
+        self.maxJitter = maxJitter      # giây
+        self.goodReports = goodReports  # số report sạch liên tiếp để tiến một bậc
+        self.hold = hold                # giây tối thiểu giữa hai lần lùi bậc
+        self.good = 0
+        self.lastChange = None
+
+        # Stats
+        self.skipped = 0
+        self.recompressed = 0
+        self.errors = 0
+
+    def onReport(self, lossFraction, jitter, now):
+        """Update the level from one receiver report; return True if it changed."""
+        if lossFraction > self.highLoss or jitter > self.maxJitter:
+            self.good = 0
+            if self.level + 1 < len(self.ladder) and (self.lastChange is None or now - self.lastChange >= self.hold):
+                self.level += 1
+                self.lastChange = now
+                return True
+        elif lossFraction <= self.lowLoss:
+            self.good += 1
+            if self.good >= self.goodReports and self.level > self.minLevel:
+                self.level -= 1
+                self.good = 0
+                self.lastChange = now
+                return True
+        else:
+            self.good = 0
+        return False
+
+    def describe(self):
+        keep, quality, scale, rendition = self.ladder[self.level]
+        if rendition is not None:
+            return f"level {self.level}: 1/{keep} frames, rendition {rendition}"
+        return f"level {self.level}: 1/{keep} frames, quality {quality or 'original'}, scale {scale:g}"
+
+    def rendition(self):
+        """Rendition to stream at the current level (None without a manifest)."""
+        return self.ladder[self.level][3]
+
+    def pin(self, rendition):
+        """The client picked `rendition`: start from it and never go back above it."""
+        for level, entry in enumerate(self.ladder):
+            if entry[3] == rendition:
+                self.minLevel = self.level = level
+                return
+
+    def skip(self, frameNbr):
+        """True if frame `frameNbr` is dropped at the current level."""
+        keep = self.ladder[self.level][0]
+        if keep > 1 and frameNbr % keep:
+            self.skipped += 1
+            return True
+        return False
+
+    def submit(self, frameData):
+        """Start recompressing a frame for the current level; None if it is sent as is."""
+        _, quality, scale, _ = self.ladder[self.level]
+        if quality is None:
+            return None
+        try:
+            return recompressPool().submit(recompressJpeg, bytes(frameData), quality, scale)
+        except Exception as e:
+            # Không chạy được process con (vd process daemon) hoặc pool đã hỏng: gửi frame gốc
+            self.errors += 1
+            if isinstance(e, BrokenProcessPool):
+                discardPool()
+            log.log(logging.WARNING if self.errors == 1 else logging.DEBUG,
+                    "Cannot start recompression, sending original frames: %r", e)
+            return None
+
+    def result(self, future, original):
+        """Recompressed frame, or the original one if recompression failed or is not done."""
+        if not future.done():
+            future.cancel()
+            return original
+        try:
+            data = future.result()
+        except Exception as e:
+            self.errors += 1
+            if isinstance(e, BrokenProcessPool):
+                discardPool()
+            log.warning("Cannot recompress frame: %s", e)
+            return original
+        self.recompressed += 1
+        return data
@@ -0,0 +1,185 @@
+# Rtcp.py
+# Kênh phản hồi RTCP giữa client và server:
+# - receiver report (RFC 3550, PT 201): client báo tỉ lệ mất gói, jitter định kỳ
+# - generic NACK (RFC 4585, PT 205 / FMT 1): client xin gửi lại các sequence number bị mất
+# - PacketHistory: vòng đệm cấp sẵn giữ bản sao các packet RTP vừa gửi, đánh chỉ mục theo seq
+# - RtcpListener: một socket UDP + một thread cho mọi session, phân phối theo SSRC
+
+import socket, struct, threading, logging
+
+log = logging.getLogger(__name__)
+
+RTCP_VERSION = 2 << 6
+PT_RR = 201             # receiver report
+PT_RTPFB = 205          # transport layer feedback
+FMT_NACK = 1            # generic NACK
+
+# V/P/FMT, PT, length (số word 32 bit - 1), SSRC người gửi, SSRC nguồn media
+FEEDBACK_HEADER = struct.Struct('!BBHII')
+NACK_FCI = struct.Struct('!HH')     # PID, BLP
+SSRC = struct.Struct('!I')
+# V/P/RC, PT, length, SSRC người gửi + một report block:
+# SSRC nguồn, fraction lost (8 bit) | cumulative lost (24 bit), highest seq mở rộng,
+# jitter, LSR, DLSR
+RECEIVER_REPORT = struct.Struct('!BBHIIIIIII')
+
+
+def buildReceiverReport(senderSsrc, sourceSsrc, fractionLost, cumulativeLost, highestSeq, jitter):
+    """Receiver report with one report block (no sender reports, so LSR = DLSR = 0)."""
+    cumulativeLost = max(-0x800000, min(cumulativeLost, 0x7FFFFF)) & 0xFFFFFF
+    return RECEIVER_REPORT.pack(RTCP_VERSION | 1, PT_RR, RECEIVER_REPORT.size // 4 - 1,
+                                senderSsrc, sourceSsrc, (fractionLost & 0xFF) << 24 | cumulativeLost,
+                                highestSeq & 0xFFFFFFFF, int(jitter) & 0xFFFFFFFF, 0, 0)
+
+
+def parseReceiverReport(packet):
+    """Return (fraction lost 0..1, cumulative lost, highest seq, jitter in timestamp units)."""
+    _, _, _, _, _, lost, highestSeq, jitter, _, _ = RECEIVER_REPORT.unpack_from(packet)
+    cumulative = lost & 0xFFFFFF
+    if cumulative & 0x800000:
+        cumulative -= 0x1000000
+    return (lost >> 24) / 256, cumulative, highestSeq, jitter
+
+
+def buildNack(senderSsrc, mediaSsrc, seqs):
+    """Generic NACK covering `seqs` (16-bit sequence numbers)."""
+    fci = []
+    pending = sorted(set(seqs))
+    while pending:
+        pid = pending.pop(0)
+        blp = 0
+        while pending and ((pending[0] - pid) & 0xFFFF) <= 16:
+            blp |= 1 << (((pending.pop(0) - pid) & 0xFFFF) - 1)
+        fci.append((pid, blp))
+    packet = bytearray(FEEDBACK_HEADER.size + NACK_FCI.size * len(fci))
+    FEEDBACK_HEADER.pack_into(packet, 0, RTCP_VERSION | FMT_NACK, PT_RTPFB,
+                              len(packet) // 4 - 1, senderSsrc, mediaSsrc)
+    for i, (pid, blp) in enumerate(fci):
+        NACK_FCI.pack_into(packet, FEEDBACK_HEADER.size + i * NACK_FCI.size, pid, blp)
+    return bytes(packet)
+
+
+def parseNack(packet):
+    """Return the sequence numbers requested by one generic NACK packet."""
+    seqs = []
+    for offset in range(FEEDBACK_HEADER.size, len(packet) - NACK_FCI.size + 1, NACK_FCI.size):
+        pid, blp = NACK_FCI.unpack_from(packet, offset)
+        seqs.append(pid)
+        for bit in range(16):
+            if blp & (1 << bit):
+                seqs.append((pid + bit + 1) & 0xFFFF)
+    return seqs
+
+
+def parseCompound(data):
+    """Yield (pt, count/fmt, packet view) for each packet of a compound RTCP datagram."""
+    view = memoryview(data)
+    pos = 0
+    while pos + 4 <= len(view):
+        first, pt, length = struct.unpack_from('!BBH', view, pos)
+        end = pos + (length + 1) * 4
+        if first >> 6 != 2 or end > len(view):
+            return
+        yield pt, first & 0x1F, view[pos:end]
+        pos = end
+
+
+class PacketHistory:
+    """Ring of the last `size` RTP packets sent, indexed by sequence number."""
+
+    SLOT = 1500
+
+    def __init__(self, size=1024, pt=26):
+        self.size = size            # ước của 65536 để seq % size không đổi khi seq quay vòng
+        self.pt = pt
+        self.buffer = bytearray(size * self.SLOT)
+        self.view = memoryview(self.buffer)
+        self.lengths = [0] * size
+        self.seqs = [-1] * size
+        self.lock = threading.Lock()
+
+    def store(self, packet):
+        """Copy one sent packet (one buffer or a (header, payload) pair) into its slot.
+
+        Other payload types are ignored.
+        """
+        parts = packet if isinstance(packet, tuple) else (packet,)
+        header = parts[0]
+        length = sum(len(part) for part in parts)
+        if header[1] & 127 != self.pt or length > self.SLOT:
+            return
+        seq = header[2] << 8 | header[3]
+        i = seq % self.size
+        offset = i * self.SLOT
+        with self.lock:
+            for part in parts:
+                self.view[offset:offset + len(part)] = part
+                offset += len(part)
+            self.lengths[i] = length
+            self.seqs[i] = seq
+
+    def get(self, seq):
+        """Return a copy of packet `seq`, or None if it left the ring."""
+        i = seq % self.size
+        offset = i * self.SLOT
+        with self.lock:
+            if self.seqs[i] != seq:
+                return None
+            return bytes(self.view[offset:offset + self.lengths[i]])
+
+
+class RtcpDispatcher:
+    """Route incoming RTCP to the session whose SSRC it reports on."""
+
+    def __init__(self):
+        self.sessions = {}          # SSRC của session -> ServerWorker
+
+    def register(self, worker):
+        self.sessions[worker.ssrc] = worker
+
+    def unregister(self, worker):
+        if self.sessions.get(worker.ssrc) is worker:
+            del self.sessions[worker.ssrc]
+
+    def dispatch(self, data, address):
+        for pt, count, packet in parseCompound(data):
+            # Feedback (SSRC nguồn media) và report block (SSRC nguồn) đều ở offset 8
+            if len(packet) < 12:
+                continue
+            worker = self.sessions.get(SSRC.unpack_from(packet, 8)[0])
+            if worker is not None:
+                worker.onRtcp(pt, count, packet, address)
+
+
+class RtcpListener(RtcpDispatcher):
+    """Shared RTCP socket of the threaded server, served by one thread."""
+
+    def __init__(self):
+        super().__init__()
+        self.socket = None
+        self.port = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Bind the socket and start the receive thread on first use."""
+        with self.lock:
+            if self.socket is None:
+                self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self.socket.bind(('', 0))
+                self.port = self.socket.getsockname()[1]
+                threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+    def run(self):
+        while True:
+            try:
+                data, address = self.socket.recvfrom(2048)
+            except OSError:
+                break
+            try:
+                self.dispatch(data, address)
+            except Exception as e:
+                log.warning("Bad packet from %s: %s", address, e)
+
+
+rtcpListener = RtcpListener()
@@ -1,74 +1,166 @@
+import struct
 from time import time
 HEADER_SIZE = 12
 
-class RtpPacket:	
-    header = bytearray(HEADER_SIZE)
-    
+# V/P/X/CC, M/PT, sequence number, timestamp, SSRC
+RTP_HEADER = struct.Struct('!BBHII')
+
+def packetLength(packet):
+    """Size of a packet given as one buffer or as a (header, payload) pair."""
+    if isinstance(packet, tuple):
+        return len(packet[0]) + len(packet[1])
+    return len(packet)
+
+def parseHeader(packet):
+    """Return (marker, pt, seqnum, timestamp, ssrc) of a packet in one unpack."""
+    first, second, seqnum, timestamp, ssrc = RTP_HEADER.unpack_from(packet)
+    return second >> 7, second & 127, seqnum, timestamp, ssrc
+
+class RtpPacket:
+    __slots__ = ('header', 'payload')
+
     def __init__(self):
-        pass
-        
-    def encode(self, version, padding, extension, cc, seqnum, marker, pt, ssrc, payload):
+        self.header = bytearray(HEADER_SIZE)
+        self.payload = b''
+
+    def encode(self, version, padding, extension, cc, seqnum, marker, pt, ssrc, payload, timestamp=None):
         """Encode the RTP packet with header fields and payload."""
-        timestamp = int(time())
-        header = bytearray(HEADER_SIZE)
-        
-        header[0] = (version << 6) | (padding << 5) | (extension << 4) | cc
-        header[1] = (marker << 7) | pt
-        
-        # Sequence number (2 bytes)
-        header[2] = (seqnum >> 8) & 0xFF
-        header[3] = seqnum & 0xFF
-        
-        # Timestamp (4 bytes)
-        header[4] = (timestamp >> 24) & 0xFF
-        header[5] = (timestamp >> 16) & 0xFF
-        header[6] = (timestamp >> 8) & 0xFF
-        header[7] = timestamp & 0xFF
-        
-        # SSRC (4 bytes)
-        header[8]  = (ssrc >> 24) & 0xFF
-        header[9]  = (ssrc >> 16) & 0xFF
-        header[10] = (ssrc >> 8) & 0xFF
-        header[11] = ssrc & 0xFF
-        
-        self.header = header
+        if timestamp is None:
+            timestamp = int(time())
+        RTP_HEADER.pack_into(self.header, 0,
+                             (version << 6) | (padding << 5) | (extension << 4) | cc,
+                             (marker << 7) | pt,
+                             seqnum & 0xFFFF,
+                             timestamp & 0xFFFFFFFF,
+                             ssrc & 0xFFFFFFFF)
         self.payload = payload
-        
+
     def decode(self, byteStream):
-        """Decode the RTP packet."""
-        self.header = bytearray(byteStream[:HEADER_SIZE])
-        self.payload = byteStream[HEADER_SIZE:]
-    
+        """Decode the RTP packet (payload is a zero-copy view of byteStream)."""
+        view = memoryview(byteStream)
+        if len(view) < HEADER_SIZE:
+            raise ValueError(f"RTP packet too short ({len(view)} bytes)")
+        self.header[:] = view[:HEADER_SIZE]
+        self.payload = view[HEADER_SIZE:]
+
     def version(self):
         """Return RTP version."""
-        return int(self.header[0] >> 6)
-    
+        return self.header[0] >> 6
+
     def seqNum(self):
         """Return sequence (frame) number."""
-        seqNum = self.header[2] << 8 | self.header[3]
-        return int(seqNum)
-    
+        return self.header[2] << 8 | self.header[3]
+
     def timestamp(self):
         """Return timestamp."""
-        timestamp = (self.header[4] << 24 |
-                     self.header[5] << 16 |
-                     self.header[6] << 8  |
-                     self.header[7])
-        return int(timestamp)
-    
+        return RTP_HEADER.unpack_from(self.header)[3]
+
+    def ssrc(self):
+        """Return SSRC."""
+        return RTP_HEADER.unpack_from(self.header)[4]
+
     def payloadType(self):
         """Return payload type."""
-        pt = self.header[1] & 127
-        return int(pt)
+        return self.header[1] & 127
 
     def marker(self):
         """Return marker bit (0 or 1)."""
-        return int(self.header[1] >> 7)
-    
+        return self.header[1] >> 7
+
     def getPayload(self):
         """Return payload."""
         return self.payload
-        
+
     def getPacket(self):
-        """Return RTP packet."""
+        """Return RTP packet (header + payload copied into one buffer)."""
         return self.header + self.payload
+
+    def getBuffers(self):
+        """Return (header, payload) for scatter-gather sends without copying."""
+        return self.header, self.payload
+
+
+class RtpPacketizer:
+    """Turn a whole frame into RTP packets laid out in one preallocated buffer."""
+    __slots__ = ('maxPayload', 'pt', 'ssrc', 'buffer', 'view')
+
+    def __init__(self, maxPayload=1300, pt=26, ssrc=0):
+        self.maxPayload = maxPayload
+        self.pt = pt
+        self.ssrc = ssrc
+        self.buffer = bytearray(0)
+        self.view = memoryview(self.buffer)
+
+    def packetize(self, frame, seqnum, timestamp):
+        """Return ([packet memoryviews], last seqnum) for one frame.
+
+        Packets use seqnum + 1, seqnum + 2, ...; the marker bit is set on the
+        last one.  The views stay valid until the next call.
+        """
+        frame = memoryview(frame)
+        total = len(frame)
+        maxPayload = self.maxPayload
+        count = max(1, -(-total // maxPayload))
+        size = total + count * HEADER_SIZE
+        if len(self.buffer) < size:
+            # Cấp buffer mới thay vì resize: view cũ có thể vẫn đang được giữ
+            self.buffer = bytearray(size + size // 2)
+            self.view = memoryview(self.buffer)
+
+        buf, view, pack = self.buffer, self.view, RTP_HEADER.pack_into
+        first, pt = 2 << 6, self.pt
+        timestamp &= 0xFFFFFFFF
+        ssrc = self.ssrc
+        last = count - 1
+        packets = []
+        pos = offset = 0
+        for i in range(count):
+            length = min(maxPayload, total - offset)
+            seqnum = (seqnum + 1) & 0xFFFF
+            pack(buf, pos, first, pt | 0x80 if i == last else pt, seqnum, timestamp, ssrc)
+            end = pos + HEADER_SIZE + length
+            buf[pos + HEADER_SIZE:end] = frame[offset:offset + length]
+            packets.append(view[pos:end])
+            pos = end
+            offset += length
+        return packets, seqnum
+
+
+class HintedPacketizer:
+    """Packets of a hinted frame as (header, payload) pairs for scatter-gather sends.
+
+    Only the 12-byte headers are written; payloads are views of the media file
+    at the offsets the hint track recorded.
+    """
+    __slots__ = ('pt', 'ssrc', 'buffer', 'view')
+
+    def __init__(self, pt=26, ssrc=0):
+        self.pt = pt
+        self.ssrc = ssrc
+        self.buffer = bytearray(0)
+        self.view = memoryview(self.buffer)
+
+    def packetize(self, hint, frameNbr, source, seqnum, timestamp):
+        """Return ([(header, payload)], last seqnum) for frame `frameNbr` of `source` (a reader).
+
+        Header views stay valid until the next call, as with RtpPacketizer.
+        """
+        packets = hint.packets(frameNbr)
+        size = len(packets) * HEADER_SIZE
+        if len(self.buffer) < size:
+            self.buffer = bytearray(size + size // 2)
+            self.view = memoryview(self.buffer)
+
+        buf, view, pack = self.buffer, self.view, RTP_HEADER.pack_into
+        offsets, lengths, flags = hint.offsets, hint.lengths, hint.flags
+        first, pt = 2 << 6, self.pt
+        timestamp &= 0xFFFFFFFF
+        ssrc = self.ssrc
+        out = []
+        pos = 0
+        for n in packets:
+            seqnum = (seqnum + 1) & 0xFFFF
+            pack(buf, pos, first, pt | 0x80 if flags[n] & 1 else pt, seqnum, timestamp, ssrc)
+            out.append((view[pos:pos + HEADER_SIZE], source.slice(offsets[n], lengths[n])))
+            pos += HEADER_SIZE
+        return out, seqnum
@@ -0,0 +1,120 @@
+# RtpReceiver.py
+# Đường nhận RTP của client không cấp phát theo gói: một vùng nhớ cấp sẵn chia thành các
+# slot cỡ một datagram, recv_into ghi thẳng vào slot, mỗi lần thức dậy đọc liền một loạt gói
+# đang chờ trong socket (kiểu recvmmsg) cho tới khi socket rỗng. Header được đọc tại chỗ
+# (parseHeader), payload là memoryview của slot và chỉ được chép một lần vào frame slot của
+# FrameAssembler. SO_RCVBUF được nâng để chịu burst của frame HD; trên Linux số gói kernel
+# bỏ vì buffer đầy được đọc từ /proc/net/udp.
+
+import errno, logging, os, selectors, socket, sys
+
+log = logging.getLogger(__name__)
+
+DEFAULT_RCVBUF = 4 * 1024 * 1024
+SLOT_SIZE = 2048        # > header 12 + payload 1300 (+ FEC), dưới MTU jumbo thì không cắt
+SLOTS = 64              # số gói tối đa mỗi lần đọc
+# Linux: recv trả độ dài thật của datagram kể cả khi lớn hơn buffer, để nhận ra gói bị cắt
+MSG_TRUNC = getattr(socket, 'MSG_TRUNC', 0) if os.name == 'posix' else 0
+
+
+class RtpReceiver:
+    """Batched recv_into of a UDP socket into a pool of preallocated packet buffers.
+
+    The views returned by receive() are only valid until the next call.
+    """
+
+    def __init__(self, sock, rcvbuf=DEFAULT_RCVBUF, slots=SLOTS, slotSize=SLOT_SIZE):
+        self.sock = sock
+        self.slotSize = slotSize
+        self.pool = bytearray(slots * slotSize)
+        view = memoryview(self.pool)
+        self.slots = [view[i * slotSize:(i + 1) * slotSize] for i in range(slots)]
+        self.rcvbuf = self.setReceiveBuffer(rcvbuf) if rcvbuf else None
+        sock.setblocking(False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(sock, selectors.EVENT_READ)
+        self.inode = self.socketInode()
+
+        # Stats
+        self.packets = 0
+        self.batches = 0
+        self.maxBatch = 0
+        self.truncated = 0          # datagram lớn hơn slot: bị bỏ
+
+    def setReceiveBuffer(self, size):
+        """Ask for a `size`-byte socket receive buffer; return what the kernel granted."""
+        try:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, size)
+        except OSError as e:
+            log.warning("Cannot set SO_RCVBUF: %s", e)
+        granted = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        if sys.platform.startswith('linux'):
+            # Linux báo gấp đôi giá trị đặt (phần dành cho bookkeeping); trần là net.core.rmem_max
+            granted //= 2
+        if granted < size:
+            log.warning("Socket receive buffer is %d bytes, %d requested (raise net.core.rmem_max)",
+                        granted, size)
+        return granted
+
+    def receive(self, timeout):
+        """Wait up to `timeout` seconds, then read every queued datagram (up to the pool size).
+
+        Return the packets as memoryviews of the pool; [] if nothing arrived.
+        """
+        if not self.selector.select(timeout):
+            return []
+        packets = []
+        sock, slotSize = self.sock, self.slotSize
+        for slot in self.slots:
+            try:
+                n = sock.recv_into(slot, slotSize, MSG_TRUNC)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as e:
+                # Windows: gói lớn hơn slot báo lỗi thay vì MSG_TRUNC
+                if e.errno in (errno.EMSGSIZE, getattr(errno, 'WSAEMSGSIZE', None)):
+                    self.truncated += 1
+                    continue
+                # Windows: ICMP port unreachable của lần gửi trước
+                if e.errno in (errno.ECONNREFUSED, getattr(errno, 'WSAECONNRESET', None)):
+                    continue
+                raise
+            if n > slotSize:
+                self.truncated += 1
+                continue
+            packets.append(slot[:n])
+        if packets:
+            self.packets += len(packets)
+            self.batches += 1
+            self.maxBatch = max(self.maxBatch, len(packets))
+        return packets
+
+    def socketInode(self):
+        try:
+            return os.fstat(self.sock.fileno()).st_ino
+        except OSError:
+            return None
+
+    def kernelDrops(self):
+        """Datagrams the kernel dropped on this socket (receive buffer full); None if unknown."""
+        if self.inode is None:
+            return None
+        for table in ('/proc/net/udp', '/proc/net/udp6'):
+            try:
+                with open(table) as f:
+                    next(f)
+                    for line in f:
+                        fields = line.split()
+                        # sl local rem st tx:rx tr:when retrnsmt uid timeout inode ref pointer drops
+                        if len(fields) >= 13 and fields[9] == str(self.inode):
+                            return int(fields[12])
+            except (OSError, ValueError, StopIteration):
+                continue
+        return None
+
+    def stats(self):
+        return {'rcvbuf': self.rcvbuf, 'packets': self.packets, 'batches': self.batches,
+                'maxBatch': self.maxBatch, 'truncated': self.truncated, 'kernelDrops': self.kernelDrops()}
+
+    def close(self):
+        self.selector.close()
@@ -0,0 +1,114 @@
+# RtspParser.py
+# Tách luồng byte TCP của RTSP thành từng message hoàn chỉnh. Một recv() có thể chỉ chứa
+# nửa request (SETUP dài) hoặc nhiều request liền nhau (pipelining), nên byte được gom
+# vào buffer và chỉ cắt ra message khi đã có dòng trống kết thúc header và đủ body theo
+# Content-Length. Dòng kết thúc bằng \r\n hoặc \n đều được chấp nhận.
+# RTP/RTCP interleaved (RFC 2326 mục 10.12) đi chung kết nối: '$', kênh, độ dài 16 bit, packet.
+
+import struct
+
+INTERLEAVED = struct.Struct('!BBH')
+DOLLAR = 0x24
+MAX_HEADER = 16 * 1024      # header dài hơn mà chưa có dòng trống: client lỗi
+MAX_BODY = 1024 * 1024
+
+
+class RtspMessage:
+    """One RTSP request or reply: start line, header lines (without line ends) and body."""
+
+    def __init__(self, startLine, headers, body=''):
+        self.startLine = startLine
+        self.headers = headers
+        self.body = body
+
+    @property
+    def lines(self):
+        return [self.startLine] + self.headers
+
+    def header(self, name, default=None):
+        """Value of the first header called `name` (case-insensitive)."""
+        prefix = name.lower() + ':'
+        for line in self.headers:
+            if line.lower().startswith(prefix):
+                return line[len(prefix):].strip()
+        return default
+
+    def __str__(self):
+        return '\n'.join(self.lines) + '\n\n' + self.body
+
+
+class InterleavedFrame:
+    """One RTP/RTCP packet carried on the RTSP connection (`$` framing)."""
+
+    def __init__(self, channel, data):
+        self.channel = channel
+        self.data = data
+
+
+def interleavedHeader(channel, length):
+    """The 4-byte `$` header in front of an interleaved packet."""
+    return INTERLEAVED.pack(DOLLAR, channel, length)
+
+
+class RtspParser:
+    """Incremental parser: feed() raw bytes, get back the messages completed so far
+    (RtspMessage, or InterleavedFrame for `$`-framed media)."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """Append `data`; return the complete messages in order (ValueError if malformed)."""
+        self.buffer += data
+        messages = []
+        while True:
+            message = self.next()
+            if message is None:
+                return messages
+            messages.append(message)
+
+    def next(self):
+        buffer = self.buffer
+        # Dòng trống giữa các message (CRLF keepalive) bị bỏ qua
+        blank = 0
+        while blank < len(buffer) and buffer[blank] in b'\r\n':
+            blank += 1
+        if blank:
+            del buffer[:blank]
+
+        if buffer[:1] == b'$':
+            if len(buffer) < INTERLEAVED.size:
+                return None
+            _, channel, length = INTERLEAVED.unpack_from(buffer)
+            end = INTERLEAVED.size + length
+            if len(buffer) < end:
+                return None
+            data = bytes(buffer[INTERLEAVED.size:end])
+            del buffer[:end]
+            return InterleavedFrame(channel, data)
+
+        end, separator = self.headerEnd()
+        if end < 0:
+            if len(buffer) > MAX_HEADER:
+                raise ValueError("RTSP header too long")
+            return None
+
+        lines = [line.rstrip('\r') for line in buffer[:end].decode('utf-8', 'replace').split('\n')]
+        length = 0
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            if name.strip().lower() == 'content-length':
+                length = int(value)
+                if not 0 <= length <= MAX_BODY:
+                    raise ValueError(f"bad Content-Length {length}")
+        start = end + separator
+        if len(buffer) < start + length:
+            return None
+        body = buffer[start:start + length].decode('utf-8', 'replace')
+        del buffer[:start + length]
+        return RtspMessage(lines[0], lines[1:], body)
+
+    def headerEnd(self):
+        """(offset, length) of the blank line ending the header, or (-1, 0)."""
+        found = [(i, n) for i, n in ((self.buffer.find(b'\n\n'), 2), (self.buffer.find(b'\n\r\n'), 3)) if i >= 0]
+        return min(found) if found else (-1, 0)
@@ -1,24 +1,111 @@
-import sys, socket
+import os, signal, socket, argparse, logging
 
 from ServerWorker import ServerWorker
+from FrameCache import sharedCache
+from Metrics import startMetricsServer
+from Supervisor import Supervisor, reusePortSupported
+from Sessions import sessions
+from RateControl import shutdownPool
+
+class Server:
 
-class Server:	
-	
 	def main(self):
-		try:
-			SERVER_PORT = int(sys.argv[1])
-		except:
-			print("[Usage: Server.py Server_port]\n")
-		
+		parser = argparse.ArgumentParser(usage="Server.py Server_port [options]")
+		parser.add_argument('port', type=int, help="RTSP port")
+		parser.add_argument('--async', dest='useAsync', action='store_true',
+							help="serve every session from one asyncio event loop")
+		parser.add_argument('--cache-mb', type=int, default=sharedCache.budget // (1024 * 1024),
+							help="budget of the shared frame cache in MB (0 disables it)")
+		parser.add_argument('--frame-rate', type=float, default=None,
+							help="default session frame rate (default: the file's own rate)")
+		parser.add_argument('--peak-mbps', dest='peak_rate', type=lambda v: float(v) * 1e6, default=None,
+							help="default per-session peak send rate in Mbit/s")
+		parser.add_argument('--spread', type=float, default=0.8,
+							help="fraction of the frame interval used to spread a frame's packets")
+		parser.add_argument('--rtx-mbps', dest='rtx_rate', type=lambda v: float(v) * 1e6, default=2e6,
+							help="per-session cap on NACK retransmissions in Mbit/s (0 disables them)")
+		parser.add_argument('--adapt', choices=('off', 'skip', 'recompress'), default='recompress',
+							help="react to receiver reports by skipping frames and/or recompressing JPEGs")
+		parser.add_argument('--broadcast', action='store_true',
+							help="live channels: read and packetize each file once for all its viewers")
+		parser.add_argument('--tcp-fallback', type=float, default=3.0,
+							help="switch a UDP session to interleaved TCP if no RTCP arrives within this many seconds of PLAY (0 = never)")
+		parser.add_argument('--no-hints', dest='hints', action='store_false',
+							help="ignore .hint files and packetize every frame at send time")
+		parser.add_argument('--session-timeout', type=int, default=sessions.timeout,
+							help="close sessions with no RTSP request or RTCP report for this many seconds (0 = never)")
+		parser.add_argument('--max-sessions', type=int, default=0,
+							help="refuse SETUP with 453 Not Enough Bandwidth beyond this many sessions (0 = no limit)")
+		parser.add_argument('--max-mbps', dest='max_rate', type=lambda v: float(v) * 1e6, default=0.0,
+							help="refuse SETUP with 453 when the sessions' average bit rates would exceed this (0 = no limit)")
+		parser.add_argument('--workers', type=int, default=1,
+							help="worker processes accepting on the same port (SO_REUSEPORT), restarted if they crash")
+		parser.add_argument('--metrics-port', type=int, default=None,
+							help="serve Prometheus metrics over HTTP on this port (worker N: port + N)")
+		parser.add_argument('--log-level', default='info', choices=('debug', 'info', 'warning', 'error', 'off'),
+							help="debug logs every frame and RTSP message; off disables logging")
+		args = parser.parse_args()
+
+		logName = "%(processName)s %(name)s" if args.workers > 1 else "%(name)s"
+		logging.basicConfig(level=logging.CRITICAL if args.log_level == 'off' else args.log_level.upper(),
+							format=f"%(asctime)s %(levelname)s [{logName}] %(message)s")
+		if args.log_level == 'off':
+			logging.disable(logging.CRITICAL)
+
+		if args.workers > 1:
+			if not reusePortSupported():
+				parser.error("--workers needs SO_REUSEPORT, which this platform does not have")
+			# Frame của file đang xem nằm một lần trong shared memory cho mọi worker
+			store = None
+			if args.cache_mb > 0:
+				from FrameStore import SharedFrameStore
+				store = SharedFrameStore(args.cache_mb * 1024 * 1024)
+			try:
+				Supervisor(args.workers, serveWorker, (args, store)).run()
+			finally:
+				if store is not None:
+					store.unlinkAll()
+			return
+
+		sharedCache.setBudget(args.cache_mb * 1024 * 1024)
+		if args.metrics_port is not None:
+			startMetricsServer(args.metrics_port)
+		self.serve(args)
+
+	def serve(self, args, reusePort=False):
+		SERVER_PORT = args.port
+		sessions.configure(args.session_timeout, args.max_sessions, args.max_rate)
+		sessions.start()
+		if args.useAsync:
+			from AsyncServer import AsyncServer
+			AsyncServer(SERVER_PORT, options=args, reusePort=reusePort).run()
+			return
+
 		rtspSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		if reusePort:
+			rtspSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
 		rtspSocket.bind(('', SERVER_PORT))
-		rtspSocket.listen(5)        
+		rtspSocket.listen(5)
 
 		# Receive client info (address,port) through RTSP/TCP session
 		while True:
 			clientInfo = {}
 			clientInfo['rtspSocket'] = rtspSocket.accept()
-			ServerWorker(clientInfo).run()		
+			clientInfo['options'] = args
+			ServerWorker(clientInfo).run()
+
+
+def serveWorker(number, args, store):
+	"""Entry point of one worker process started by the Supervisor."""
+	# SIGTERM từ supervisor: dừng pool nén lại JPEG (process con của worker) rồi thoát
+	signal.signal(signal.SIGTERM, lambda *_: (shutdownPool(), os._exit(0)))
+	if store is not None:
+		sharedCache.useStore(store)
+	else:
+		sharedCache.setBudget(0)
+	if args.metrics_port is not None:
+		startMetricsServer(args.metrics_port + number)
+	Server().serve(args, reusePort=True)
 
 if __name__ == "__main__":
-	(Server()).main()
\ No newline at end of file
+	(Server()).main()
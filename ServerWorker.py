@@ -1,14 +1,37 @@
 from random import randint
-import sys, traceback, threading, socket
+import sys, traceback, threading, socket, logging, queue
+from time import monotonic, perf_counter
 
-from VideoLoader import load_video
-from RtpPacket import RtpPacket
+from VideoLoader import load_video, load_manifest
+from RtpPacket import RtpPacket, RtpPacketizer, HintedPacketizer, packetLength
+from Hint import load_hint
+from FrameCache import sharedCache
+from Pacer import FramePacer, TokenBucket
+from Channel import channels
+from Fec import FecEncoder
+from Rtcp import (rtcpListener, PacketHistory, parseCompound, parseNack, parseReceiverReport,
+                  PT_RR, PT_RTPFB, FMT_NACK)
+from RateControl import RateController
+from Metrics import metrics
+from Sessions import sessions
+from RtspParser import RtspParser, InterleavedFrame, interleavedHeader
+
+log = logging.getLogger(__name__)
+
+IOV_MAX = 512       # số buffer tối đa cho một lần sendmsg
+TCP_BACKLOG = 2 * 1024 * 1024   # byte chờ gửi tối đa của một session interleaved
+SCATTER_GATHER = hasattr(socket.socket, 'sendmsg')    # không có trên Windows: bỏ qua hint track
 
 class ServerWorker:
+    OPTIONS = 'OPTIONS'
+    DESCRIBE = 'DESCRIBE'
     SETUP = 'SETUP'
     PLAY = 'PLAY'
     PAUSE = 'PAUSE'
     TEARDOWN = 'TEARDOWN'
+    SET_PARAMETER = 'SET_PARAMETER'
+    GET_PARAMETER = 'GET_PARAMETER'
+    METHODS = (OPTIONS, DESCRIBE, SETUP, PLAY, PAUSE, TEARDOWN, GET_PARAMETER, SET_PARAMETER)
     
     INIT = 0
     READY = 1
@@ -18,14 +41,85 @@ class ServerWorker:
     OK_200 = 0
     FILE_NOT_FOUND_404 = 1
     CON_ERR_500 = 2
+    BAD_RANGE_457 = 3
+    PARAM_NOT_UNDERSTOOD_451 = 4
+    BAD_REQUEST_400 = 5
+    METHOD_NOT_VALID_455 = 6
+    NOT_IMPLEMENTED_501 = 7
+    HEADER_NOT_VALID_456 = 8
+    NOT_ENOUGH_BANDWIDTH_453 = 9
+    UNSUPPORTED_TRANSPORT_461 = 10
+
+    STATUS = {
+        OK_200: '200 OK',
+        BAD_REQUEST_400: '400 Bad Request',
+        FILE_NOT_FOUND_404: '404 Not Found',
+        PARAM_NOT_UNDERSTOOD_451: '451 Parameter Not Understood',
+        NOT_ENOUGH_BANDWIDTH_453: '453 Not Enough Bandwidth',
+        HEADER_NOT_VALID_456: '456 Header Field Not Valid for Resource',
+        METHOD_NOT_VALID_455: '455 Method Not Valid in This State',
+        BAD_RANGE_457: '457 Invalid Range',
+        UNSUPPORTED_TRANSPORT_461: '461 Unsupported Transport',
+        CON_ERR_500: '500 Internal Server Error',
+        NOT_IMPLEMENTED_501: '501 Not Implemented',
+    }
     
     clientInfo = {}
     
     def __init__(self, clientInfo):
         self.clientInfo = clientInfo
+        self.parser = RtspParser()    # gom byte RTSP thành từng request hoàn chỉnh
+        self.writeLock = threading.Lock()   # reply RTSP và RTP interleaved ghi chung socket
+        self.lastSeen = monotonic()   # request RTSP / gói RTCP gần nhất (session timeout)
+        self.expiring = False     # đã hết hạn, kết nối đang được đóng
+        self.tcpDropped = 0       # packet interleaved bỏ vì client đọc TCP không kịp
+        self.relayLock = threading.Lock()
+        self.newSession()
+        sessions.add(self)
+
+    def newSession(self):
+        """Per-session state, reset after TEARDOWN so the connection can SETUP again."""
+        self.state = self.INIT
+        self.interleaved = None   # (kênh RTP, kênh RTCP) khi media đi trên kết nối RTSP
+        self.tcpChannels = None   # kênh interleaved client chấp nhận (dự phòng cho UDP)
+        self.fallbackAt = None    # chưa có RTCP qua UDP tới lúc này thì chuyển sang TCP
+        self.rtcpReceived = 0
         self.seqNum = 0           # seq cho mọi gói RTP
         self.bytesSent = 0
         self.packetsSent = 0
+        self.framesSent = 0
+        self.ssrc = randint(0, 0xFFFFFFFF)
+        self.tsBase = randint(0, 0xFFFFFFFF)  # offset ngẫu nhiên của RTP timestamp (RFC 3550)
+        self.packetizer = RtpPacketizer(maxPayload=1300, pt=26, ssrc=self.ssrc)  # 1300 bytes, dưới MTU
+        self.hinted = HintedPacketizer(pt=26, ssrc=self.ssrc)  # frame có file .hint: chỉ ghi header
+        self.framesHinted = 0
+        self.hintFor = (None, None)   # (stream, hint track) tra lần gần nhất
+        self.channel = None       # chế độ broadcast: channel của file đang xem
+        self.rtpAddress = None    # đích UDP channel gửi tới (đặt khi PLAY)
+        self.relay = None         # broadcast qua TCP: hàng packet chờ thread gửi của session
+        self.relayBytes = 0
+        self.pacer = None
+        self.fec = None           # FecEncoder nếu client xin FEC trong Transport (fec=K)
+        self.history = None       # packet vừa gửi, để gửi lại khi client NACK
+        self.rtxBucket = None
+        self.rtxSent = 0
+        self.rtxMissed = 0        # seq đã rời vòng đệm
+        self.rtxDropped = 0       # vượt giới hạn tốc độ gửi lại
+        self.rate = None          # RateController theo receiver report của client
+        self.recompressing = None # (future, frame gốc) của frame đang nén lại
+        self.lastReport = None    # (fraction lost, cumulative lost, highest seq, jitter)
+        self.manifest = None      # manifest các rendition (Ingest.py) của file đang xem
+        self.rendition = None     # rendition đang gửi (None: chính file nguồn)
+        self.pendingRendition = None  # đổi sang rendition này ở ranh giới frame kế tiếp
+        self.sendQueue = []       # packet của frame đang gửi dở
+        self.sendTimes = []       # thời điểm gửi của từng packet (monotonic)
+        self.sendPos = 0
+        self.scale = 1.0          # PLAY Scale: >1 tua nhanh, <0 tua lùi (chọn mỗi N frame)
+        self.position = 0.0       # frame (0-based) gửi tiếp theo khi scale != 1
+        self.playFrame = 0        # frame đầu của lần PLAY hiện tại
+        self.playTs = self.tsBase # RTP timestamp của frame đó
+        self.lastTs = None        # RTP timestamp của frame gửi gần nhất
+        self.pendingScale = None  # đổi sang scale này ở ranh giới frame kế tiếp
     
     def run(self):
         threading.Thread(target=self.recvRtspRequest).start()
@@ -33,121 +127,763 @@ class ServerWorker:
     def recvRtspRequest(self):
         """Receive RTSP request from the client."""
         connSocket = self.clientInfo['rtspSocket'][0]
-        while True:            
-            data = connSocket.recv(256)
-            if data:
-                print("Data received:\n" + data.decode("utf-8"))
-                self.processRtspRequest(data.decode("utf-8"))
+        while True:
+            try:
+                data = connSocket.recv(4096)
+            except OSError:
+                break
+            if not data or not self.feedRtsp(data):
+                break
+        # Client ngắt kết nối, request hỏng hoặc session hết hạn: giải phóng mọi thứ của session
+        self.close()
+        connSocket.close()
+
+    def feedRtsp(self, data):
+        """Process every request completed by `data`, in order; False if the stream is unparsable."""
+        messages = self.parseRtsp(data)
+        if messages is None:
+            return False
+        for message in messages:
+            self.handleMessage(message)
+        return True
+
+    def parseRtsp(self, data):
+        """Messages completed by `data`, or None (after a 400 reply) if the stream is unparsable."""
+        try:
+            return self.parser.feed(data)
+        except ValueError as e:
+            log.warning("Bad RTSP request: %s", e)
+            self.replyRtsp(self.BAD_REQUEST_400, 0)
+            return None
+
+    def handleMessage(self, message):
+        """Dispatch one parsed message: an interleaved RTCP frame or an RTSP request."""
+        if isinstance(message, InterleavedFrame):
+            self.onInterleaved(message)
+            return
+        log.debug("Data received:\n%s", message)
+        self.lastSeen = monotonic()
+        self.processRtspRequest(message)
     
-    def processRtspRequest(self, data):
-        """Process RTSP request sent from the client."""
-        lines = data.split('\n')
-        line1 = lines[0].split(' ')
+    def processRtspRequest(self, message):
+        """Process one RTSP request (an RtspMessage) sent from the client."""
+        lines = message.lines
+        line1 = message.startLine.split(' ')
+        seqNum = message.header('CSeq', '0')
+        if len(line1) < 2:
+            self.replyRtsp(self.BAD_REQUEST_400, seqNum)
+            return
         requestType = line1[0]
-        filename = line1[1]
+        filename = self.requestPath(line1[1])
+        
+        if requestType == self.OPTIONS:
+            self.replyRtsp(self.OK_200, seqNum, {'Public': ', '.join(self.METHODS)})
         
-        seqLine = lines[1].split(' ')
-        seqNum = seqLine[1] if len(seqLine) > 1 else "1"
+        elif requestType == self.DESCRIBE:
+            try:
+                sdp = self.describe(filename)
+            except IOError:
+                log.warning("File %s not found", filename)
+                self.replyRtsp(self.FILE_NOT_FOUND_404, seqNum)
+                return
+            except ValueError as e:
+                log.warning("Cannot describe %s: %s", filename, e)
+                self.replyRtsp(self.CON_ERR_500, seqNum)
+                return
+            self.replyRtsp(self.OK_200, seqNum, {'Content-Type': 'application/sdp'}, sdp)
         
-        if requestType == self.SETUP:
+        elif requestType == self.SETUP:
             if self.state == self.INIT:
-                print("processing SETUP\n")
+                log.info("SETUP %s", filename)
                 
+                rendition = self.getHeader(lines, 'X-Rendition')
                 try:
-                    self.clientInfo['videoStream'] = load_video(filename)
+                    self.clientInfo['videoStream'] = self.openStream(filename, rendition)
                     self.state = self.READY
                 except IOError:
-                    print(f"File {filename} not found")
+                    log.warning("File %s not found", filename)
                     self.replyRtsp(self.FILE_NOT_FOUND_404, seqNum)
                     return
+                except KeyError:
+                    log.warning("Unknown rendition %s of %s", rendition, filename)
+                    self.replyRtsp(self.PARAM_NOT_UNDERSTOOD_451, seqNum)
+                    return
+                except ValueError as e:
+                    log.warning("Cannot open %s: %s", filename, e)
+                    self.replyRtsp(self.CON_ERR_500, seqNum)
+                    return
+                self.clientInfo['fileName'] = filename
                 
+                self.pacer = self.makePacer(lines)
+                if not sessions.admit(self, self.streamRate()):
+                    log.warning("Server full, refusing SETUP %s", filename)
+                    self.release()
+                    self.replyRtsp(self.NOT_ENOUGH_BANDWIDTH_453, seqNum)
+                    return
                 self.clientInfo['session'] = randint(100000, 999999)
                 
-                for line in lines:
-                    if 'Transport:' in line:
-                        parts = line.split(';')
-                        for part in parts:
-                            if 'client_port' in part:
-                                port_str = part.split('=')[1].strip()
+                fecGroup = 0
+                nack = False
+                # Các transport client chấp nhận, theo thứ tự ưu tiên, cách nhau bởi dấu phẩy
+                offers = [spec.split(';') for spec in (self.getHeader(lines, 'Transport') or '').split(',')]
+                for parts in offers[1:]:
+                    if self.isInterleaved(parts):
+                        self.tcpChannels = self.interleavedChannels(parts)
+                        break
+                if self.isInterleaved(offers[0]):
+                    self.interleaved = self.tcpChannels = self.interleavedChannels(offers[0])
+                else:
+                    for part in offers[0]:
+                        if 'client_port' in part:
+                            port_str = part.split('=')[1].strip()
+                            try:
                                 if '-' in port_str:
-                                    self.clientInfo['rtpPort'] = port_str.split('-')[0]
+                                    rtpPort, rtcpPort = map(int, port_str.split('-')[:2])
                                 else:
-                                    self.clientInfo['rtpPort'] = port_str
-                                break
-                        break
+                                    rtpPort = int(port_str)
+                                    rtcpPort = rtpPort + 1
+                            except ValueError:
+                                continue
+                            self.clientInfo['rtpPort'], self.clientInfo['rtcpPort'] = rtpPort, rtcpPort
+                        elif part.strip() == 'nack':
+                            nack = True
+                        elif part.strip().startswith('fec='):
+                            try:
+                                fecGroup = int(part.split('=')[1])
+                            except ValueError:
+                                log.warning("Ignoring invalid FEC group size")
+                    if 'rtpPort' not in self.clientInfo:
+                        # UDP mà không có client_port dùng được: không biết gửi RTP về đâu
+                        log.warning("SETUP %s without a usable client_port", filename)
+                        self.release()
+                        self.replyRtsp(self.UNSUPPORTED_TRANSPORT_461, seqNum)
+                        return
                 
-                print(f"RTP port: {self.clientInfo['rtpPort']}")
-                self.replyRtsp(self.OK_200, seqNum)
+                headers = self.rangeHeader(0)
+                headers['X-Frame-Rate'] = f"{1 / self.pacer.interval:.3f}"
+                if self.interleaved is not None:
+                    log.debug("Interleaved channels: %d-%d", *self.interleaved)
+                    transport = f"RTP/AVP/TCP;interleaved={self.interleaved[0]}-{self.interleaved[1]}"
+                else:
+                    log.debug("RTP port: %s", self.clientInfo['rtpPort'])
+                    rtpPort, rtcpPort = self.serverPorts()
+                    transport = (f"RTP/UDP; client_port={self.clientInfo['rtpPort']}-{self.clientInfo['rtcpPort']}"
+                                 f"; server_port={rtpPort}-{rtcpPort}")
+                self.feedback().register(self)
+                rtxRate = self.option('rtx_rate', 2e6)
+                # TCP không mất gói: NACK / FEC chỉ dùng cho UDP
+                if nack and self.channel is None and self.interleaved is None and rtxRate > 0:
+                    # Gửi lại có giới hạn tốc độ để không làm nghẽn mạng thêm
+                    self.history = PacketHistory(pt=self.packetizer.pt)
+                    self.rtxBucket = TokenBucket(rtxRate / 8, 32 * 1500)
+                    transport += "; nack"
+                adapt = self.option('adapt', 'recompress')
+                if self.channel is None and adapt != 'off':
+                    names = [r['name'] for r in self.manifest['renditions']] if self.manifest else None
+                    self.rate = RateController(recompress=adapt == 'recompress', renditions=names)
+                    if self.rendition is not None:
+                        self.rate.pin(self.rendition)
+                if self.manifest is not None:
+                    headers['X-Renditions'] = ','.join(r['name'] for r in self.manifest['renditions'])
+                    if self.rendition is not None:
+                        headers['X-Rendition'] = self.rendition
+                # FEC chỉ cho session riêng: channel gửi chung packet cho mọi người xem
+                if fecGroup > 1 and self.channel is None and self.interleaved is None:
+                    self.fec = FecEncoder(fecGroup, ssrc=self.ssrc)
+                    transport += f"; fec={self.fec.groupSize}"
+                headers['Transport'] = transport
+                metrics.register(self)
+                self.replyRtsp(self.OK_200, seqNum, headers)
+            else:
+                self.replyRtsp(self.METHOD_NOT_VALID_455, seqNum)
         
         elif requestType == self.PLAY:
-            if self.state == self.READY:
-                print("processing PLAY\n")
+            # PLAY khi đang phát: đổi vị trí / tốc độ mà không cần PAUSE
+            if self.state in (self.READY, self.PLAYING):
+                log.info("Session %s: PLAY", self.clientInfo['session'])
+                
+                try:
+                    scale = self.parseScale(self.getHeader(lines, 'Scale'))
+                except ValueError:
+                    self.replyRtsp(self.HEADER_NOT_VALID_456, seqNum)
+                    return
+                rangeValue = self.getHeader(lines, 'Range')
+                wasPlaying = self.state == self.PLAYING
+                if wasPlaying and rangeValue is None and self.channel is None:
+                    # Chỉ đổi tốc độ: áp dụng ở ranh giới frame kế tiếp (trong pump), không ngắt luồng
+                    self.pendingScale = scale
+                    headers = self.rangeHeader(self.clientInfo['videoStream'].frameNbr() / self.frameRate())
+                    headers['Scale'] = f"{scale:g}"
+                    self.replyRtsp(self.OK_200, seqNum, headers)
+                    return
+                if wasPlaying:
+                    self.stopStreaming(wait=True)
+                
+                if rangeValue is not None and self.channel is None:
+                    try:
+                        self.seekTo(rangeValue, scale)
+                    except ValueError:
+                        self.replyRtsp(self.BAD_RANGE_457, seqNum)
+                        if wasPlaying:
+                            self.startStreaming()
+                        return
+                self.startPlay(scale, rangeValue is not None)
+                
                 self.state = self.PLAYING
                 
-                self.clientInfo["rtpSocket"] = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                fallback = self.option('tcp_fallback', 3.0)
+                if (fallback > 0 and self.interleaved is None and self.tcpChannels is not None
+                        and not self.rtcpReceived and self.channel is None):
+                    self.fallbackAt = monotonic() + fallback
                 
-                self.replyRtsp(self.OK_200, seqNum)
+                headers = self.rangeHeader(self.playFrame / self.frameRate())
+                headers['Scale'] = f"{self.scale:g}"
+                if self.channel is None:
+                    headers['RTP-Info'] = f"url={filename};seq={(self.seqNum + 1) & 0xFFFF};rtptime={self.playTs}"
+                self.replyRtsp(self.OK_200, seqNum, headers)
                 
-                self.clientInfo['event'] = threading.Event()
-                self.clientInfo['worker'] = threading.Thread(target=self.sendRtp) 
-                self.clientInfo['worker'].start()
+                self.startStreaming()
+            else:
+                self.replyRtsp(self.METHOD_NOT_VALID_455, seqNum)
         
         elif requestType == self.PAUSE:
             if self.state == self.PLAYING:
-                print("processing PAUSE\n")
+                log.info("Session %s: PAUSE", self.clientInfo['session'])
                 self.state = self.READY
-                self.clientInfo['event'].set()
+                self.stopStreaming()
                 self.replyRtsp(self.OK_200, seqNum)
+            else:
+                self.replyRtsp(self.METHOD_NOT_VALID_455, seqNum)
+        
+        elif requestType == self.SET_PARAMETER:
+            log.debug("processing SET_PARAMETER")
+            rendition = self.getHeader(lines, 'X-Rendition')
+            names = [r['name'] for r in self.manifest['renditions']] if self.manifest else []
+            if self.state == self.INIT or rendition not in names:
+                self.replyRtsp(self.PARAM_NOT_UNDERSTOOD_451, seqNum)
+                return
+            # Áp dụng ở ranh giới frame kế tiếp (trong pump), cùng số frame ở file mới
+            self.pendingRendition = rendition
+            if self.rate is not None:
+                self.rate.pin(rendition)
+            self.replyRtsp(self.OK_200, seqNum, {'X-Rendition': rendition})
+        
+        elif requestType == self.GET_PARAMETER:
+            # Body rỗng: keepalive. Mỗi dòng của body là tên một tham số cần đọc.
+            names = [line.strip() for line in message.body.splitlines() if line.strip()]
+            try:
+                body = ''.join(self.parameter(name) for name in names)
+            except KeyError:
+                self.replyRtsp(self.PARAM_NOT_UNDERSTOOD_451, seqNum)
+                return
+            self.replyRtsp(self.OK_200, seqNum, {'Content-Type': 'text/parameters'} if body else None, body)
         
         elif requestType == self.TEARDOWN:
-            print("processing TEARDOWN\n")
-            if 'event' in self.clientInfo:
-                self.clientInfo['event'].set()
+            log.info("Session %s: TEARDOWN", self.clientInfo.get('session'))
+            self.stopStreaming()
             self.replyRtsp(self.OK_200, seqNum)
-            if 'rtpSocket' in self.clientInfo:
-                self.clientInfo['rtpSocket'].close()
-            print(f"[Server] Sent {self.packetsSent} RTP packets, {self.bytesSent} bytes in total.")
+            self.release()
+        
+        else:
+            self.replyRtsp(self.NOT_IMPLEMENTED_501, seqNum)
+    
+    def release(self):
+        """Free everything the session holds (sender, sockets, file, channel) and go back to INIT."""
+        session = self.clientInfo.pop('session', None)
+        self.stopStreaming(wait=True)
+        if self.pacer is not None:
+            self.resetPacing()
+        rtpSocket = self.clientInfo.pop('rtpSocket', None)
+        if rtpSocket is not None:
+            rtpSocket.close()
+        self.feedback().unregister(self)
+        metrics.unregister(self)
+        sessions.release(self)
+        stream = self.clientInfo.pop('videoStream', None)
+        if self.channel is not None:
+            channels.leave(self.channel, self)
+        elif stream is not None:
+            stream.close()
+        if self.relay is not None:
+            self.relay.put(None)
+        # Range (endFrame) chỉ có hiệu lực trong session này; scale / vị trí được newSession() đặt lại
+        for key in ('event', 'worker', 'fileName', 'rtpPort', 'rtcpPort', 'endFrame'):
+            self.clientInfo.pop(key, None)
+        
+        if session is not None:
+            log.info("Session %s: sent %d RTP packets, %d frames (%d from hint tracks), %d bytes in total.",
+                     session, self.packetsSent, self.framesSent, self.framesHinted, self.bytesSent)
+            if self.fec is not None:
+                log.info("FEC: group size %d, %d parity packets.", self.fec.groupSize, self.fec.packetsSent)
+            if self.rate is not None:
+                log.info("Rate control: %s, %d frames skipped, %d recompressed.",
+                         self.rate.describe(), self.rate.skipped, self.rate.recompressed)
+            if self.history is not None:
+                log.info("Retransmitted %d packets (%d too old, %d over the rate limit).",
+                         self.rtxSent, self.rtxMissed, self.rtxDropped)
+            log.info("Frame cache: %s", sharedCache.stats())
+        self.newSession()
+
+    def close(self):
+        """The RTSP connection is gone: release the session and forget the connection."""
+        if self.clientInfo.get('session') is not None:
+            log.info("Session %s: connection closed", self.clientInfo['session'])
+        self.release()
+        sessions.remove(self)
+
+    def expire(self):
+        """Called by the session reaper: close the connection, the receive loop then cleans up."""
+        try:
+            self.clientInfo['rtspSocket'][0].shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def streamRate(self):
+        """Average bit rate of the session at its pacer's frame rate (bit/s); 0 if unknown."""
+        index = self.clientInfo['videoStream'].index
+        if index is None or not len(index):
+            return 0.0
+        return sum(index.lengths) / len(index) * 8 / self.pacer.interval
+
+    def openStream(self, filename, rendition=None):
+        """Open the session's video, or join its live channel in broadcast mode."""
+        if self.option('broadcast'):
+            self.channel = channels.join(filename, self, self.clientInfo.get('options'), self.loadVideo)
+            return self.channel.stream
+        stream = self.loadVideo(filename, rendition)
+        try:
+            self.manifest = load_manifest(filename)
+        except ValueError:
+            stream.close()
+            raise
+        if self.manifest is not None and (rendition is not None or filename.endswith('.json')):
+            self.rendition = rendition or self.manifest['renditions'][0]['name']
+        return stream
+
+    def loadVideo(self, filename, rendition=None):
+        """Open a video (or one rendition) for SETUP / DESCRIBE, or a new broadcast channel."""
+        return load_video(filename, rendition)
+
+    def switchRendition(self, name):
+        """Continue from the same frame in another rendition of the manifest."""
+        stream = self.clientInfo['videoStream']
+        try:
+            newStream = load_video(self.clientInfo['fileName'], name)
+        except (IOError, KeyError, ValueError) as e:
+            log.warning("Cannot switch to rendition %s: %s", name, e)
+            return
+        newStream.seek(stream.frameNbr())
+        self.clientInfo['videoStream'] = newStream
+        stream.close()
+        log.info("Session %s: rendition %s -> %s", self.clientInfo['session'], self.rendition or 'source', name)
+        self.rendition = name
+
+    def startStreaming(self):
+        """Start the RTP sender of this session (one thread per PLAY)."""
+        if self.channel is not None:
+            self.channel.subscribe(self)
+            return
+        if 'rtpSocket' not in self.clientInfo:
+            self.clientInfo["rtpSocket"] = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if 'worker' in self.clientInfo:
+            # Thread của lần PLAY trước đã được báo dừng, chờ nó thoát hẳn
+            self.clientInfo['worker'].join()
+        
+        self.resetPacing()
+        self.clientInfo['event'] = threading.Event()
+        self.clientInfo['worker'] = threading.Thread(target=self.sendRtp) 
+        self.clientInfo['worker'].start()
+    
+    def stopStreaming(self, wait=False):
+        """Stop the RTP sender started by startStreaming (and wait for it to exit)."""
+        if self.channel is not None:
+            self.channel.unsubscribe(self)
+            return
+        if 'event' in self.clientInfo:
+            self.clientInfo['event'].set()
+            worker = self.clientInfo.get('worker')
+            if wait and worker is not None and worker is not threading.current_thread():
+                worker.join()
             
     def sendRtp(self):
         """Send RTP packets over UDP (multi-packet per frame cho HD)."""
+        event = self.clientInfo['event']
         while True:
-            self.clientInfo['event'].wait(0.04)  
+            wake = self.pump(monotonic())
+            if wake is None:
+                log.info("Session %s: end of stream", self.clientInfo.get('session'))
+                event.set()
+                break
             
-            if self.clientInfo['event'].isSet():
-                break 
-                
-            frameData = self.clientInfo['videoStream'].nextFrame()
-            if frameData: 
-                frameNumber = self.clientInfo['videoStream'].frameNbr()
+            if event.wait(max(0.0, wake - monotonic())):
+                break
+
+    def resetPacing(self):
+        """Drop any half-sent frame and restart the frame clock from now."""
+        self.sendQueue, self.sendTimes, self.sendPos = [], [], 0
+        if self.recompressing is not None:
+            self.recompressing[0].cancel()
+            self.recompressing = None
+        self.pacer.begin()
+
+    def pump(self, now):
+        """Send every packet due at `now`.
+
+        Return the monotonic time of the next send, or None at end of stream.
+        """
+        if self.sendPos >= len(self.sendQueue):
+            deadline = self.pacer.nextDeadline()
+            if deadline > now:
+                return deadline
+            if self.fallbackAt is not None and now >= self.fallbackAt:
+                self.fallbackAt = None
+                if not self.rtcpReceived:
+                    self.fallBackToTcp()
+            if self.recompressing is None:
+                target = self.pendingRendition
+                if target is None and self.rate is not None and self.rate.rendition() is not None:
+                    target = self.rate.rendition()
+                    if self.rendition is None and target == self.manifest['renditions'][0]['name']:
+                        target = None   # file nguồn đã là bậc cao nhất
+                if target is not None and target != self.rendition:
+                    self.switchRendition(target)
+                self.pendingRendition = None
+                if self.pendingScale is not None:
+                    self.startPlay(self.pendingScale, False)
+                    self.pendingScale = None
+                started = perf_counter()
+                frameData = self.readFrame()
+                metrics.frameRead.observe(perf_counter() - started)
+                if not frameData:
+                    return None
+                if self.rate is not None:
+                    if self.rate.skip(self.clientInfo['videoStream'].frameNbr() - 1):
+                        # Bỏ frame: vẫn tiêu thụ mốc của nó để giữ nhịp
+                        self.pacer.schedule([], now)
+                        return self.pacer.nextDeadline()
+                    future = self.rate.submit(frameData)
+                    if future is not None:
+                        self.recompressing = (future, frameData)
+            exact = True    # frameData đúng là byte trong file (chưa nén lại)
+            if self.recompressing is not None:
+                # Nén lại chạy ở process pool: hỏi lại sau 2 ms, quá nửa interval thì gửi frame gốc
+                future, frameData = self.recompressing
+                if not future.done() and now < deadline + self.pacer.interval / 2:
+                    return now + 0.002
+                self.recompressing = None
+                result = self.rate.result(future, frameData)
+                exact = result is frameData
+                frameData = result
+            started = perf_counter()
+            self.sendQueue = self.packetizeFrame(frameData, exact)
+            metrics.packetize.observe(perf_counter() - started)
+            metrics.lateness.observe(max(0.0, now - deadline))
+            self.sendTimes = self.pacer.schedule([packetLength(p) for p in self.sendQueue], now)
+            self.sendPos = 0
+
+        # Gửi các packet đã tới hạn (cho phép sớm 1 ms để gom lượt ngủ)
+        limit = now + 0.001
+        try:
+            end = self.sendPos
+            while end < len(self.sendQueue) and self.sendTimes[end] <= limit:
+                end += 1
+            if end > self.sendPos:
+                batch = self.sendQueue[self.sendPos:end]
+                self.bytesSent += self.sendPackets(batch, self.rtpDestination())
+                if self.history is not None:
+                    for packet in batch:
+                        self.history.store(packet)
+                self.packetsSent += len(batch)
+                self.sendPos = end
+        except Exception as e:
+            log.warning("Session %s: send error: %s", self.clientInfo.get('session'), e)
+            self.sendPos = len(self.sendQueue)
+
+        if self.sendPos < len(self.sendQueue):
+            return self.sendTimes[self.sendPos]
+        self.framesSent += 1
+        log.debug("Sent frame %d as multiple RTP packets, last seq=%d",
+                  self.clientInfo['videoStream'].frameNbr(), self.seqNum)
+        return self.pacer.nextDeadline()
+
+    def readFrame(self):
+        """Next frame to send, or None at the end of the requested range."""
+        stream = self.clientInfo['videoStream']
+        endFrame = self.clientInfo.get('endFrame')
+        if self.scale != 1:
+            # Tua: nhảy thẳng tới mỗi |scale| frame (MJPEG frame nào cũng là keyframe)
+            frameNbr = int(self.position)
+            if frameNbr < 0 or (stream.index is not None and frameNbr >= len(stream.index)):
+                return None
+            if endFrame is not None and (frameNbr >= endFrame if self.scale > 0 else frameNbr < endFrame):
+                return None
+            self.position += self.scale
+            if stream.frameNbr() != frameNbr:
+                stream.seek(frameNbr)
+        elif endFrame is not None and stream.frameNbr() >= endFrame:
+            return None
+        if self.fec is None and self.hintTrack(stream) is not None:
+            # Gửi theo hint track: payload đọc thẳng từ mmap, không chép frame vào cache
+            return stream.nextFrame()
+        return sharedCache.nextFrame(stream)
+
+    def parseScale(self, value):
+        """Scale header of PLAY (1 when absent); ValueError if zero or not a number."""
+        if value is None:
+            return 1.0
+        scale = float(value)
+        if scale == 0 or scale != scale or abs(scale) > 64:
+            raise ValueError(value)
+        return scale
+
+    def startPlay(self, scale, seeked):
+        """Anchor frame position and RTP time for a PLAY at `scale`.
+
+        RTP time keeps running in output time from the last frame sent, so the
+        client's buffer stays ordered across seeks and speed changes; the RTP-Info
+        of the reply maps it back to media time (npt = start + scale * elapsed).
+        """
+        stream = self.clientInfo['videoStream']
+        self.scale = 1.0 if self.channel is not None else scale
+        self.pendingScale = None
+        start = stream.frameNbr()
+        if self.scale < 0 and not seeked and start > 0:
+            start -= 1          # tua lùi từ frame đang hiển thị
+        self.position = float(start)
+        self.playFrame = start
+        if self.lastTs is not None:
+            self.playTs = (self.lastTs + round(90000 / self.frameRate())) & 0xFFFFFFFF
+        else:
+            self.playTs = (self.tsBase + self.mediaTime(start)) & 0xFFFFFFFF
+
+    def packetizeFrame(self, frameData, exact=True):
+        """Fragment one frame into RTP packets (views valid until the next frame).
+
+        A frame read unchanged from a file with a hint track is sent as
+        (header, payload) pairs straight from the file's mmap.
+        """
+        stream = self.clientInfo['videoStream']
+        frameNbr = stream.frameNbr() - 1
+        elapsed = (self.mediaTime(frameNbr) - self.mediaTime(self.playFrame))
+        timestamp = self.lastTs = (self.playTs + round(elapsed / self.scale)) & 0xFFFFFFFF
+        hint = self.hintTrack(stream) if exact and self.fec is None else None
+        if hint is not None:
+            packets, self.seqNum = self.hinted.packetize(hint, frameNbr, stream.reader, self.seqNum, timestamp)
+            self.framesHinted += 1
+            return packets
+        packets, self.seqNum = self.packetizer.packetize(frameData, self.seqNum, timestamp)
+        if self.fec is not None:
+            return self.fec.protect(packets)
+        return packets
+
+    def hintTrack(self, stream):
+        """Hint track matching the stream's file and packet size, if sends can scatter-gather."""
+        if self.hintFor[0] is stream:
+            return self.hintFor[1]
+        hint = None
+        if SCATTER_GATHER and self.option('hints', True) and stream.index is not None:
+            hint = load_hint(stream.filename, self.packetizer.maxPayload)
+            if hint is not None and len(hint) != len(stream.index):
+                hint = None
+        self.hintFor = (stream, hint)
+        return hint
+
+    def mediaTime(self, frameNbr):
+        """90 kHz media time of a 0-based frame of the session's video."""
+        index = self.clientInfo['videoStream'].index
+        if index is not None:
+            return index.rtpTime(frameNbr)
+        return round(frameNbr * 90000 / self.frameRate())
+
+    def sendPackets(self, packets, address):
+        """Send the due packets of a frame in order; return the number of bytes sent."""
+        if self.interleaved is not None:
+            started = perf_counter()
+            sent = self.sendInterleaved(self.interleaved[0], packets)
+            metrics.send.observe(perf_counter() - started)
+            return sent
+        sent = 0
+        for packet in packets:
+            started = perf_counter()
+            sent += self.sendPacket(packet, address)
+            metrics.send.observe(perf_counter() - started)
+        return sent
+
+    def sendPacket(self, packet, address):
+        """Send one RTP packet; return the number of bytes sent."""
+        if isinstance(packet, tuple):
+            # (header, payload) của hint track: ghép trong kernel, không chép payload
+            return self.clientInfo['rtpSocket'].sendmsg(packet, (), 0, address)
+        return self.clientInfo['rtpSocket'].sendto(packet, address)
+
+    def sendInterleaved(self, channel, packets):
+        """Write packets `$`-framed on the RTSP connection in one vectored write."""
+        chunks = []
+        for packet in packets:
+            chunks.append(interleavedHeader(channel, packetLength(packet)))
+            if isinstance(packet, tuple):
+                chunks.extend(packet)
+            else:
+                chunks.append(packet)
+        self.writeRtsp(chunks)
+        return sum(len(chunk) for chunk in chunks)
+
+    def relayInterleaved(self, channel, packet):
+        """Queue one broadcast packet for the RTSP connection; return its size (0 if dropped).
+
+        Called from the channel's producer thread: the blocking write happens on
+        a sender thread of the session so a slow TCP client holds up nobody else.
+        """
+        with self.relayLock:
+            if self.relayBytes > TCP_BACKLOG:
+                self.dropInterleaved(1)
+                return 0
+            if self.relay is None:
+                self.relay = queue.SimpleQueue()
+                threading.Thread(target=self.relayLoop, args=(self.relay, channel),
+                                 daemon=True).start()
+            self.relayBytes += len(packet)
+        self.relay.put(packet)
+        return len(packet)
+
+    def relayLoop(self, relay, channel):
+        """Write the queued broadcast packets, all that are waiting in one write, until None."""
+        while True:
+            packets = [relay.get()]
+            while packets[-1] is not None:
                 try:
-                    address = self.clientInfo['rtspSocket'][1][0]
-                    port = int(self.clientInfo['rtpPort'])
+                    packets.append(relay.get_nowait())
+                except queue.Empty:
+                    break
+            done = packets[-1] is None
+            if done:
+                packets.pop()
+            if packets:
+                try:
+                    self.sendInterleaved(channel, packets)
+                except OSError as e:
+                    log.warning("Interleaved send error: %s", e)
+                    return
+                finally:
+                    with self.relayLock:
+                        if relay is self.relay:
+                            self.relayBytes -= sum(len(packet) for packet in packets)
+            if done:
+                return
+
+    def dropInterleaved(self, count):
+        # Client đọc TCP chậm hơn tốc độ phát: bỏ packet thay vì để buffer ghi phình mãi
+        if not self.tcpDropped:
+            log.warning("Session %s: interleaved client is not keeping up, dropping packets",
+                        self.clientInfo.get('session'))
+        self.tcpDropped += count
+
+    def writeRtsp(self, chunks):
+        """Write buffers on the RTSP connection with sendmsg (no join into one copy)."""
+        connSocket = self.clientInfo['rtspSocket'][0]
+        with self.writeLock:
+            if not hasattr(connSocket, 'sendmsg'):     # Windows
+                connSocket.sendall(b''.join(chunks))
+                return
+            views = [memoryview(chunk).cast('B') for chunk in chunks if len(chunk)]
+            i = 0
+            while i < len(views):
+                sent = connSocket.sendmsg(views[i:i + IOV_MAX])
+                # Bỏ các buffer đã gửi hết, cắt phần đã gửi của buffer gửi dở
+                while sent and i < len(views):
+                    if sent >= len(views[i]):
+                        sent -= len(views[i])
+                        i += 1
+                    else:
+                        views[i] = views[i][sent:]
+                        sent = 0
 
-                    max_payload = 1300  # bytes, dưới MTU
-                    offset = 0
-                    total_len = len(frameData)
+    def clientAddress(self):
+        return self.clientInfo['rtspSocket'][1][0]
 
-                    while offset < total_len:
-                        chunk = frameData[offset: offset + max_payload]
-                        offset += max_payload
+    def rtpDestination(self):
+        """UDP address of the client's RTP port (None when media is interleaved)."""
+        if self.interleaved is not None:
+            return None
+        return (self.clientAddress(), int(self.clientInfo['rtpPort']))
 
-                        marker = 1 if offset >= total_len else 0
+    def isInterleaved(self, transport):
+        """Whether a Transport spec (split on ';') asks for RTP over the RTSP connection."""
+        return transport[0].strip().upper().endswith('/TCP')
 
-                        self.seqNum = (self.seqNum + 1) % 65536
-                        packet = self.makeRtp(chunk, self.seqNum, marker)
+    def interleavedChannels(self, transport):
+        """(RTP, RTCP) channels of `interleaved=a-b`, by default 0-1."""
+        for part in transport[1:]:
+            name, _, value = part.strip().partition('=')
+            if name == 'interleaved':
+                first, _, second = value.partition('-')
+                try:
+                    return int(first), int(second) if second else int(first) + 1
+                except ValueError:
+                    break
+        return 0, 1
+
+    def fallBackToTcp(self):
+        """No RTCP came back over UDP: send the rest of the session interleaved."""
+        log.info("Session %s: no receiver report over UDP, switching to interleaved TCP",
+                 self.clientInfo.get('session'))
+        self.interleaved = self.tcpChannels
+        self.history = None
+        self.fec = None
+
+    def onInterleaved(self, frame):
+        """RTCP sent by the client on the interleaved RTCP channel."""
+        if self.tcpChannels is not None and frame.channel == self.tcpChannels[1]:
+            for pt, count, packet in parseCompound(frame.data):
+                self.onRtcp(pt, count, packet, None)
 
-                        sent = self.clientInfo['rtpSocket'].sendto(packet, (address, port))
-                        self.packetsSent += 1
-                        self.bytesSent += sent
+    def serverPorts(self):
+        """(RTP, RTCP) ports of this session on the server side."""
+        if self.channel is not None:
+            rtpSocket = self.channel.rtpSocket
+        else:
+            if 'rtpSocket' not in self.clientInfo:
+                self.clientInfo['rtpSocket'] = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self.clientInfo['rtpSocket'].bind(('', 0))
+            rtpSocket = self.clientInfo['rtpSocket']
+        return rtpSocket.getsockname()[1], self.feedback().port
 
-                    print(f"Sent frame {frameNumber} as multiple RTP packets, last seq={self.seqNum}")
+    def feedback(self):
+        """RTCP receiver shared by the sessions of this server."""
+        return rtcpListener.start()
 
-                except Exception as e:
-                    print(f"Connection Error: {e}")
+    def onRtcp(self, pt, count, packet, address):
+        """Handle one RTCP packet about this session's stream."""
+        self.rtcpReceived += 1
+        self.lastSeen = monotonic()     # receiver report cũng giữ session sống (RFC 2326 mục 12.37)
+        if pt == PT_RTPFB and count == FMT_NACK:
+            self.retransmit(parseNack(packet))
+        elif pt == PT_RR and count >= 1:
+            self.lastReport = parseReceiverReport(packet)
+            fractionLost, _, _, jitter = self.lastReport
+            if self.rate is not None and self.rate.onReport(fractionLost, jitter / 90000, monotonic()):
+                log.info("Session %s: loss %.1f%%, jitter %.1f ms -> %s", self.clientInfo.get('session'),
+                         fractionLost * 100, jitter / 90, self.rate.describe())
+
+    def retransmit(self, seqs):
+        """Resend the NACKed packets still in the history, within the rtx rate limit."""
+        if self.history is None or self.state != self.PLAYING:
+            return
+        address = self.rtpDestination()
+        now = monotonic()
+        for seq in seqs:
+            packet = self.history.get(seq)
+            if packet is None:
+                self.rtxMissed += 1
+            elif not self.rtxBucket.take(len(packet), now):
+                self.rtxDropped += 1
             else:
-                print("End of stream, stopping stream...")
-                self.clientInfo['event'].set()
-                break
+                try:
+                    self.bytesSent += self.sendPacket(packet, address)
+                except OSError as e:
+                    log.warning("Retransmission error: %s", e)
+                    return
+                self.rtxSent += 1
 
     def makeRtp(self, payload, seqnum, marker):
         """RTP-packetize the video data."""
@@ -163,14 +899,148 @@ class ServerWorker:
         
         return rtpPacket.getPacket()
         
-    def replyRtsp(self, code, seq):
-        """Send RTSP reply to the client."""
+    def option(self, name, default=None):
+        """Server-wide option from the command line (clientInfo['options'])."""
+        value = getattr(self.clientInfo.get('options'), name, None)
+        return default if value is None else value
+
+    def makePacer(self, lines):
+        """Session pacer; X-Frame-Rate / X-Peak-Rate (bit/s) override server defaults."""
+        frameRate = self.option('frame_rate', self.frameRate())
+        peakRate = self.option('peak_rate')
+        try:
+            value = self.getHeader(lines, 'X-Frame-Rate')
+            if value:
+                frameRate = float(value)
+            value = self.getHeader(lines, 'X-Peak-Rate')
+            if value:
+                peakRate = float(value)
+        except ValueError:
+            log.warning("Ignoring invalid pacing header")
+        if frameRate <= 0:
+            frameRate = self.frameRate()
+        return FramePacer(frameRate, peakRate, spread=self.option('spread', 0.8))
+
+    def getHeader(self, lines, name):
+        """Return the value of an RTSP header, or None if it is absent."""
+        prefix = name.lower() + ':'
+        for line in lines[1:]:
+            if line.lower().startswith(prefix):
+                return line[len(prefix):].strip()
+        return None
+
+    def frameRate(self):
+        index = self.clientInfo['videoStream'].index
+        return index.fps if index is not None else 25
+
+    def rangeHeader(self, start):
+        """Range header announcing the playable npt interval."""
+        index = self.clientInfo['videoStream'].index
+        if index is None:
+            return {'Range': f"npt={start:.3f}-"}
+        return {'Range': f"npt={start:.3f}-{index.duration():.3f}"}
+
+    def seekTo(self, rangeValue, scale=1.0):
+        """Apply a `Range: npt=<start>-[<end>]` request to the video stream.
+
+        Both bounds are checked before the stream moves (ValueError: 457). The
+        end may not come before the start in the playing direction (scale < 0
+        plays backwards, towards a smaller end).
+        """
+        if not rangeValue.startswith('npt='):
+            raise ValueError(rangeValue)
+        start, _, end = rangeValue[4:].partition('-')
+        start, end = start.strip(), end.strip()
+
+        stream = self.clientInfo['videoStream']
+        limit = stream.index.duration() if stream.index is not None else sys.float_info.max
+
+        def seconds(value):
+            value = float(value)
+            if not 0 <= value <= limit:     # cả nan / inf
+                raise ValueError(rangeValue)
+            return value
+
+        startSec = seconds(start) if start and start != 'now' else None
+        endSec = seconds(end) if end else None
+        if endSec is not None:
+            origin = startSec if startSec is not None else stream.frameNbr() / self.frameRate()
+            if endSec < origin if scale > 0 else endSec > origin:
+                raise ValueError(rangeValue)
+
+        if startSec is not None:
+            if stream.index is not None:
+                stream.seek(stream.index.frameAt(startSec))
+            else:
+                stream.seek(int(startSec * self.frameRate()))
+        self.clientInfo['endFrame'] = int(endSec * self.frameRate()) if endSec is not None else None
+
+    def requestPath(self, uri):
+        """File name of a request URI: `movie.mjpeg` or `rtsp://host[:port]/movie.mjpeg`."""
+        if uri.lower().startswith('rtsp://'):
+            return uri[7:].partition('/')[2] or uri
+        return uri
+
+    def describe(self, filename):
+        """SDP (RFC 4566) of a video: one MJPEG stream (PT 26) under aggregate control."""
+        stream = self.loadVideo(filename)
+        try:
+            index = stream.index
+            fps = index.fps if index is not None else 25
+            end = f"{index.duration():.3f}" if index is not None else ''
+        finally:
+            stream.close()
+        try:
+            address = self.clientInfo['rtspSocket'][0].getsockname()[0]
+        except (OSError, AttributeError):
+            address = '0.0.0.0'
+        lines = [
+            "v=0",
+            f"o=- {randint(100000, 999999)} 1 IN IP4 {address}",
+            f"s={filename}",
+            "c=IN IP4 0.0.0.0",
+            "t=0 0",
+            "a=control:*",
+            f"a=range:npt=0-{end}",
+            "m=video 0 RTP/AVP 26",
+            "a=rtpmap:26 JPEG/90000",
+            f"a=framerate:{fps:g}",
+        ]
+        manifest = load_manifest(filename)
+        if manifest is not None:
+            lines.append("a=x-renditions:" + ','.join(r['name'] for r in manifest['renditions']))
+        return '\r\n'.join(lines) + '\r\n'
+
+    def parameter(self, name):
+        """`name: value` line(s) answering GET_PARAMETER; KeyError if unknown."""
+        if name == 'metrics':
+            return metrics.render()     # toàn bộ server, định dạng Prometheus
+        values = {
+            'state': ('init', 'ready', 'playing')[self.state],
+            'packets_sent': self.packetsSent,
+            'bytes_sent': self.bytesSent,
+            'frames_sent': self.framesSent,
+            'rtx_sent': self.rtxSent,
+        }
+        return f"{name}: {values[name]}\n"
+
+    def replyRtsp(self, code, seq, headers=None, body=''):
+        """Send RTSP reply to the client (every request gets one, in order)."""
+        reply = f"RTSP/1.0 {self.STATUS[code]}\nCSeq: {seq}\n"
+        if 'session' in self.clientInfo:
+            timeout = f";timeout={sessions.timeout}" if sessions.timeout > 0 else ''
+            reply += f"Session: {self.clientInfo['session']}{timeout}\n"
+        for name, value in (headers or {}).items():
+            reply += f"{name}: {value}\n"
+        data = body.encode()
+        if data:
+            reply += f"Content-Length: {len(data)}\n"
+        reply += "\n"
+        self.sendRtspReply(reply.encode() + data)
         if code == self.OK_200:
-            reply = f"RTSP/1.0 200 OK\nCSeq: {seq}\nSession: {self.clientInfo['session']}\n\n"
-            connSocket = self.clientInfo['rtspSocket'][0]
-            connSocket.send(reply.encode())
-            print(f"Sent: {reply}")
-        elif code == self.FILE_NOT_FOUND_404:
-            print("404 NOT FOUND")
-        elif code == self.CON_ERR_500:
-            print("500 CONNECTION ERROR")
+            log.debug("Sent: %s", reply)
+        else:
+            log.warning("%s", self.STATUS[code].upper())
+
+    def sendRtspReply(self, reply):
+        self.writeRtsp([reply])
@@ -0,0 +1,101 @@
+# Sessions.py
+# Vòng đời session của server: mọi kết nối RTSP đang mở, hạn timeout (làm mới bởi mỗi request
+# RTSP và mỗi gói RTCP của session) và giới hạn tải khi SETUP (admission control): quá số
+# session hoặc tổng bitrate cho phép thì trả 453 thay vì làm chậm mọi người xem đang có.
+# Một thread dọn dẹp kiểm tra mỗi giây và đóng kết nối đã hết hạn; worker tự giải phóng
+# file, socket và thread gửi khi kết nối đóng.
+
+import logging, threading
+from time import monotonic
+
+log = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 60        # giây, RFC 2326 mục 12.37
+REAP_INTERVAL = 1.0
+
+
+class SessionManager:
+    """Process-wide registry of RTSP connections with idle timeouts and admission control."""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT):
+        self.timeout = timeout
+        self.maxSessions = 0        # 0 = không giới hạn
+        self.maxRate = 0.0          # bit/s, 0 = không giới hạn
+        self.workers = set()
+        self.admitted = {}          # worker -> bitrate giữ chỗ (bit/s)
+        self.rejected = 0
+        self.timedOut = 0
+        self.lock = threading.Lock()
+        self.reaper = None
+
+    def configure(self, timeout=None, maxSessions=None, maxRate=None):
+        if timeout is not None:
+            self.timeout = timeout
+        if maxSessions is not None:
+            self.maxSessions = maxSessions
+        if maxRate is not None:
+            self.maxRate = maxRate
+
+    def add(self, worker):
+        with self.lock:
+            self.workers.add(worker)
+
+    def remove(self, worker):
+        with self.lock:
+            self.workers.discard(worker)
+            self.admitted.pop(worker, None)
+
+    def admit(self, worker, rate):
+        """Reserve room for a new session streaming at `rate` bit/s; False if the server is full."""
+        with self.lock:
+            reserved = sum(self.admitted.values())
+            if ((self.maxSessions and len(self.admitted) >= self.maxSessions)
+                    or (self.maxRate and self.admitted and reserved + rate > self.maxRate)):
+                self.rejected += 1
+                return False
+            self.admitted[worker] = rate
+            return True
+
+    def release(self, worker):
+        with self.lock:
+            self.admitted.pop(worker, None)
+
+    def stats(self):
+        with self.lock:
+            return {'connections': len(self.workers), 'sessions': len(self.admitted),
+                    'reserved_bps': sum(self.admitted.values()),
+                    'rejected': self.rejected, 'timed_out': self.timedOut}
+
+    def expired(self, now):
+        """Workers silent for longer than the timeout (each returned once)."""
+        if self.timeout <= 0:
+            return []
+        with self.lock:
+            expired = [w for w in self.workers if not w.expiring and now - w.lastSeen > self.timeout]
+            for worker in expired:
+                worker.expiring = True
+            self.timedOut += len(expired)
+        return expired
+
+    def start(self):
+        """Start the reaper thread (once per process)."""
+        with self.lock:
+            if self.reaper is not None:
+                return
+            self.reaper = threading.Thread(target=self.reap, name='session-reaper', daemon=True)
+        self.reaper.start()
+
+    def reap(self):
+        while True:
+            threading.Event().wait(REAP_INTERVAL)
+            for worker in self.expired(monotonic()):
+                log.info("Session %s: no request for %d s, closing",
+                         worker.clientInfo.get('session', '-'), self.timeout)
+                try:
+                    worker.expire()
+                except Exception as e:
+                    log.warning("Cannot close expired session: %s", e)
+
+
+# Dùng chung cho toàn bộ process (mỗi worker process có một bộ riêng)
+sessions = SessionManager()
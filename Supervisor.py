@@ -0,0 +1,86 @@
+# Supervisor.py
+# Chạy N worker process cùng nghe RTSP trên một cổng (SO_REUSEPORT: kernel chia kết nối
+# mới cho các process), mỗi worker là một server đầy đủ với GIL riêng. Supervisor chỉ
+# theo dõi: worker nào thoát khi server chưa dừng thì khởi động lại worker đó.
+
+import logging, multiprocessing, signal, socket, sys, time
+from multiprocessing.connection import wait
+
+log = logging.getLogger(__name__)
+
+CRASH_WINDOW = 1.0      # worker chết trong khoảng này sau khi chạy: chờ trước khi chạy lại
+MAX_BACKOFF = 10.0
+
+
+def reusePortSupported():
+    return hasattr(socket, 'SO_REUSEPORT')
+
+
+def workerMain(target, number, args):
+    # Ctrl-C tới cả nhóm process: chỉ supervisor xử lý rồi dừng worker; SIGTERM thì thoát ngay
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    target(number, *args)
+
+
+class Supervisor:
+    """Start `count` processes running target(number, *args) and restart any that exits."""
+
+    def __init__(self, count, target, args=()):
+        self.count = count
+        self.target = target
+        self.args = args
+        self.workers = {}               # number -> Process
+        self.started = {}               # number -> thời điểm start
+        self.backoff = {}
+        self.restarts = 0
+
+    def spawn(self, number):
+        # Không daemon: worker còn phải tạo process con (pool nén lại JPEG); stop() tự dừng chúng
+        process = multiprocessing.Process(target=workerMain, args=(self.target, number, self.args),
+                                          name=f"worker-{number}")
+        process.start()
+        self.workers[number] = process
+        self.started[number] = time.monotonic()
+        log.info("Worker %d started (pid %d)", number, process.pid)
+
+    def run(self):
+        """Block until interrupted (Ctrl-C / SIGTERM), then stop every worker."""
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        for number in range(self.count):
+            self.spawn(number)
+        try:
+            while True:
+                sentinels = {process.sentinel: number for number, process in self.workers.items()}
+                for sentinel in wait(list(sentinels)):
+                    self.restart(sentinels[sentinel])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def restart(self, number):
+        process = self.workers[number]
+        process.join()
+        lived = time.monotonic() - self.started[number]
+        log.warning("Worker %d (pid %d) exited with code %s after %.1f s, restarting",
+                    number, process.pid, process.exitcode, lived)
+        # Chết ngay sau khi chạy (cổng bị chiếm, lỗi cấu hình): lùi dần để không quay vòng
+        if lived < CRASH_WINDOW:
+            self.backoff[number] = min(MAX_BACKOFF, self.backoff.get(number, 0.5) * 2)
+            time.sleep(self.backoff[number])
+        else:
+            self.backoff.pop(number, None)
+        self.restarts += 1
+        self.spawn(number)
+
+    def stop(self):
+        for process in self.workers.values():
+            if process.is_alive():
+                process.terminate()
+        for process in self.workers.values():
+            process.join(timeout=2.0)
+            if process.is_alive():
+                process.kill()
+                process.join()
+        log.info("Stopped %d workers (%d restarts)", len(self.workers), self.restarts)
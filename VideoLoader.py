@@ -1,5 +1,13 @@
+import json, logging, os
+
 from VideoStream import VideoStream
 from VideoStreamHD import VideoStreamHD
+from FrameIndex import load_index, DEFAULT_FPS
+
+log = logging.getLogger(__name__)
+
+# Manifest do Ingest.py ghi cạnh file nguồn: <tên>.manifest.json
+MANIFEST_SUFFIX = '.manifest.json'
 
 def is_basic_mjpeg(filename):
     """5 byte đầu là ASCII digits."""
@@ -9,10 +17,62 @@ def is_basic_mjpeg(filename):
             return False
         return all(48 <= b <= 57 for b in first5)
 
-def load_video(filename):
+def manifest_path(filename):
+    """Manifest describing `filename`: the file itself if it is one, else its sibling."""
+    if filename.endswith('.json'):
+        return filename
+    return os.path.splitext(filename)[0] + MANIFEST_SUFFIX
+
+def load_manifest(filename):
+    """Return the rendition manifest of `filename` (paths resolved), or None.
+
+    A manifest that cannot be parsed raises ValueError.
+    """
+    path = manifest_path(filename)
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+        base = os.path.dirname(path)
+        for rendition in manifest['renditions']:
+            rendition['path'] = os.path.join(base, rendition['file'])
+        if not manifest['renditions']:
+            raise ValueError("no renditions")
+    except FileNotFoundError:
+        return None
+    except (ValueError, KeyError, TypeError) as e:
+        # JSON hỏng hoặc thiếu trường: lỗi của server, không phải "không có rendition này" (KeyError)
+        raise ValueError(f"Bad manifest {path}: {e!r}") from e
+    return manifest
+
+def find_rendition(manifest, name=None):
+    """Rendition `name` of the manifest (the first, best one by default)."""
+    if name is None:
+        return manifest['renditions'][0]
+    for rendition in manifest['renditions']:
+        if rendition['name'] == name:
+            return rendition
+    raise KeyError(name)
+
+def load_video(filename, rendition=None):
+    """Open a video file, or one rendition of a manifest.
+
+    A manifest is used when `filename` is the manifest itself or when a
+    rendition is asked for; unknown renditions raise KeyError.
+    """
+    fps = DEFAULT_FPS
+    if filename.endswith('.json') or rendition is not None:
+        manifest = load_manifest(filename)
+        if manifest is None:
+            raise IOError(f"No manifest for {filename}")
+        filename = find_rendition(manifest, rendition)['path']
+        fps = manifest.get('fps', DEFAULT_FPS)
+
     if is_basic_mjpeg(filename):
-        print(f"[VideoLoader] Detected BASIC MJPEG -> VideoStream")
-        return VideoStream(filename)
+        log.debug("Detected BASIC MJPEG -> VideoStream")
+        stream_class = VideoStream
     else:
-        print(f"[VideoLoader] Detected HD MJPEG -> VideoStreamHD")
-        return VideoStreamHD(filename)
+        log.debug("Detected HD MJPEG -> VideoStreamHD")
+        stream_class = VideoStreamHD
+    # Index được build 1 lần rồi lưu cạnh file (<video>.idx)
+    index = load_index(filename, stream_class.scan, fps)
+    return stream_class(filename, index)
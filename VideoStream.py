@@ -1,11 +1,31 @@
+import logging
+
+from MmapReader import MmapReader
+
+log = logging.getLogger(__name__)
+
 class VideoStream:
-    def __init__(self, filename):
+    def __init__(self, filename, index=None):
         self.filename = filename
         try:
-            self.file = open(filename, 'rb')
+            self.reader = MmapReader(filename)
         except:
             raise IOError
         self.frameNum = 0
+        self.pos = 0            # offset của header frame kế tiếp
+        self.index = index
+
+    @staticmethod
+    def scan(reader):
+        """Yield (offset, length) of every JPEG in a lab-format file."""
+        offset = 0
+        while offset + 5 <= len(reader):
+            try:
+                frame_length = int(bytes(reader.slice(offset, 5)))
+            except ValueError:
+                return
+            yield offset + 5, frame_length
+            offset += 5 + frame_length
 
     def nextFrame(self):
         """Get next frame from proprietary MJPEG file.
@@ -13,36 +33,69 @@ class VideoStream:
         Định dạng lab:
         - Mỗi frame: 5 byte đầu là độ dài (ASCII), VD: b'01234'
         - Sau đó là đúng `length` byte JPEG.
+        Frame trả về là memoryview trỏ thẳng vào file đã mmap.
         """
+        if self.index is not None:
+            return self._readIndexed()
+
         # Đọc 5 byte đầu chứa độ dài frame (dạng text)
-        length_bytes = self.file.read(5)
+        length_bytes = bytes(self.reader.slice(self.pos, 5))
 
         if length_bytes:
             try:
                 # Chuyển bytes -> string -> int
                 frame_length = int(length_bytes.decode())
             except Exception as e:
-                print("Error: Invalid frame length header:", length_bytes, e)
+                log.error("Invalid frame length header: %r (%s)", length_bytes, e)
                 return None
 
-            # Đọc đúng số byte của frame
-            data = self.file.read(frame_length)
-            if not data or len(data) != frame_length:
-                print("Error: Unexpected end of file when reading frame data")
+            # Lấy đúng số byte của frame
+            data = self.reader.slice(self.pos + 5, frame_length)
+            if len(data) != frame_length:
+                log.error("Unexpected end of file when reading frame data")
                 return None
 
+            self.pos += 5 + frame_length
             self.frameNum += 1
-            print(f"[VideoStream] Read frame {self.frameNum}, length: {frame_length}")
+            log.debug("Read frame %d, length: %d", self.frameNum, frame_length)
             return data
 
         # EOF
         return None
 
+    def _readIndexed(self):
+        """Read the next frame straight from its indexed offset."""
+        if self.frameNum >= len(self.index):
+            return None
+        offset, frame_length, _ = self.index.frame(self.frameNum)
+        data = self.reader.slice(offset, frame_length)
+        if len(data) != frame_length:
+            log.error("Unexpected end of file when reading frame data")
+            return None
+
+        self.frameNum += 1
+        log.debug("Read frame %d, length: %d", self.frameNum, frame_length)
+        return data
+
     def frameNbr(self):
         """Get frame number."""
         return self.frameNum
 
+    def seek(self, frameNbr):
+        """Position the stream so that the next frame read is frameNbr + 1."""
+        if self.index is not None:
+            self.frameNum = min(max(frameNbr, 0), len(self.index))
+            return
+        # Không có index: đọc tuần tự, chỉ quay về đầu file khi lùi
+        if frameNbr < self.frameNum:
+            self.reset()
+        while self.frameNum < frameNbr and self.nextFrame():
+            pass
+
     def reset(self):
         """Reset stream to beginning."""
-        self.file.seek(0)
+        self.pos = 0
         self.frameNum = 0
+
+    def close(self):
+        self.reader.close()
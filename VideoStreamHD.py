@@ -1,59 +1,84 @@
 # VideoStreamHD.py
 # Đọc file MJPEG HD: mỗi frame là 1 JPEG từ SOI (0xFFD8) tới EOI (0xFFD9)
+# File được mmap, frame trả về là memoryview (zero-copy).
+
+from MmapReader import MmapReader
 
 class VideoStreamHD:
     SOI = b'\xff\xd8'  # Start of Image
     EOI = b'\xff\xd9'  # End of Image
 
-    def __init__(self, filename):
+    def __init__(self, filename, index=None):
         self.filename = filename
         try:
-            self.file = open(filename, 'rb')
+            self.reader = MmapReader(filename)
         except:
             raise IOError(f"Cannot open file {filename}")
         self.frameNum = 0
-        self.buffer = b''
+        self.pos = 0        # offset bắt đầu tìm SOI kế tiếp
+        self.index = index
 
-    def _seek_soi(self):
-        """Đảm bảo buffer bắt đầu bằng SOI."""
+    @classmethod
+    def scan(cls, reader):
+        """Yield (offset, length) of every SOI..EOI frame in the file."""
+        pos = 0
         while True:
-            idx = self.buffer.find(self.SOI)
-            if idx != -1:
-                self.buffer = self.buffer[idx:]
-                return True
-
-            chunk = self.file.read(4096)
-            if not chunk:
-                return False
-            self.buffer += chunk
+            start = reader.find(cls.SOI, pos)
+            if start == -1:
+                return
+            idx = reader.find(cls.EOI, start + len(cls.SOI))
+            if idx == -1:
+                return
+            pos = idx + len(cls.EOI)
+            yield start, pos - start
 
     def nextFrame(self):
         """
-        Trả về 1 frame JPEG đầy đủ (SOI..EOI).
+        Trả về 1 frame JPEG đầy đủ (SOI..EOI) dạng memoryview.
         Nếu hết file, trả về None.
         """
-        if not self._seek_soi():
+        if self.index is not None:
+            return self._readIndexed()
+
+        start = self.reader.find(self.SOI, self.pos)
+        if start == -1:
+            return None
+        idx = self.reader.find(self.EOI, start + len(self.SOI))  # tìm từ sau SOI
+        if idx == -1:
             return None
 
-        while True:
-            idx = self.buffer.find(self.EOI, 2)  # tìm từ sau SOI
-            if idx != -1:
-                end = idx + len(self.EOI)
-                frame = self.buffer[:end]
-                self.buffer = self.buffer[end:]
-                self.frameNum += 1
-                # print(f"[VideoStreamHD] Read frame {self.frameNum} ({len(frame)} bytes)")
-                return frame
-
-            chunk = self.file.read(4096)
-            if not chunk:
-                return None
-            self.buffer += chunk
+        self.pos = idx + len(self.EOI)
+        self.frameNum += 1
+        # print(f"[VideoStreamHD] Read frame {self.frameNum} ({self.pos - start} bytes)")
+        return self.reader.slice(start, self.pos - start)
+
+    def _readIndexed(self):
+        """Lấy frame kế tiếp trực tiếp theo offset trong index."""
+        if self.frameNum >= len(self.index):
+            return None
+        offset, length, _ = self.index.frame(self.frameNum)
+        frame = self.reader.slice(offset, length)
+        if len(frame) != length:
+            return None
+        self.frameNum += 1
+        return frame
 
     def frameNbr(self):
         return self.frameNum
 
+    def seek(self, frameNbr):
+        """Đặt vị trí để frame đọc tiếp theo là frameNbr + 1."""
+        if self.index is not None:
+            self.frameNum = min(max(frameNbr, 0), len(self.index))
+            return
+        if frameNbr < self.frameNum:
+            self.reset()
+        while self.frameNum < frameNbr and self.nextFrame():
+            pass
+
     def reset(self):
-        self.file.seek(0)
-        self.buffer = b''
+        self.pos = 0
         self.frameNum = 0
+
+    def close(self):
+        self.reader.close()
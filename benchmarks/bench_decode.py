@@ -0,0 +1,79 @@
+"""Benchmark: full-size JPEG decode vs draft-mode decode to the display size.
+
+Usage:
+    python3 benchmarks/bench_decode.py [--file hd.mjpeg] [--size 1920x1080] [--seconds 2]
+
+Without --file one synthetic frame of --size is encoded with Pillow.  "full"
+is the client before draft decoding (decode every pixel, show as is);
+"full + resize" is what fitting the frame to the window would cost without
+draft(); "draft" is FrameDecoder.decodeJpeg with the label size as box.
+"""
+
+import argparse, io, os, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageFilter
+
+from FrameDecoder import decodeJpeg, fitSize, RESAMPLE
+
+BOXES = [(1280, 720), (960, 540), (640, 360), (320, 180)]
+
+
+def synthetic_frame(width, height):
+    gradient = Image.linear_gradient('L').resize((width, height))
+    noise = Image.effect_noise((width, height), 10).filter(ImageFilter.BoxBlur(1))
+    out = io.BytesIO()
+    Image.merge('RGB', (gradient, noise, gradient.rotate(30))).save(out, 'JPEG', quality=85)
+    return out.getvalue()
+
+
+def first_frame(filename):
+    with open(filename, 'rb') as f:
+        data = f.read(16 * 1024 * 1024)
+    start = data.find(b'\xff\xd8')
+    end = data.find(b'\xff\xd9', start)
+    if start < 0 or end < 0:
+        sys.exit(f"No JPEG frame in the first 16 MB of {filename}")
+    return data[start:end + 2]
+
+
+def measure(name, fn, seconds):
+    frames = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        fn()
+        frames += 1
+    ms = (time.perf_counter() - start) * 1000 / frames
+    print(f"{name:<32} {ms:>9.2f} ms/frame")
+    return ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--file', help="take the first frame of this MJPEG file")
+    parser.add_argument('--size', default='1920x1080', help="synthetic frame size WxH")
+    parser.add_argument('--seconds', type=float, default=2.0)
+    args = parser.parse_args()
+
+    if args.file:
+        frame = first_frame(args.file)
+    else:
+        frame = synthetic_frame(*map(int, args.size.split('x')))
+    size = Image.open(io.BytesIO(frame)).size
+    print(f"Frame: {size[0]}x{size[1]}, {len(frame)} bytes\n")
+
+    before = measure('full', lambda: decodeJpeg(frame), args.seconds)
+    for box in BOXES:
+        target = fitSize(size, box)
+        if target == size:
+            continue
+        print(f"\nbox {box[0]}x{box[1]} -> {target[0]}x{target[1]}")
+        resized = measure('full + resize', lambda: decodeJpeg(frame).resize(target, RESAMPLE), args.seconds)
+        after = measure('draft', lambda: decodeJpeg(frame, box), args.seconds)
+        print(f"{'speed-up vs full / full + resize':<32} {before / after:>9.1f}x / {resized / after:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
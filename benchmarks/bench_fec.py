@@ -0,0 +1,120 @@
+"""Frame loss rate with and without XOR parity FEC under synthetic packet loss.
+
+Usage:
+    python3 benchmarks/bench_fec.py [--frames 500] [--frame-kb 60] [--loss 0.5 1 2 5]
+                                    [--groups 0 4 8 16] [--burst 1] [--reorder 4]
+
+Packetizes synthetic frames exactly like the server (RtpPacketizer + FecEncoder),
+drops packets at random (independent loss, or bursts of --burst packets) and
+feeds the survivors to the client's FrameAssembler.  Reports the frame loss
+rate, the fragments recovered from parity and the bandwidth overhead of FEC.
+--reorder N shuffles the survivors in windows of up to N packets, so parity
+often arrives before the fragment it protects: with --loss 0 --reorder 4 the
+assembler must drop no frame and deliver at most one per packet (burst 1).
+"""
+
+import argparse, os, random, sys, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from RtpPacket import RtpPacketizer, HEADER_SIZE, parseHeader
+from Fec import FecEncoder, FecPacket, FEC_PT
+from FrameAssembler import FrameAssembler
+
+
+def make_stream(frames, frameKb, group, seed):
+    """Return the list of packets (bytes) the server would send."""
+    rng = random.Random(seed)
+    packetizer = RtpPacketizer(maxPayload=1300)
+    fec = FecEncoder(group) if group > 1 else None
+    packets, seq = [], 0
+    for n in range(frames):
+        size = int(frameKb * 1024 * rng.uniform(0.8, 1.2))
+        frame = b'\xff\xd8' + rng.randbytes(size) + b'\xff\xd9'
+        views, seq = packetizer.packetize(frame, seq, n * 3600)
+        if fec is not None:
+            views = fec.protect(views)
+        packets.extend(bytes(v) for v in views)
+    return packets
+
+
+def lose(packets, rate, burst, rng):
+    """Drop packets: bursts of `burst` consecutive packets start with probability rate/burst."""
+    out, skip = [], 0
+    start = rate / burst
+    for packet in packets:
+        if skip:
+            skip -= 1
+            continue
+        if rng.random() < start:
+            skip = burst - 1
+            continue
+        out.append(packet)
+    return out
+
+
+def reorder(packets, window, rng):
+    """Shuffle consecutive runs of window-1..window packets (window <= 1: keep the order)."""
+    if window <= 1:
+        return packets
+    out, pos = [], 0
+    while pos < len(packets):
+        run = packets[pos:pos + rng.randint(window - 1, window)]
+        rng.shuffle(run)
+        out.extend(run)
+        pos += len(run)
+    return out
+
+
+def receive(packets):
+    """(frames delivered, most frames delivered by one packet, assembler)."""
+    assembler = FrameAssembler()
+    now = 0.0
+    frames = burst = 0
+    for packet in packets:
+        now += 0.0001
+        marker, pt, seq, timestamp, _ = parseHeader(packet)
+        payload = memoryview(packet)[HEADER_SIZE:]
+        if pt == FEC_PT:
+            done = assembler.pushParity(timestamp, FecPacket(payload), now)
+        else:
+            done = assembler.push(seq, timestamp, marker, payload, now)
+        frames += len(done)
+        burst = max(burst, len(done))
+    frames += len(assembler.flush(now + 10))
+    return frames, burst, assembler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--frames', type=int, default=500)
+    parser.add_argument('--frame-kb', type=float, default=60)
+    parser.add_argument('--loss', type=float, nargs='+', default=[0.5, 1, 2, 5], help="percent")
+    parser.add_argument('--groups', type=int, nargs='+', default=[0, 4, 8, 16], help="0 = no FEC")
+    parser.add_argument('--burst', type=int, default=1, help="consecutive packets per loss event")
+    parser.add_argument('--reorder', type=int, default=0, help="shuffle window in packets (0 = in order)")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{args.frames} frames of ~{args.frame_kb:g} KB, loss bursts of {args.burst}, "
+          f"reorder window {args.reorder}")
+    print(f"{'loss %':>7} {'K':>3} {'overhead %':>10} {'frame loss %':>12} {'recovered':>9} "
+          f"{'dropped':>7} {'burst':>5} {'ms/frame':>8}")
+    base = len(make_stream(args.frames, args.frame_kb, 0, args.seed))
+    for group in args.groups:
+        packets = make_stream(args.frames, args.frame_kb, group, args.seed)
+        overhead = (len(packets) - base) / base * 100
+        for loss in args.loss:
+            rng = random.Random(args.seed)
+            received = reorder(lose(packets, loss / 100, args.burst, rng), args.reorder, rng)
+            start = time.perf_counter()
+            frames, burst, assembler = receive(received)
+            elapsed = time.perf_counter() - start
+            frameLoss = (args.frames - frames) / args.frames * 100
+            print(f"{loss:7.2f} {group:3d} {overhead:10.1f} {frameLoss:12.2f} "
+                  f"{assembler.recovered:9d} {assembler.framesDropped:7d} {burst:5d} {elapsed / args.frames * 1000:8.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Loopback measurement of frame pacing: inter-frame jitter and clock drift.
+
+Usage:
+    python3 benchmarks/bench_pacing.py [--file movie.mjpeg] [--seconds 10] [--async]
+                                       [--frame-rate 25] [--peak-mbps 50]
+
+Starts Server.py on a free local port, plays one session and timestamps
+every RTP packet on arrival.  A frame "arrives" with its marker packet.
+Reports the deviation of inter-frame intervals from the nominal interval,
+the cumulative drift of the last frame and how long each frame's packets
+were spread over.
+"""
+
+import argparse, os, socket, statistics, subprocess, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_reader import make_hd_file
+
+
+def free_port(kind=socket.SOCK_STREAM):
+    s = socket.socket(socket.AF_INET, kind)
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def rtsp(sock, text):
+    sock.send(text.encode())
+    return sock.recv(4096).decode()
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--file', help='video to stream (default: synthetic HD file)')
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--frame-rate', type=float, default=25.0)
+    parser.add_argument('--peak-mbps', type=float, default=None)
+    parser.add_argument('--async', dest='useAsync', action='store_true')
+    args = parser.parse_args()
+
+    path = args.file
+    if path is None:
+        path = os.path.join(tempfile.gettempdir(), 'bench-pacing.mjpeg')
+        if not os.path.exists(path):
+            make_hd_file(path, 64, 200)
+    path = os.path.abspath(path)
+
+    port = free_port()
+    command = [sys.executable, os.path.join(ROOT, 'Server.py'), str(port)]
+    if args.useAsync:
+        command.append('--async')
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    try:
+        for _ in range(50):
+            try:
+                rtspSocket = socket.create_connection(('127.0.0.1', port))
+                break
+            except ConnectionRefusedError:
+                time.sleep(0.1)
+        else:
+            sys.exit("server did not start")
+
+        rtpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        rtpSocket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+        rtpSocket.bind(('127.0.0.1', 0))
+        rtpSocket.settimeout(1.0)
+        rtpPort = rtpSocket.getsockname()[1]
+
+        setup = (f"SETUP {path} RTSP/1.0\nCSeq: 1\n"
+                 f"Transport: RTP/UDP; client_port= {rtpPort}\n"
+                 f"X-Frame-Rate: {args.frame_rate}\n")
+        if args.peak_mbps:
+            setup += f"X-Peak-Rate: {args.peak_mbps * 1e6:.0f}\n"
+        rtsp(rtspSocket, setup + "\n")
+        rtsp(rtspSocket, f"PLAY {path} RTSP/1.0\nCSeq: 2\nSession: 0\n\n")
+
+        frameEnds, spreads = [], []
+        first = None
+        deadline = time.perf_counter() + args.seconds
+        while time.perf_counter() < deadline:
+            try:
+                packet = rtpSocket.recv(65536)
+            except socket.timeout:
+                break
+            now = time.perf_counter()
+            if first is None:
+                first = now
+            if packet[1] & 0x80:
+                frameEnds.append(now)
+                spreads.append(now - first)
+                first = None
+
+        rtsp(rtspSocket, f"TEARDOWN {path} RTSP/1.0\nCSeq: 3\nSession: 0\n\n")
+    finally:
+        server.kill()
+
+    if len(frameEnds) < 3:
+        sys.exit("not enough frames received")
+
+    nominal = 1.0 / args.frame_rate
+    intervals = [b - a for a, b in zip(frameEnds, frameEnds[1:])]
+    deviation = [abs(i - nominal) * 1000 for i in intervals]
+    drift = (frameEnds[-1] - frameEnds[0] - nominal * (len(frameEnds) - 1)) * 1000
+    print(f"frames received       : {len(frameEnds)}")
+    print(f"effective frame rate  : {(len(frameEnds) - 1) / (frameEnds[-1] - frameEnds[0]):.3f} fps "
+          f"(nominal {args.frame_rate:g})")
+    print(f"interval mean / stdev : {statistics.mean(intervals) * 1000:.3f} / "
+          f"{statistics.pstdev(intervals) * 1000:.3f} ms")
+    print(f"|jitter| p50/p99/max  : {percentile(deviation, 50):.3f} / "
+          f"{percentile(deviation, 99):.3f} / {max(deviation):.3f} ms")
+    print(f"cumulative drift      : {drift:+.3f} ms over {len(intervals)} intervals")
+    print(f"packet spread / frame : {statistics.mean(spreads) * 1000:.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
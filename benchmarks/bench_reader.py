@@ -0,0 +1,129 @@
+"""Benchmark: mmap/memoryview frame reader vs the old buffer-growth reader.
+
+Usage:
+    python3 benchmarks/bench_reader.py [--file hd.mjpeg] [--size-mb 2048] [--frame-kb 1500]
+
+Without --file a synthetic HD MJPEG (SOI..EOI frames) of --size-mb MB is
+generated in the temp directory.  Every reader gets one warm-up pass so all
+runs read from the page cache; the numbers compare parsing/copy cost, not disk.
+"""
+
+import argparse, os, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from VideoStreamHD import VideoStreamHD
+from FrameIndex import FrameIndex
+
+
+class LegacyVideoStreamHD:
+    """Reader before the mmap backend: 4 KB reads + `buffer += chunk`."""
+    SOI = b'\xff\xd8'
+    EOI = b'\xff\xd9'
+
+    def __init__(self, filename):
+        self.file = open(filename, 'rb')
+        self.buffer = b''
+
+    def _seek_soi(self):
+        while True:
+            idx = self.buffer.find(self.SOI)
+            if idx != -1:
+                self.buffer = self.buffer[idx:]
+                return True
+            chunk = self.file.read(4096)
+            if not chunk:
+                return False
+            self.buffer += chunk
+
+    def nextFrame(self):
+        if not self._seek_soi():
+            return None
+        while True:
+            idx = self.buffer.find(self.EOI, 2)
+            if idx != -1:
+                end = idx + len(self.EOI)
+                frame = self.buffer[:end]
+                self.buffer = self.buffer[end:]
+                return frame
+            chunk = self.file.read(4096)
+            if not chunk:
+                return None
+            self.buffer += chunk
+
+    def close(self):
+        self.file.close()
+
+
+def make_hd_file(path, size_mb, frame_kb):
+    """Synthetic HD MJPEG: random frame bodies with no 0xFF, wrapped in SOI/EOI."""
+    no_ff = bytes.maketrans(b'\xff', b'\xfe')
+    bodies = [os.urandom(frame_kb * 1024).translate(no_ff) for _ in range(16)]
+    target = size_mb * 1024 * 1024
+    written = 0
+    with open(path, 'wb') as f:
+        i = 0
+        while written < target:
+            frame = b'\xff\xd8' + bodies[i % len(bodies)] + b'\xff\xd9'
+            f.write(frame)
+            written += len(frame)
+            i += 1
+
+
+def run(stream, limit=None):
+    frames = 0
+    total = 0
+    start = time.perf_counter()
+    while limit is None or frames < limit:
+        frame = stream.nextFrame()
+        if frame is None:
+            break
+        frames += 1
+        total += len(frame)
+    return frames, total, time.perf_counter() - start
+
+
+def report(name, frames, total, elapsed):
+    print(f"{name:<28} {frames:>7} frames  {total / 1e6:>10.1f} MB  "
+          f"{elapsed:>8.2f} s  {total / 1e6 / elapsed:>9.1f} MB/s  "
+          f"{frames / elapsed:>9.1f} fps")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--file', help='existing HD MJPEG file to read')
+    parser.add_argument('--size-mb', type=int, default=2048)
+    parser.add_argument('--frame-kb', type=int, default=1500)
+    parser.add_argument('--legacy-frames', type=int, default=None,
+                        help='stop the legacy reader after N frames (it is slow)')
+    args = parser.parse_args()
+
+    path = args.file
+    if path is None:
+        path = os.path.join(tempfile.gettempdir(), f'bench-{args.size_mb}MB.mjpeg')
+        if not os.path.exists(path) or os.path.getsize(path) < args.size_mb * 1024 * 1024:
+            print(f"Generating {path} ...")
+            make_hd_file(path, args.size_mb, args.frame_kb)
+    print(f"File: {path} ({os.path.getsize(path) / 1e6:.1f} MB)\n")
+
+    # Warm-up: đưa file vào page cache
+    run(VideoStreamHD(path))
+
+    legacy = LegacyVideoStreamHD(path)
+    report('legacy (buffer += chunk)', *run(legacy, args.legacy_frames))
+    legacy.close()
+
+    stream = VideoStreamHD(path)
+    report('mmap (marker search)', *run(stream))
+    stream.close()
+
+    start = time.perf_counter()
+    index = FrameIndex.build(path, VideoStreamHD.scan)
+    print(f"{'index build':<28} {len(index):>7} frames  {time.perf_counter() - start:>23.2f} s")
+    stream = VideoStreamHD(path, index)
+    report('mmap (indexed)', *run(stream))
+    stream.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+"""Microbenchmark: RTP packetize/decode throughput before and after the fast path.
+
+Usage:
+    python3 benchmarks/bench_rtp.py [--frame-kb 200] [--seconds 2]
+
+"legacy" is the byte-at-a-time RtpPacket that sendRtp/listenRtp used before
+(one new object per packet, header + payload concatenated per fragment).
+"hinted" writes only the 12-byte headers from a hint track (Hint.py) and
+leaves the payloads as views of the mmapped file; "send" pushes a frame to
+a loopback UDP socket with sendto (packetized) or sendmsg (header, payload).
+"receive" sends a frame in one burst and reads it back either with one
+recv(65536) + RtpPacket per packet (the old listenRtp) or with RtpReceiver
+(batched recv_into into pooled buffers, header parsed in place); both copy
+the payloads into a FrameAssembler so the result is a whole frame.
+"""
+
+import argparse, os, select, socket, sys, tempfile, time
+from array import array
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from RtpPacket import RtpPacket, RtpPacketizer, HintedPacketizer, parseHeader
+from FrameIndex import FrameIndex
+from Hint import HintTrack
+from MmapReader import MmapReader
+from RtpReceiver import RtpReceiver
+from FrameAssembler import FrameAssembler
+
+HEADER_SIZE = 12
+MAX_PAYLOAD = 1300
+
+
+class LegacyRtpPacket:
+    def encode(self, version, padding, extension, cc, seqnum, marker, pt, ssrc, payload):
+        timestamp = int(time.time())
+        header = bytearray(HEADER_SIZE)
+        header[0] = (version << 6) | (padding << 5) | (extension << 4) | cc
+        header[1] = (marker << 7) | pt
+        header[2] = (seqnum >> 8) & 0xFF
+        header[3] = seqnum & 0xFF
+        header[4] = (timestamp >> 24) & 0xFF
+        header[5] = (timestamp >> 16) & 0xFF
+        header[6] = (timestamp >> 8) & 0xFF
+        header[7] = timestamp & 0xFF
+        header[8] = (ssrc >> 24) & 0xFF
+        header[9] = (ssrc >> 16) & 0xFF
+        header[10] = (ssrc >> 8) & 0xFF
+        header[11] = ssrc & 0xFF
+        self.header = header
+        self.payload = payload
+
+    def decode(self, byteStream):
+        self.header = bytearray(byteStream[:HEADER_SIZE])
+        self.payload = byteStream[HEADER_SIZE:]
+
+    def seqNum(self):
+        return int(self.header[2] << 8 | self.header[3])
+
+    def marker(self):
+        return int(self.header[1] >> 7)
+
+    def getPayload(self):
+        return self.payload
+
+    def getPacket(self):
+        return self.header + self.payload
+
+
+def legacy_packetize(frame, seq):
+    packets = []
+    offset = 0
+    while offset < len(frame):
+        chunk = frame[offset:offset + MAX_PAYLOAD]
+        offset += MAX_PAYLOAD
+        marker = 1 if offset >= len(frame) else 0
+        seq = (seq + 1) % 65536
+        rtp = LegacyRtpPacket()
+        rtp.encode(2, 0, 0, 0, seq, marker, 26, 0, chunk)
+        packets.append(rtp.getPacket())
+    return packets, seq
+
+
+def compat_packetize(frame, seq):
+    """New RtpPacket used through the old per-packet API."""
+    packets = []
+    offset = 0
+    while offset < len(frame):
+        chunk = frame[offset:offset + MAX_PAYLOAD]
+        offset += MAX_PAYLOAD
+        marker = 1 if offset >= len(frame) else 0
+        seq = (seq + 1) % 65536
+        rtp = RtpPacket()
+        rtp.encode(2, 0, 0, 0, seq, marker, 26, 0, chunk)
+        packets.append(rtp.getPacket())
+    return packets, seq
+
+
+def legacy_decode(packets):
+    for packet in packets:
+        rtp = LegacyRtpPacket()
+        rtp.decode(packet)
+        rtp.seqNum(), rtp.marker(), rtp.getPayload()
+
+
+def fast_decode(packets, rtp=RtpPacket()):
+    for packet in packets:
+        rtp.decode(packet)
+        rtp.seqNum(), rtp.marker(), rtp.getPayload()
+
+
+def header_decode(packets):
+    for packet in packets:
+        marker, pt, seq, ts, ssrc = parseHeader(packet)
+        memoryview(packet)[HEADER_SIZE:]
+
+
+def measure(name, fn, seconds):
+    packets = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        packets += fn()
+    elapsed = time.perf_counter() - start
+    rate = packets / elapsed
+    print(f"{name:<32} {rate:>12,.0f} packets/s")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--frame-kb', type=int, default=200)
+    parser.add_argument('--seconds', type=float, default=2.0)
+    args = parser.parse_args()
+
+    frame = os.urandom(args.frame_kb * 1024)
+    packets = [bytes(p) for p in legacy_packetize(frame, 0)[0]]
+    count = len(packets)
+    print(f"Frame: {len(frame)} bytes -> {count} packets of <= {MAX_PAYLOAD} bytes payload\n")
+
+    print("encode")
+    before = measure('legacy RtpPacket', lambda: legacy_packetize(frame, 0) and count, args.seconds)
+    measure('RtpPacket (compat API)', lambda: compat_packetize(frame, 0) and count, args.seconds)
+    packetizer = RtpPacketizer(MAX_PAYLOAD)
+    after = measure('RtpPacketizer (batch)', lambda: packetizer.packetize(frame, 0, 0) and count, args.seconds)
+    print(f"{'speed-up':<32} {after / before:>12.1f}x\n")
+
+    # Frame nằm trong file mmap, hint track dựng từ chỉ mục một frame
+    with tempfile.NamedTemporaryFile(suffix='.mjpeg', delete=False) as f:
+        f.write(frame)
+    reader = MmapReader(f.name)
+    hint = HintTrack.build(FrameIndex(array('Q', [0]), array('I', [len(frame)]), array('I', [0])), MAX_PAYLOAD)
+    hinted = HintedPacketizer()
+    after = measure('HintedPacketizer (headers only)', lambda: hinted.packetize(hint, 0, reader, 0, 0) and count,
+                    args.seconds)
+    print(f"{'speed-up vs legacy':<32} {after / before:>12.1f}x\n")
+
+    print("send (loopback UDP, packetize + send)")
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(('127.0.0.1', 0))
+    address = sink.getsockname()
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send_packetized():
+        for packet in packetizer.packetize(frame, 0, 0)[0]:
+            sender.sendto(packet, address)
+        return count
+
+    def send_hinted():
+        for packet in hinted.packetize(hint, 0, reader, 0, 0)[0]:
+            sender.sendmsg(packet, (), 0, address)
+        return count
+
+    before = measure('RtpPacketizer + sendto', send_packetized, args.seconds)
+    if hasattr(sender, 'sendmsg'):
+        after = measure('HintedPacketizer + sendmsg', send_hinted, args.seconds)
+        print(f"{'speed-up':<32} {after / before:>12.1f}x")
+    sender.close()
+    sink.close()
+    reader.close()
+    os.unlink(f.name)
+    print()
+
+    print("receive (loopback UDP, one frame per burst, into FrameAssembler)")
+    # Frame phải bắt đầu bằng SOI: FrameAssembler bỏ frame đầu tiên không phải JPEG
+    burst = [bytes(p) for p in packetizer.packetize(b'\xff\xd8' + frame[2:], 0, 0)[0]]
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def receive_legacy(sink):
+        assembler, rtp = FrameAssembler(), RtpPacket()
+        for packet in burst:
+            sender.sendto(packet, sink.getsockname())
+        done = []
+        while not done and select.select([sink], [], [], 1.0)[0]:
+            rtp.decode(sink.recv(65536))
+            done = assembler.push(rtp.seqNum(), rtp.timestamp(), rtp.marker(), rtp.getPayload(), 0)
+        return count
+
+    def receive_pooled(receiver):
+        assembler = FrameAssembler()
+        for packet in burst:
+            sender.sendto(packet, receiver.sock.getsockname())
+        done, packets = [], True
+        while not done and packets:
+            packets = receiver.receive(1.0)
+            for packet in packets:
+                marker, pt, seq, ts, ssrc = parseHeader(packet)
+                done += assembler.push(seq, ts, marker, packet[HEADER_SIZE:], 0)
+        return count
+
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+    sink.bind(('127.0.0.1', 0))
+    before = measure('recv + RtpPacket per packet', lambda: receive_legacy(sink), args.seconds)
+    sink.close()
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver = RtpReceiver(sink)
+    sink.bind(('127.0.0.1', 0))
+    after = measure('RtpReceiver (recv_into, batched)', lambda: receive_pooled(receiver), args.seconds)
+    print(f"{'speed-up':<32} {after / before:>12.1f}x")
+    stats = receiver.stats()
+    print(f"{'packets / read':<32} {stats['packets'] / max(1, stats['batches']):>12.1f}"
+          f"   kernel drops: {stats['kernelDrops']}")
+    receiver.close()
+    sink.close()
+    sender.close()
+    print()
+
+    print("decode")
+    before = measure('legacy (new object per packet)', lambda: legacy_decode(packets) or count, args.seconds)
+    measure('reused RtpPacket + memoryview', lambda: fast_decode(packets) or count, args.seconds)
+    after = measure('parseHeader + memoryview', lambda: header_decode(packets) or count, args.seconds)
+    print(f"{'speed-up':<32} {after / before:>12.1f}x")
+
+
+if __name__ == '__main__':
+    main()
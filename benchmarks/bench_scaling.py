@@ -0,0 +1,225 @@
+"""Multi-core scaling of the server: sessions/s and aggregate Mbit/s per worker count.
+
+Usage:
+    python3 benchmarks/bench_scaling.py [--workers 1 2 4] [--clients 4] [--sessions 32]
+                                        [--frame-rate 100] [--resolution 480p] [--seconds 5]
+                                        [--async] [--server-args "--cache-mb 0"] [--out scaling.json]
+
+For every worker count Server.py is started on a free local port with
+`--workers N` (N = 1 is the plain single-process server) and loaded from
+`--clients` client processes, so the load generator itself is not held to
+one core:
+
+- session rate: every client loops connect, SETUP, PLAY, TEARDOWN, close
+  for the measured time; reported as completed sessions per second
+- throughput: `--sessions` concurrent sessions at `--frame-rate` frames/s,
+  spread over the clients; reported as Mbit/s received after the warm-up
+  (packets the clients could not read in time count as lost)
+
+Speedup and efficiency (speedup / N) are relative to N = 1.  The clients run
+on the same machine and take cores too: scaling is only meaningful while
+workers + clients fit the CPU count, which the results record.  Written as
+one JSON document (stdout or --out); a summary goes to stderr.
+"""
+
+import argparse, json, multiprocessing, os, platform, selectors, shlex, socket, subprocess, sys, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_pacing import free_port, rtsp
+from suite import RESOLUTIONS, cpu_seconds, connect, make_video, code_version
+from RtpPacket import parseHeader
+
+
+def tree_cpu(pid):
+    """utime + stime of a process and its direct children (the workers), Linux only."""
+    total = cpu_seconds(pid)
+    if total is None:
+        return None
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            children = f.read().split()
+    except OSError:
+        children = []
+    return total + sum(cpu_seconds(int(child)) or 0 for child in children)
+
+
+def start_server(workers, serverArgs):
+    port = free_port()
+    command = [sys.executable, os.path.join(ROOT, 'Server.py'), str(port), '--workers', str(workers),
+               '--log-level', 'off'] + serverArgs
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    connect(port).close()   # chờ server nghe (kết nối rỗng được dọn ngay khi đóng)
+    return server, port
+
+
+def session_loop(port, path, seconds):
+    """One client process: as many short sessions as possible for `seconds`."""
+    rtp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    rtp.bind(('127.0.0.1', 0))
+    rtpPort = rtp.getsockname()[1]
+    done = failed = 0
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        try:
+            with connect(port) as sock:
+                reply = rtsp(sock, f"SETUP {path} RTSP/1.0\nCSeq: 1\nTransport: RTP/UDP; client_port= {rtpPort}\n\n")
+                session = next((l.split(':', 1)[1].split(';')[0].strip() for l in reply.splitlines()
+                                if l.lower().startswith('session:')), '0')
+                ok = reply.startswith('RTSP/1.0 200')
+                ok = rtsp(sock, f"PLAY {path} RTSP/1.0\nCSeq: 2\nSession: {session}\n\n").startswith('RTSP/1.0 200') and ok
+                ok = rtsp(sock, f"TEARDOWN {path} RTSP/1.0\nCSeq: 3\nSession: {session}\n\n").startswith('RTSP/1.0 200') and ok
+        except (OSError, RuntimeError):
+            ok = False
+        done += ok
+        failed += not ok
+    rtp.close()
+    return done, failed
+
+
+def throughput_loop(port, path, sessions, frameRate, seconds, warmup):
+    """One client process: `sessions` viewers; bytes/packets received while measuring."""
+    selector = selectors.DefaultSelector()
+    controls = []
+    for _ in range(sessions):
+        rtp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        rtp.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        rtp.bind(('127.0.0.1', 0))
+        rtp.setblocking(False)
+        sock = connect(port)
+        rtsp(sock, f"SETUP {path} RTSP/1.0\nCSeq: 1\nTransport: RTP/UDP; client_port= {rtp.getsockname()[1]}\n"
+                   f"X-Frame-Rate: {frameRate}\n\n")
+        controls.append((sock, rtp))
+        selector.register(rtp, selectors.EVENT_READ, [None])
+    for sock, _ in controls:
+        rtsp(sock, f"PLAY {path} RTSP/1.0\nCSeq: 2\nSession: 0\n\n")
+
+    packets = bytesIn = lost = 0
+    measureFrom = time.perf_counter() + warmup
+    end = measureFrom + seconds
+    while True:
+        now = time.perf_counter()
+        if now >= end:
+            break
+        measuring = now >= measureFrom
+        for key, _ in selector.select(timeout=min(0.1, end - now)):
+            lastSeq = key.data
+            while True:
+                try:
+                    packet = key.fileobj.recv(65536)
+                except BlockingIOError:
+                    break
+                seq = parseHeader(packet)[2]
+                if measuring:
+                    packets += 1
+                    bytesIn += len(packet)
+                    gap = (seq - lastSeq[0]) & 0xFFFF if lastSeq[0] is not None else 1
+                    if 0 < gap < 0x8000:
+                        lost += gap - 1
+                lastSeq[0] = seq
+    for sock, rtp in controls:
+        sock.close()
+        rtp.close()
+    return packets, bytesIn, lost
+
+
+def run_workers(workers, args, path, serverArgs):
+    result = {'workers': workers}
+    server, port = start_server(workers, serverArgs)
+    try:
+        with multiprocessing.Pool(args.clients) as pool:
+            cpu0, t0 = tree_cpu(server.pid), time.perf_counter()
+            counts = pool.starmap(session_loop, [(port, path, args.seconds)] * args.clients)
+            elapsed = time.perf_counter() - t0
+            done = sum(c[0] for c in counts)
+            result['sessions_per_s'] = round(done / elapsed, 1)
+            result['sessions_failed'] = sum(c[1] for c in counts)
+
+            share = [args.sessions // args.clients + (i < args.sessions % args.clients) for i in range(args.clients)]
+            jobs = [(port, path, n, args.frame_rate, args.seconds, args.warmup) for n in share if n]
+            cpu1 = tree_cpu(server.pid)
+            t1 = time.perf_counter()
+            counts = pool.starmap(throughput_loop, jobs)
+            cpu2 = tree_cpu(server.pid)
+            throughputElapsed = time.perf_counter() - t1
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+
+    packets = sum(c[0] for c in counts)
+    lost = sum(c[2] for c in counts)
+    result['mbit_per_s'] = round(sum(c[1] for c in counts) * 8 / args.seconds / 1e6, 2)
+    result['packets_per_s'] = round(packets / args.seconds, 1)
+    result['packet_loss_percent'] = round(lost / (packets + lost) * 100, 3) if packets + lost else None
+    if None not in (cpu0, cpu1, cpu2):
+        # CPU của cả nhóm process trong hai pha, tính bằng số core dùng trung bình
+        result['server_cores_sessions'] = round((cpu1 - cpu0) / elapsed, 2)
+        result['server_cores_throughput'] = round((cpu2 - cpu1) / throughputElapsed, 2)
+    return result
+
+
+def main():
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', nargs='+', type=int,
+                        default=sorted({1, 2, max(1, cpus // 2)}), help='worker counts to compare')
+    parser.add_argument('--clients', type=int, default=max(1, cpus // 2), help='client processes')
+    parser.add_argument('--sessions', type=int, default=32, help='concurrent sessions in the throughput phase')
+    parser.add_argument('--frame-rate', type=float, default=100.0, help='frames/s requested by every session')
+    parser.add_argument('--resolution', choices=sorted(RESOLUTIONS), default='480p')
+    parser.add_argument('--seconds', type=float, default=5.0, help='measured time of each phase')
+    parser.add_argument('--warmup', type=float, default=1.0)
+    parser.add_argument('--async', dest='useAsync', action='store_true', help='run the workers with --async')
+    parser.add_argument('--server-args', default='', help='extra Server.py options, quoted')
+    parser.add_argument('--out', help='write the JSON here instead of stdout')
+    args = parser.parse_args()
+
+    serverArgs = shlex.split(args.server_args) + (['--async'] if args.useAsync else [])
+    path = make_video('basic', args.resolution, int((args.seconds + args.warmup + 2) * args.frame_rate))
+    if path is None:
+        parser.error(f"{args.resolution} frames do not fit the basic format")
+
+    results = {
+        'version': code_version(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'cpus': cpus,
+        'clients': args.clients,
+        'sessions': args.sessions,
+        'frame_rate': args.frame_rate,
+        'resolution': args.resolution,
+        'server_args': serverArgs,
+        'runs': [],
+    }
+    base = None
+    for workers in args.workers:
+        run = run_workers(workers, args, path, serverArgs)
+        if workers + args.clients > cpus:
+            run['oversubscribed'] = True
+        if base is None:
+            base = run
+        for key in ('sessions_per_s', 'mbit_per_s'):
+            if base[key]:
+                speedup = run[key] / base[key]
+                run[key.replace('_per_s', '_speedup')] = round(speedup, 2)
+                run[key.replace('_per_s', '_efficiency')] = round(speedup / workers * base['workers'], 2)
+        results['runs'].append(run)
+        print(f"workers {workers:<3}: {run['sessions_per_s']:8.1f} sessions/s  {run['mbit_per_s']:9.2f} Mbit/s  "
+              f"loss {run['packet_loss_percent']}%  speedup {run.get('sessions_speedup')}/{run.get('mbit_speedup')}"
+              + ("  (oversubscribed)" if run.get('oversubscribed') else ''), file=sys.stderr)
+
+    text = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
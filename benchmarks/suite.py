@@ -0,0 +1,359 @@
+"""Loopback benchmark suite: server throughput, client reassembly and end-to-end latency.
+
+Usage:
+    python3 benchmarks/suite.py [--formats basic hd] [--resolutions 480p 720p]
+                                [--sessions 1 8] [--seconds 5] [--warmup 1]
+                                [--async] [--server-args "--cache-mb 0"] [--out results.json]
+
+For every format x resolution x session count the suite generates a
+synthetic MJPEG file (cached in the temp directory), starts Server.py on a
+free local port and plays N concurrent sessions from one receive thread,
+reassembling frames with the client's FrameAssembler.  Measured after the
+warm-up period:
+
+- frames/s, packets/s and Mbit/s received (all sessions together)
+- server CPU per session (utime + stime of the server process, Linux only)
+- send jitter: deviation of marker-packet inter-arrival times from the
+  nominal frame interval
+- latency: frame reassembled minus the frame's due time (PLAY sent plus its
+  RTP timestamp offset); glass-to-glass adds the JPEG decode of session 0
+- packets lost and frames dropped
+
+An offline run of FrameAssembler over pre-built packets gives the raw
+reassembly throughput, in order and with local reordering.  Results are
+written as one JSON document (stdout or --out) so runs of different versions
+can be compared; a short summary goes to stderr.
+"""
+
+import argparse, io, json, os, platform, random, selectors, shlex, socket, subprocess, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_pacing import free_port, rtsp, percentile
+from RtpPacket import RtpPacketizer, HEADER_SIZE, parseHeader
+from FrameAssembler import FrameAssembler
+
+try:
+    from PIL import Image, ImageFilter
+except ImportError:     # không có Pillow: frame là byte ngẫu nhiên, không đo decode
+    Image = None
+
+RESOLUTIONS = {
+    '240p': (426, 240),
+    '480p': (854, 480),
+    '720p': (1280, 720),
+    '1080p': (1920, 1080),
+}
+BASIC_MAX_FRAME = 99999     # độ dài frame ghi bằng 5 chữ số ASCII
+UNIQUE_FRAMES = 16
+FRAME_RATE = 25.0
+
+
+def synthetic_frames(width, height):
+    """UNIQUE_FRAMES JPEG-like frames of roughly real-world size for the resolution."""
+    if Image is None:
+        no_ff = bytes.maketrans(b'\xff', b'\xfe')
+        size = width * height // 16
+        return [b'\xff\xd8' + os.urandom(size).translate(no_ff) + b'\xff\xd9'
+                for _ in range(UNIQUE_FRAMES)]
+    gradient = Image.linear_gradient('L').resize((width, height))
+    frames = []
+    for i in range(UNIQUE_FRAMES):
+        noise = Image.effect_noise((width, height), 10).filter(ImageFilter.BoxBlur(1))
+        image = Image.merge('RGB', (gradient, noise, gradient.rotate(i * 360 / UNIQUE_FRAMES)))
+        out = io.BytesIO()
+        image.save(out, 'JPEG', quality=75)
+        frames.append(out.getvalue())
+    return frames
+
+
+def make_video(fmt, resolution, count):
+    """Write (once) a synthetic video in `fmt` ('basic' or 'hd'); None if it cannot hold the frames."""
+    width, height = RESOLUTIONS[resolution]
+    path = os.path.join(tempfile.gettempdir(), f"bench-suite-{resolution}-{count}.{fmt}.mjpeg")
+    if os.path.exists(path):
+        return path
+    frames = synthetic_frames(width, height)
+    if fmt == 'basic' and max(len(f) for f in frames) > BASIC_MAX_FRAME:
+        return None
+    with open(path + '.tmp', 'wb') as f:
+        for n in range(count):
+            frame = frames[n % len(frames)]
+            if fmt == 'basic':
+                f.write(b'%05d' % len(frame))
+            f.write(frame)
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def cpu_seconds(pid):
+    """utime + stime of a process in seconds (None where /proc is unavailable)."""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def summarize(values, scale=1000.0):
+    if not values:
+        return None
+    return {'p50': round(percentile(values, 50) * scale, 3),
+            'p90': round(percentile(values, 90) * scale, 3),
+            'p99': round(percentile(values, 99) * scale, 3),
+            'max': round(max(values) * scale, 3)}
+
+
+def connect(port, attempts=50):
+    """RTSP connection to a server that may still be starting."""
+    for _ in range(attempts):
+        try:
+            return socket.create_connection(('127.0.0.1', port))
+        except ConnectionRefusedError:
+            time.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+class Session:
+    """One simulated viewer: RTSP control socket, RTP socket and a FrameAssembler."""
+
+    def __init__(self, port, path, index):
+        self.path = path
+        self.index = index
+        self.rtspSocket = connect(port)
+        self.rtpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.rtpSocket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        self.rtpSocket.bind(('127.0.0.1', 0))
+        self.rtpSocket.setblocking(False)
+        self.assembler = FrameAssembler()
+        self.playSent = None
+        self.firstTimestamp = None
+        self.lastMarker = None
+        self.packets = 0
+        self.bytes = 0
+        self.frames = 0
+        self.intervals = []
+        self.latencies = []
+        self.decodeLatencies = []
+        self.setupReply = ''
+
+    def setup(self):
+        rtpPort = self.rtpSocket.getsockname()[1]
+        self.setupReply = rtsp(self.rtspSocket, f"SETUP {self.path} RTSP/1.0\nCSeq: 1\n"
+                                                f"Transport: RTP/UDP; client_port= {rtpPort}\n"
+                                                f"X-Frame-Rate: {FRAME_RATE}\n\n")
+        return self.setupReply.startswith('RTSP/1.0 200')
+
+    def play(self):
+        self.playSent = time.perf_counter()
+        rtsp(self.rtspSocket, f"PLAY {self.path} RTSP/1.0\nCSeq: 2\nSession: 0\n\n")
+
+    def teardown(self):
+        try:
+            rtsp(self.rtspSocket, f"TEARDOWN {self.path} RTSP/1.0\nCSeq: 3\nSession: 0\n\n")
+        except OSError:
+            pass
+        self.rtspSocket.close()
+        self.rtpSocket.close()
+
+    def receive(self, measuring, decode):
+        """Read every queued datagram; stats only count while `measuring`."""
+        while True:
+            try:
+                packet = self.rtpSocket.recv(65536)
+            except BlockingIOError:
+                return
+            now = time.perf_counter()
+            marker, pt, seq, timestamp, _ = parseHeader(packet)
+            if self.firstTimestamp is None:
+                self.firstTimestamp = timestamp
+            if measuring:
+                self.packets += 1
+                self.bytes += len(packet)
+                if marker:
+                    if self.lastMarker is not None:
+                        self.intervals.append(abs(now - self.lastMarker - 1.0 / FRAME_RATE))
+                    self.lastMarker = now
+            frames = self.assembler.push(seq, timestamp, marker, memoryview(packet)[HEADER_SIZE:], now)
+            for frameTs, data in frames:
+                if not measuring:
+                    continue
+                self.frames += 1
+                due = self.playSent + ((frameTs - self.firstTimestamp) & 0xFFFFFFFF) / 90000
+                done = time.perf_counter()
+                self.latencies.append(done - due)
+                if decode:
+                    Image.open(io.BytesIO(data)).convert('RGB').load()
+                    self.decodeLatencies.append(time.perf_counter() - due)
+
+
+def run_case(path, sessions, seconds, warmup, serverArgs):
+    port = free_port()
+    command = [sys.executable, os.path.join(ROOT, 'Server.py'), str(port)] + serverArgs
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    viewers = []
+    try:
+        selector = selectors.DefaultSelector()
+        for i in range(sessions):
+            viewer = Session(port, path, i)
+            viewers.append(viewer)
+            if not viewer.setup():
+                raise RuntimeError(f"SETUP failed: {viewer.setupReply.splitlines()[:1]}")
+            selector.register(viewer.rtpSocket, selectors.EVENT_READ, viewer)
+        for viewer in viewers:
+            viewer.play()
+
+        start = time.perf_counter()
+        measureFrom = start + warmup
+        end = measureFrom + seconds
+        cpuStart = None
+        while True:
+            now = time.perf_counter()
+            if now >= end:
+                break
+            measuring = now >= measureFrom
+            if measuring and cpuStart is None:
+                cpuStart = (cpu_seconds(server.pid), now)
+            for key, _ in selector.select(timeout=min(0.1, end - now)):
+                viewer = key.data
+                viewer.receive(measuring, decode=Image is not None and viewer.index == 0)
+        cpuEnd = cpu_seconds(server.pid)
+        elapsed = time.perf_counter() - cpuStart[1]
+    finally:
+        for viewer in viewers:
+            viewer.teardown()
+        server.kill()
+        server.wait()
+
+    packets = sum(v.packets for v in viewers)
+    frames = sum(v.frames for v in viewers)
+    cpu = None
+    if cpuStart[0] is not None and cpuEnd is not None:
+        cpu = round((cpuEnd - cpuStart[0]) / elapsed / sessions * 100, 2)
+    return {
+        'frames_per_s': round(frames / elapsed, 2),
+        'frames_per_s_per_session': round(frames / elapsed / sessions, 2),
+        'packets_per_s': round(packets / elapsed, 1),
+        'mbit_per_s': round(sum(v.bytes for v in viewers) * 8 / elapsed / 1e6, 3),
+        'server_cpu_percent_per_session': cpu,
+        'send_jitter_ms': summarize([i for v in viewers for i in v.intervals]),
+        'latency_ms': summarize([l for v in viewers for l in v.latencies]),
+        'glass_to_glass_ms': summarize(viewers[0].decodeLatencies),
+        'packets_lost': sum(max(0, v.assembler.lost()) for v in viewers),
+        'frames_dropped': sum(v.assembler.framesDropped for v in viewers),
+    }
+
+
+def reassembly_throughput(resolution, frames=400, reorder=0):
+    """Packets/s and MB/s of FrameAssembler alone over pre-built packets."""
+    width, height = RESOLUTIONS[resolution]
+    bodies = synthetic_frames(width, height)
+    packetizer = RtpPacketizer(maxPayload=1300)
+    packets, seq = [], 0
+    for n in range(frames):
+        views, seq = packetizer.packetize(bodies[n % len(bodies)], seq, n * 3600)
+        packets.extend(bytes(v) for v in views)
+    if reorder:
+        # Đảo thứ tự trong từng cửa sổ `reorder` packet (vẫn trong cửa sổ reorder của client)
+        rng = random.Random(1)
+        for i in range(0, len(packets), reorder):
+            window = packets[i:i + reorder]
+            rng.shuffle(window)
+            packets[i:i + reorder] = window
+    parsed = [(parseHeader(p), memoryview(p)[HEADER_SIZE:]) for p in packets]
+
+    assembler = FrameAssembler()
+    payloadBytes = 0
+    done = 0
+    t0 = time.perf_counter()
+    for (marker, _, seq, timestamp, _), payload in parsed:
+        payloadBytes += len(payload)
+        done += len(assembler.push(seq, timestamp, marker, payload, t0))
+    elapsed = time.perf_counter() - t0
+    return {
+        'resolution': resolution,
+        'reorder_window': reorder,
+        'frames_completed': done,
+        'frames_per_s': round(done / elapsed, 1),
+        'packets_per_s': round(len(parsed) / elapsed, 1),
+        'mbyte_per_s': round(payloadBytes / elapsed / 1e6, 2),
+    }
+
+
+def code_version():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--formats', nargs='+', choices=('basic', 'hd'), default=['basic', 'hd'])
+    parser.add_argument('--resolutions', nargs='+', choices=sorted(RESOLUTIONS), default=['480p', '720p'])
+    parser.add_argument('--sessions', nargs='+', type=int, default=[1, 8])
+    parser.add_argument('--seconds', type=float, default=5.0, help='measured time per case')
+    parser.add_argument('--warmup', type=float, default=1.0, help='seconds ignored at the start of each case')
+    parser.add_argument('--async', dest='useAsync', action='store_true', help='run the server with --async')
+    parser.add_argument('--server-args', default='', help='extra Server.py options, quoted')
+    parser.add_argument('--out', help='write the JSON here instead of stdout')
+    args = parser.parse_args()
+
+    serverArgs = shlex.split(args.server_args) + (['--async'] if args.useAsync else [])
+    frameCount = int((args.seconds + args.warmup + 2) * FRAME_RATE)
+
+    results = {
+        'version': code_version(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'pillow': Image is not None,
+        'server_args': serverArgs,
+        'seconds': args.seconds,
+        'frame_rate': FRAME_RATE,
+        'reassembly': [],
+        'runs': [],
+    }
+
+    for resolution in args.resolutions:
+        for reorder in (0, 8):
+            entry = reassembly_throughput(resolution, reorder=reorder)
+            results['reassembly'].append(entry)
+            print(f"reassembly {resolution} reorder={reorder}: {entry['mbyte_per_s']} MB/s, "
+                  f"{entry['packets_per_s']:.0f} packets/s", file=sys.stderr)
+
+    for fmt in args.formats:
+        for resolution in args.resolutions:
+            path = make_video(fmt, resolution, frameCount)
+            for sessions in args.sessions:
+                case = {'format': fmt, 'resolution': resolution, 'sessions': sessions}
+                if path is None:
+                    case['skipped'] = f"frames larger than {BASIC_MAX_FRAME} bytes do not fit the basic format"
+                else:
+                    try:
+                        case.update(run_case(path, sessions, args.seconds, args.warmup, serverArgs))
+                    except (OSError, RuntimeError) as e:
+                        case['error'] = str(e)
+                results['runs'].append(case)
+                if 'frames_per_s' in case:
+                    latency = case['latency_ms'] or {}
+                    print(f"{fmt:5} {resolution:5} x{sessions:<3}: {case['frames_per_s']:8.1f} fps "
+                          f"{case['packets_per_s']:9.0f} pps  cpu/session {case['server_cpu_percent_per_session']}%  "
+                          f"latency p50/p99 {latency.get('p50')}/{latency.get('p99')} ms", file=sys.stderr)
+                else:
+                    print(f"{fmt:5} {resolution:5} x{sessions:<3}: {case.get('skipped') or case.get('error')}",
+                          file=sys.stderr)
+
+    text = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()